@@ -5,12 +5,26 @@ Met: Ollama (mistral:7b), LLM-antwoordcheck, vloeiendere gespreksflow, meerdere
 """
 
 import json
+import os
 import random
-from typing import Dict, List, Optional, Tuple
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache, partial
+
+import requests
+
+from exercise_bank import BankItem, get_exercise_bank
+from feedback_templates import get_feedback_templates
+from llm_cache import get_cache
+from llm_scheduler import Bezet, get_scheduler, klasse_voor
+from progress_store import ProgressStore, get_progress_store
+from ollama_client import get_client
+from rule_grader import CORRECT, INCORRECT, RuleGrader
 
 
 # ============================================================================
@@ -31,6 +45,24 @@ class OefeningType(Enum):
     LEZEN_HOUDING = "lezen_houding"
 
 
+SCHRIJF_TYPES = (OefeningType.SCHRIJVEN_EMAIL, OefeningType.SCHRIJVEN_ARTIKEL, OefeningType.SCHRIJVEN_REVIEW)
+
+# Onderwerp van een lees-/schrijfitem in de oefeningenbank -> oefeningtype
+LEES_TYPES = {
+    "hoofdgedachte": OefeningType.LEZEN_HOOFDGEDACHTE,
+    "detail": OefeningType.LEZEN_DETAIL,
+    "woordbetekenis": OefeningType.LEZEN_WOORDBETEKENIS,
+    "tekstverband": OefeningType.LEZEN_TEKSTVERBAND,
+    "houding": OefeningType.LEZEN_HOUDING,
+}
+SCHRIJF_TYPES_PER_SOORT = {
+    "email_informeel": OefeningType.SCHRIJVEN_EMAIL,
+    "email_formeel": OefeningType.SCHRIJVEN_EMAIL,
+    "artikel": OefeningType.SCHRIJVEN_ARTIKEL,
+    "review": OefeningType.SCHRIJVEN_REVIEW,
+}
+
+
 class Moeilijkheidsgraad(Enum):
     MAKKELIJK = 1
     GEMIDDELD = 2
@@ -52,6 +84,8 @@ class Oefening:
     opties: Optional[List[str]] = None
     uitleg: Optional[str] = None
     id: str = field(default_factory=lambda: f"ex_{uuid.uuid4().hex[:8]}")
+    # Content-id van het item in de oefeningenbank (zelfde template = zelfde bron_id)
+    bron_id: Optional[str] = None
 
 
 
@@ -75,18 +109,28 @@ class TutorPersoonlijkheid:
         self.regels = regels
 
     def genereer_systeem_prompt(self, context_lengte: int = 3) -> str:
-        """Genereert gestackte systeem prompt"""
-        return f"""[ROL]
-{self.rol}
+        """
+        Genereert gestackte systeem prompt, één keer per (tutor, context_lengte).
+        Elke prompt van AITutorSysteem begint hiermee; alleen de laatste regel hangt af van
+        `context_lengte`, zodat alle prompts van een tutor een zo lang mogelijke gelijke prefix
+        hebben en Ollama die uit de KV-cache kan halen (zie ollama_client.py).
+        """
+        return _systeem_prompt(self.rol, self.gedrag, self.regels, context_lengte)
+
+
+@lru_cache(maxsize=64)
+def _systeem_prompt(rol: str, gedrag: str, regels: str, context_lengte: int) -> str:
+    return f"""[ROL]
+{rol}
 
 [GEDRAG]
-{self.gedrag}
+{gedrag}
 
 [REGELS]
-{self.regels}
-- Onthoud de laatste {context_lengte} interacties voor context.
+{regels}
 - Antwoord altijd in het Nederlands, behalve bij Engelse voorbeelden.
 - Geef geen interne overwegingen weer.
+- Onthoud de laatste {context_lengte} interacties voor context.
 """
 
 
@@ -137,90 +181,150 @@ Bij fouten benoem je direct wat er mis is en leg je uit hoe het beter kan.""",
 # LLM INTERFACE (Ollama - mistral7:b)
 # ============================================================================
 
+# Welk generate-endpoint werkt, per base_url (gedeeld door alle LLMInterface-instanties)
+# en het aantal fouten op dat endpoint sinds de laatste geslaagde call.
+OLLAMA_ENDPOINTS = ["/api/generate", "/generate"]
+ENDPOINT_ERROR_THRESHOLD = int(os.getenv("OLLAMA_ENDPOINT_ERROR_THRESHOLD", "3"))
+_endpoint_cache: Dict[str, str] = {}
+_endpoint_errors: Dict[str, int] = {}
+_endpoint_lock = threading.Lock()  # FastAPI-workerthreads lezen en schrijven beide tegelijk
+
+
 class LLMInterface:
     """
     Interface naar Ollama (lokale LLM).
     Verwacht dat Ollama draait en model 'mistral7:b' beschikbaar is.
     """
 
-    def __init__(self, model: str = "mistral:7b", base_url: str = "http://localhost:11434"):
+    def __init__(self, model: str = "mistral:7b", base_url: Optional[str] = None,
+                 error_threshold: int = ENDPOINT_ERROR_THRESHOLD, sessie_id: Optional[str] = None):
         self.model = model
-        self.base_url = base_url
+        self.error_threshold = error_threshold
+        # Gedeelde client: connection pool + keep-alive i.p.v. een nieuwe verbinding per call.
+        # Zonder base_url: OLLAMA_BASE_URL, of de router over OLLAMA_BACKENDS (zie llm_router.py)
+        self.client = get_client(base_url)
+        self.base_url = self.client.base_url
+        # Sticky routing: alle calls van deze sessie naar dezelfde backend (KV-cache hergebruik)
+        self.sessie_id = sessie_id
+        self.cache = get_cache()
+
+    def _genereer_via(self, endpoint: str, prompt: str, temperature: float) -> str:
+        return "".join(self.client.generate_stream(
+            prompt,
+            model=self.model,
+            endpoint=endpoint,
+            options={"temperature": temperature},
+            session_id=self.sessie_id,
+        )).strip()
 
-    def genereer_response(self, prompt: str, temperature: float = 0.3) -> str:
+    @staticmethod
+    def _beschrijf_fout(e: Exception, endpoint: str) -> str:
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            return f"HTTP {e.response.status_code} op {endpoint}"
+        return str(e)
+
+    def _ontdek_endpoint(
+        self, prompt: str, temperature: float, overslaan: Optional[str] = None
+    ) -> Tuple[Optional[str], str, Optional[str]]:
+        """
+        Probeert de endpoints op volgorde en onthoudt het eerste dat antwoordt.
+        Met `overslaan` (een net mislukt endpoint) wordt dat endpoint niet opnieuw geprobeerd
+        en blijft een nog geldige cache-entry staan.
+        Geeft (endpoint, tekst, laatste_fout) terug.
+        """
+        last_error = None
+        for endpoint in OLLAMA_ENDPOINTS:
+            if endpoint == overslaan:
+                continue
+            try:
+                tekst = self._genereer_via(endpoint, prompt, temperature)
+            except Exception as e:
+                # Als deze endpoint niet bestaat (404) of faalt, probeer de volgende
+                last_error = self._beschrijf_fout(e, endpoint)
+                continue
+            with _endpoint_lock:
+                if overslaan is None or self.base_url not in _endpoint_cache:
+                    _endpoint_cache[self.base_url] = endpoint
+                    _endpoint_errors[self.base_url] = 0
+            return endpoint, tekst, None
+        return None, "", last_error
+
+    def genereer_response(self, prompt: str, temperature: float = 0.3, site: str = "algemeen") -> str:
         """
         Genereert response via Ollama.
-        Probeert eerst /api/generate, valt terug op /generate.
+        Het werkende endpoint (/api/generate of /generate) wordt één keer per base_url ontdekt
+        en daarna direct gebruikt; faalt het, dan probeert dezelfde call de andere endpoints.
+        Pas na `error_threshold` fouten op rij wordt het onthouden endpoint vergeten.
         Gebruikt streaming en plakt alle 'response'-chunks aan elkaar.
+        Geslaagde antwoorden gaan in de LLM-cache (per `site` een eigen TTL en hit rate);
+        dezelfde prompt die al loopt (bv. een hele klas die tegelijk begint) wordt gedeeld.
         """
+        cached = self.cache.get(site, self.model, temperature, prompt)
+        if cached is not None:
+            return cached
+        return self.cache.coalesce(site, self.model, temperature, prompt,
+                                   partial(self._genereer, prompt, temperature, site))
+
+    def _genereer(self, prompt: str, temperature: float, site: str) -> str:
+        # Pas na de cache een plek bij het model: chat gaat voor nakijken, nakijken voor prefetch
         try:
-            import requests
-            import json
-
-            endpoints = ["/api/generate", "/generate"]
-            last_error = None
-
-            for endpoint in endpoints:
-                try:
-                    response = requests.post(
-                        f"{self.base_url}{endpoint}",
-                        json={
-                            "model": self.model,
-                            "prompt": prompt,
-                            "temperature": temperature,
-                            # laat stream-gedrag aan Ollama zelf; wij lezen als stream
-                        },
-                        stream=True,
-                        timeout=120,
-                    )
-
-                    # Als deze endpoint niet bestaat, probeer de volgende
-                    if response.status_code == 404:
-                        last_error = f"HTTP 404 op {endpoint}"
-                        continue
-
-                    if response.status_code != 200:
-                        last_error = f"HTTP {response.status_code} op {endpoint}"
-                        continue
-
-                    chunks = []
-
-                    for line in response.iter_lines():
-                        if not line:
-                            continue
-                        try:
-                            data = json.loads(line.decode("utf-8"))
-                        except json.JSONDecodeError:
-                            # Soms komt er rommel of lege regels tussendoor, negeren
-                            continue
-
-                        piece = data.get("response", "")
-                        if piece:
-                            chunks.append(piece)
-
-                        if data.get("done"):
-                            break
-
-                    tekst = "".join(chunks).strip()
-                    if tekst:
-                        return tekst
-                    else:
-                        last_error = f"Lege response op {endpoint}"
-                        continue
-
-                except Exception as e:
-                    last_error = str(e)
-                    continue
-
-            # Als beide endpoints falen of niks opleveren:
-            if last_error:
+            with get_scheduler().slot(klasse_voor(site), leerling=self.sessie_id):
+                return self._genereer_bij_model(prompt, temperature, site)
+        except Bezet as e:
+            return f"[LLM Response Placeholder - Te druk] {e}"
+
+    def _genereer_bij_model(self, prompt: str, temperature: float, site: str) -> str:
+        with _endpoint_lock:
+            endpoint = _endpoint_cache.get(self.base_url)
+
+        if endpoint is not None:
+            try:
+                tekst = self._genereer_via(endpoint, prompt, temperature)
+            except Exception as e:
+                with _endpoint_lock:
+                    fouten = _endpoint_errors.get(self.base_url, 0) + 1
+                    _endpoint_errors[self.base_url] = fouten
+                    if fouten >= self.error_threshold and _endpoint_cache.get(self.base_url) == endpoint:
+                        # Endpoint lijkt niet meer te werken: vergeten, volgende call zoekt opnieuw
+                        _endpoint_cache.pop(self.base_url, None)
+                # Deze call probeert meteen de andere endpoints
+                mislukt, fout = endpoint, self._beschrijf_fout(e, endpoint)
+                endpoint, tekst, _ = self._ontdek_endpoint(prompt, temperature, overslaan=mislukt)
+                if endpoint is None:
+                    return f"[LLM Response Placeholder - Mislukte Ollama-call] {fout}"
+            else:
+                with _endpoint_lock:
+                    _endpoint_errors[self.base_url] = 0
+        else:
+            endpoint, tekst, last_error = self._ontdek_endpoint(prompt, temperature)
+            if endpoint is None:
+                # Als beide endpoints falen:
                 return f"[LLM Response Placeholder - Mislukte Ollama-call] {last_error}"
-            return "[LLM gaf geen inhoudelijke response terug]"
-
-        except Exception as e:
-            return f"[LLM Response Placeholder - Mislukte Ollama-call]\nError: {str(e)}"
 
+        if tekst:
+            self.cache.put(site, self.model, temperature, prompt, tekst)
+            return tekst
+        return "[LLM gaf geen inhoudelijke response terug]"
 
+    def health_check(self) -> Dict[str, object]:
+        """
+        Controleert welk endpoint en model live zijn (met een lege prompt, dus zonder generatie)
+        en werkt de endpoint-cache bij.
+        """
+        endpoint, _, last_error = self._ontdek_endpoint("", 0.0)
+        model_beschikbaar = None
+        try:
+            model_beschikbaar = self.model in self.client.models()
+        except Exception as e:
+            last_error = last_error or str(e)
+        return {
+            "ok": endpoint is not None,
+            "base_url": self.base_url,
+            "endpoint": endpoint,
+            "model": self.model,
+            "model_available": model_beschikbaar,
+            "error": last_error,
+        }
 
     def check_antwoord(self, oefening: Oefening, student_antwoord: str) -> Tuple[bool, str]:
         """
@@ -254,7 +358,7 @@ Antwoord leerling: {student_antwoord}
 
 Jouw oordeel:
 """
-        resultaat = self.genereer_response(prompt, temperature=0.0).strip().upper()
+        resultaat = self.genereer_response(prompt, temperature=0.0, site="nakijken").strip().upper()
 
         if "CORRECT" in resultaat and "BIJNA" not in resultaat and "INCORRECT" not in resultaat:
             return True, "CORRECT"
@@ -285,273 +389,64 @@ class OefeningenGenerator:
             "modals": {"naam": "Modal Verbs", "moeilijkheid": Moeilijkheidsgraad.GEMIDDELD},
             "future_forms": {"naam": "Future Forms", "moeilijkheid": Moeilijkheidsgraad.GEMIDDELD},
         }
+        self.bank = get_exercise_bank()
 
-    def genereer_grammatica_gapfill(self, onderwerp: str) -> Oefening:
-        """Genereert één gap-fill oefening"""
-        templates = {
-            "present_simple": [
-                ("She ___ (work) at a hospital every day.", "works",
-                 "Present Simple: bij he/she/it voeg je -s toe."),
-                ("They ___ (not/like) vegetables.", "don't like",
-                 "Present Simple ontkenning: don't + infinitive."),
-                ("___ you ___ (speak) English?", "Do / speak",
-                 "Present Simple vraag: Do/Does + subject + infinitive."),
-            ],
-            "present_perfect": [
-                ("I ___ (live) here for five years.", "have lived",
-                 "Present Perfect: have/has + past participle voor duratie."),
-                ("She ___ (already/finish) her homework.", "has already finished",
-                 "Present Perfect: has + past participle."),
-                ("They ___ (not/see) that movie yet.", "haven't seen",
-                 "Present Perfect ontkenning: haven't/hasn't + past participle."),
-            ],
-            "conditionals": [
-                ("If it ___ (rain) tomorrow, we will stay home.", "rains",
-                 "First Conditional: if + present simple, will + infinitive."),
-                ("If I ___ (be) rich, I would travel the world.", "were",
-                 "Second Conditional: if + past simple, would + infinitive."),
-                ("If she ___ (study) harder, she would have passed.", "had studied",
-                 "Third Conditional: if + past perfect, would have + past participle."),
-            ],
-            "passive_voice": [
-                ("The book ___ (write) by Shakespeare.", "was written",
-                 "Passive past: was/were + past participle."),
-                ("English ___ (speak) all over the world.", "is spoken",
-                 "Passive present: am/is/are + past participle."),
-                ("The house ___ (build) next year.", "will be built",
-                 "Passive future: will be + past participle."),
-            ],
-        }
-
-        if onderwerp not in templates:
-            onderwerp = random.choice(list(templates.keys()))
-
-        template_data = random.choice(templates[onderwerp])
-        info = self.grammatica_onderwerpen.get(onderwerp, {
-            "naam": onderwerp,
-            "moeilijkheid": Moeilijkheidsgraad.GEMIDDELD
+    def _info(self, item: BankItem) -> Dict:
+        return self.grammatica_onderwerpen.get(item.onderwerp, {
+            "naam": item.onderwerp,
+            "moeilijkheid": Moeilijkheidsgraad(item.moeilijkheid)
         })
 
+    @staticmethod
+    def _oefening(item: BankItem, type: OefeningType, moeilijkheid: Moeilijkheidsgraad, onderwerp: str,
+                  instructie: str, uitleg: Optional[str] = None) -> Oefening:
         return Oefening(
-            type=OefeningType.GRAMMATICA_GAPFILL,
-            moeilijkheid=info["moeilijkheid"],
-            onderwerp=info["naam"],
-            instructie=f"Vul de juiste vorm van het werkwoord in tussen haakjes. Onderwerp: {info['naam']}.",
-            content=template_data[0],
-            juist_antwoord=template_data[1],
-            uitleg=template_data[2]
+            type=type,
+            moeilijkheid=moeilijkheid,
+            onderwerp=onderwerp,
+            instructie=instructie,
+            content=item.content,
+            juist_antwoord=item.juist_antwoord,
+            opties=list(item.opties) if item.opties else None,
+            uitleg=uitleg or item.uitleg,
+            bron_id=item.id
+        )
+
+    def genereer_grammatica_gapfill(self, onderwerp: str) -> Oefening:
+        """Genereert één gap-fill oefening"""
+        item = self.bank.kies("gapfill", onderwerp)
+        info = self._info(item)
+        return self._oefening(
+            item, OefeningType.GRAMMATICA_GAPFILL, info["moeilijkheid"], info["naam"],
+            f"Vul de juiste vorm van het werkwoord in tussen haakjes. Onderwerp: {info['naam']}."
         )
 
     def genereer_grammatica_meerkeuze(self, onderwerp: str) -> Oefening:
         """Genereert één meerkeuze oefening"""
-        vragen = {
-            "modals": [
-                {
-                    "vraag": "You ___ wear a seatbelt in a car. It's the law.",
-                    "opties": ["must", "should", "can", "might"],
-                    "correct": "must",
-                    "uitleg": "Must = verplichting/wet. Should = advies."
-                },
-                {
-                    "vraag": "She ___ speak three languages fluently.",
-                    "opties": ["can", "must", "should", "would"],
-                    "correct": "can",
-                    "uitleg": "Can = kunnen/bekwaamheid."
-                },
-            ],
-            "relative_clauses": [
-                {
-                    "vraag": "The man ___ lives next door is a doctor.",
-                    "opties": ["who", "which", "where", "whose"],
-                    "correct": "who",
-                    "uitleg": "Who = personen."
-                },
-                {
-                    "vraag": "This is the house ___ I grew up.",
-                    "opties": ["where", "which", "who", "when"],
-                    "correct": "where",
-                    "uitleg": "Where = plaatsen."
-                },
-            ],
-        }
-
-        if onderwerp not in vragen:
-            onderwerp = random.choice(list(vragen.keys()))
-
-        vraag_data = random.choice(vragen[onderwerp])
-        info = self.grammatica_onderwerpen.get(onderwerp, {
-            "naam": onderwerp,
-            "moeilijkheid": Moeilijkheidsgraad.GEMIDDELD
-        })
-
-        return Oefening(
-            type=OefeningType.GRAMMATICA_MEERKEUZE,
-            moeilijkheid=info["moeilijkheid"],
-            onderwerp=info["naam"],
-            instructie=f"Kies het juiste woord. Onderwerp: {info['naam']}.",
-            content=vraag_data["vraag"],
-            juist_antwoord=vraag_data["correct"],
-            opties=vraag_data["opties"],
-            uitleg=vraag_data["uitleg"]
+        item = self.bank.kies("meerkeuze", onderwerp)
+        info = self._info(item)
+        return self._oefening(
+            item, OefeningType.GRAMMATICA_MEERKEUZE, info["moeilijkheid"], info["naam"],
+            f"Kies het juiste woord. Onderwerp: {info['naam']}."
         )
 
     def genereer_lezen_oefening(self, subtype: str) -> Oefening:
         """Genereert één leesoefening"""
-        teksten = {
-            "hoofdgedachte": {
-                "tekst": """Social media has transformed how we communicate, but not everyone agrees this is positive.
-While platforms like Instagram and TikTok allow instant connection with friends worldwide, critics argue
-they create superficial relationships. Studies show teenagers spend an average of 7 hours daily on their
-phones, raising concerns about mental health. However, supporters point out these platforms enable
-creative expression and community building that wasn't possible before.""",
-                "vraag": "Wat is de hoofdgedachte van deze tekst?",
-                "opties": [
-                    "Social media is uitsluitend negatief voor jongeren",
-                    "Social media heeft zowel positieve als negatieve aspecten",
-                    "Jongeren moeten meer tijd op social media doorbrengen",
-                    "Social media helpt alleen bij creatieve expressie"
-                ],
-                "correct": "Social media heeft zowel positieve als negatieve aspecten",
-                "uitleg": "De tekst laat zowel voordelen als nadelen zien."
-            },
-            "detail": {
-                "tekst": """The new recycling program in Amsterdam starts on January 15th. Residents must separate
-plastic, paper, and glass into different colored bins: blue for paper, green for glass, and yellow for
-plastic. The collection happens every Tuesday morning before 7 AM. Items not properly sorted will not be
-collected and residents may face a €50 fine.""",
-                "vraag": "Wat gebeurt er als bewoners hun afval niet goed scheiden?",
-                "opties": [
-                    "Ze krijgen een waarschuwing",
-                    "Hun afval wordt niet opgehaald en ze kunnen een boete krijgen",
-                    "Ze moeten zelf naar de vuilstort",
-                    "Er gebeurt niets"
-                ],
-                "correct": "Hun afval wordt niet opgehaald en ze kunnen een boete krijgen",
-                "uitleg": "Staat expliciet in de laatste zin."
-            },
-            "woordbetekenis": {
-                "tekst": """The concert was absolutely stunning. The lead singer's voice was mesmerizing,
-and the light show was spectacular. Everyone in the audience was captivated from start to finish.""",
-                "vraag": "Wat betekent 'stunning' in deze context?",
-                "opties": [
-                    "Vervelend en saai",
-                    "Indrukwekkend en prachtig",
-                    "Luid en storend",
-                    "Kort en eenvoudig"
-                ],
-                "correct": "Indrukwekkend en prachtig",
-                "uitleg": "Context is zeer positief."
-            },
-            "tekstverband": {
-                "tekst": """Many students struggle with time management. Therefore, learning to prioritize tasks
-can significantly improve academic performance. Creating a weekly schedule helps students balance
-homework, sports, and social activities.""",
-                "vraag": "Welk signaalwoord (zoals 'therefore') geeft hier een gevolg aan?",
-                "opties": ["Therefore", "However", "Although", "Besides"],
-                "correct": "Therefore",
-                "uitleg": "Geeft een logisch gevolg aan."
-            },
-            "houding": {
-                "tekst": """While some argue that homework is essential for learning, I find this view outdated.
-Research clearly shows that excessive homework causes stress without improving grades. Schools should
-focus on quality over quantity and give students time to develop other skills.""",
-                "vraag": "Wat is de houding van de schrijver ten opzichte van huiswerk?",
-                "opties": [
-                    "Neutraal en objectief",
-                    "Kritisch en tegen veel huiswerk",
-                    "Positief en ondersteunend",
-                    "Onzeker en twijfelend"
-                ],
-                "correct": "Kritisch en tegen veel huiswerk",
-                "uitleg": "Woorden als 'outdated' en 'should' tonen kritiek."
-            }
-        }
-
-        if subtype not in teksten:
-            subtype = random.choice(list(teksten.keys()))
-
-        data = teksten[subtype]
-        type_map = {
-            "hoofdgedachte": OefeningType.LEZEN_HOOFDGEDACHTE,
-            "detail": OefeningType.LEZEN_DETAIL,
-            "woordbetekenis": OefeningType.LEZEN_WOORDBETEKENIS,
-            "tekstverband": OefeningType.LEZEN_TEKSTVERBAND,
-            "houding": OefeningType.LEZEN_HOUDING,
-        }
-
-        return Oefening(
-            type=type_map[subtype],
-            moeilijkheid=Moeilijkheidsgraad.GEMIDDELD,
-            onderwerp=f"Lezen - {subtype.capitalize()}",
-            instructie="Lees de tekst en beantwoord de vraag.",
-            content=f"{data['tekst']}\n\n{data['vraag']}",
-            juist_antwoord=data["correct"],
-            opties=data["opties"],
-            uitleg=data["uitleg"]
+        item = self.bank.kies("lezen", subtype)
+        return self._oefening(
+            item, LEES_TYPES.get(item.onderwerp, OefeningType.LEZEN_DETAIL), Moeilijkheidsgraad(item.moeilijkheid),
+            f"Lezen - {item.onderwerp.capitalize()}", "Lees de tekst en beantwoord de vraag."
         )
 
     def genereer_schrijven_oefening(self, tekstsoort: str) -> Oefening:
         """Genereert één schrijfoefening"""
-        opdrachten = {
-            "email_informeel": {
-                "instructie": """Schrijf een informele e-mail (80-100 woorden) aan je Engelse vriend Tom.
-Vertel hem over je plannen voor de zomervakantie. Vermeld:
-- Waar je heen gaat
-- Met wie je gaat
-- Wat je van plan bent te doen
-- Vraag ook naar zijn plannen.""",
-                "rubric": {
-                    "structuur": "Opening en afsluiting aanwezig.",
-                    "inhoud": "Alle punten behandeld.",
-                    "taal": "Informele toon, juiste tijden.",
-                    "lengte": "80-100 woorden."
-                }
-            },
-            "email_formeel": {
-                "instructie": """Schrijf een formele e-mail (100-120 woorden) aan de manager van een hotel.
-Je verbleef er vorige week, maar er waren problemen. Vermeld:
-- Wanneer je verbleef
-- Wat de problemen waren
-- Wat je verwacht (excuses/compensatie)
-Gebruik formele taal.""",
-                "rubric": {
-                    "structuur": "Formele aanhef/afsluiting.",
-                    "inhoud": "Probleem + verwachting duidelijk.",
-                    "taal": "Formeel, beleefd.",
-                    "lengte": "100-120 woorden."
-                }
-            },
-            "artikel": {
-                "instructie": """Schrijf een artikel (120-150 woorden) voor de schoolkrant:
-"Should schools ban smartphones during lessons?"
-Geef je mening met argumenten.""",
-                "rubric": {
-                    "structuur": "Inleiding, 2-3 argumenten, conclusie.",
-                    "inhoud": "Duidelijk standpunt.",
-                    "taal": "Signaalwoorden gebruiken.",
-                    "lengte": "120-150 woorden."
-                }
-            }
-        }
-
-        if tekstsoort not in opdrachten:
-            tekstsoort = random.choice(list(opdrachten.keys()))
-
-        data = opdrachten[tekstsoort]
-        type_map = {
-            "email_informeel": OefeningType.SCHRIJVEN_EMAIL,
-            "email_formeel": OefeningType.SCHRIJVEN_EMAIL,
-            "artikel": OefeningType.SCHRIJVEN_ARTIKEL,
-        }
-
-        return Oefening(
-            type=type_map[tekstsoort],
-            moeilijkheid=Moeilijkheidsgraad.GEMIDDELD,
-            onderwerp=f"Schrijven - {tekstsoort.replace('_', ' ').title()}",
-            instructie=data["instructie"],
-            content=json.dumps(data["rubric"], ensure_ascii=False),
-            juist_antwoord="",
-            uitleg=f"Beoordeling op: {', '.join(data['rubric'].keys())}."
+        item = self.bank.kies("schrijven", tekstsoort)
+        rubric = json.loads(item.content)
+        return self._oefening(
+            item, SCHRIJF_TYPES_PER_SOORT.get(item.onderwerp, OefeningType.SCHRIJVEN_ARTIKEL),
+            Moeilijkheidsgraad(item.moeilijkheid),
+            f"Schrijven - {item.onderwerp.replace('_', ' ').title()}", item.instructie or "",
+            uitleg=f"Beoordeling op: {', '.join(rubric.keys())}."
         )
 
 
@@ -563,10 +458,31 @@ class FeedbackGenerator:
     def __init__(self, tutor: TutorPersoonlijkheid, llm: LLMInterface):
         self.tutor = tutor
         self.llm = llm
+        self.templates = get_feedback_templates()
 
-    def genereer_feedback(self, oefening: Oefening, student_antwoord: str, is_correct: bool) -> str:
-        """Genereert gepersonaliseerde feedback via LLM"""
-        feedback_prompt = f"""{self.tutor.genereer_systeem_prompt(context_lengte=1)}
+    def _genereer(self, prompt: str, temperature: float) -> str:
+        return self.llm.genereer_response(prompt, temperature=temperature, site="feedback")
+
+    def genereer_feedback(self, oefening: Oefening, student_antwoord: str, is_correct: bool,
+                          oordeel: Optional[str] = None) -> str:
+        """
+        Genereert gepersonaliseerde feedback via LLM.
+        Bij een oefening uit de bank en een oordeel dat al eens voorkwam (zelfde oefening, tutor
+        en fout antwoord, of een goed antwoord) komt de feedback uit de template-cache, zie
+        feedback_templates.py.
+        """
+        oordeel = oordeel or (CORRECT if is_correct else INCORRECT)
+        prompt = self._feedback_prompt(oefening, student_antwoord, is_correct)
+        if not oefening.bron_id:
+            # Gegenereerde oefening: niemand anders krijgt dezelfde, dus niets om te hergebruiken
+            return self._genereer(prompt, 0.4)
+        return self.templates.feedback(
+            oefening.bron_id, oordeel, self.tutor.naam, student_antwoord,
+            partial(self._genereer, prompt), temperature=0.4,
+        )
+
+    def _feedback_prompt(self, oefening: Oefening, student_antwoord: str, is_correct: bool) -> str:
+        return f"""{self.tutor.genereer_systeem_prompt(context_lengte=1)}
 
 ## Huidige Situatie
 Oefening Type: {oefening.type.value}
@@ -585,7 +501,6 @@ Geef feedback volgens jouw persoonlijkheid.
 
 Schrijf 3-5 zinnen in het Nederlands.
 """
-        return self.llm.genereer_response(feedback_prompt, temperature=0.4)
 
     def genereer_schrijf_feedback(self, oefening: Oefening, student_tekst: str) -> str:
         """Genereert feedback op schrijfopdracht"""
@@ -612,7 +527,7 @@ Geef concrete feedback per criterium:
 
 Wees specifiek, kort en behulpzaam (5-8 zinnen).
 """
-        return self.llm.genereer_response(feedback_prompt, temperature=0.4)
+        return self.llm.genereer_response(feedback_prompt, temperature=0.4, site="feedback")
 
 
 # ============================================================================
@@ -620,36 +535,45 @@ Wees specifiek, kort en behulpzaam (5-8 zinnen).
 # ============================================================================
 
 class ProgressTracker:
-    def __init__(self):
-        self.geschiedenis: List[Dict] = []
-        self.fouten_per_onderwerp: Dict[str, int] = {}
+    """
+    Voortgang van één leerling. De pogingen en tellers staan in de gedeelde ProgressStore
+    (SQLite, zie progress_store.py), dus statistieken kosten geen scan over de geschiedenis
+    en blijven met PROGRESS_DB_PATH bewaard na een herstart.
+    """
+
+    def __init__(self, leerling_id: Optional[str] = None, store: Optional[ProgressStore] = None):
+        self.leerling_id = leerling_id or f"anoniem_{uuid.uuid4().hex[:8]}"
+        self.store = store or get_progress_store()
 
     def registreer_oefening(self, oefening: Oefening, is_correct: bool, student_antwoord: str):
-        self.geschiedenis.append({
-            "type": oefening.type.value,
-            "onderwerp": oefening.onderwerp,
-            "correct": is_correct,
-            "antwoord": student_antwoord
-        })
-        if not is_correct:
-            self.fouten_per_onderwerp[oefening.onderwerp] = self.fouten_per_onderwerp.get(oefening.onderwerp, 0) + 1
+        self.store.registreer(
+            self.leerling_id, oefening.type.value, oefening.onderwerp, is_correct, student_antwoord,
+            bron_id=oefening.bron_id,
+        )
+
+    @property
+    def geschiedenis(self) -> List[Dict]:
+        """Alle pogingen van deze leerling (leest het log; alleen voor inzage, niet voor statistieken)."""
+        pogingen, na_id = [], 0
+        while True:
+            blok = self.store.pogingen(self.leerling_id, na_id=na_id)
+            if not blok:
+                return pogingen
+            pogingen.extend(
+                {"type": p["type"], "onderwerp": p["onderwerp"], "correct": p["correct"], "antwoord": p["antwoord"]}
+                for p in blok
+            )
+            na_id = blok[-1]["id"]
+
+    @property
+    def fouten_per_onderwerp(self) -> Dict[str, int]:
+        return self.store.fouten_per_onderwerp(self.leerling_id)
 
     def get_zwakke_punten(self) -> List[str]:
-        if not self.fouten_per_onderwerp:
-            return []
-        gesorteerd = sorted(self.fouten_per_onderwerp.items(), key=lambda x: x[1], reverse=True)
-        return [onderwerp for onderwerp, _ in gesorteerd[:3]]
+        return self.store.zwakke_punten(self.leerling_id, k=3)
 
     def get_statistieken(self) -> Dict:
-        if not self.geschiedenis:
-            return {"totaal": 0, "correct": 0, "percentage": 0.0}
-        totaal = len(self.geschiedenis)
-        correct = sum(1 for item in self.geschiedenis if item["correct"])
-        return {
-            "totaal": totaal,
-            "correct": correct,
-            "percentage": round((correct / totaal) * 100, 1)
-        }
+        return self.store.statistieken(self.leerling_id)
 
 
 # ============================================================================
@@ -657,7 +581,8 @@ class ProgressTracker:
 # ============================================================================
 
 class AITutorSysteem:
-    def __init__(self, tutor_naam: str = "meester_jan", context_lengte: int = 3):
+    def __init__(self, tutor_naam: str = "meester_jan", context_lengte: int = 3,
+                 leerling_id: Optional[str] = None):
         if tutor_naam == "meester_jan":
             self.tutor = TutorPersonaliteiten.meester_jan()
         else:
@@ -665,9 +590,10 @@ class AITutorSysteem:
 
         self.context_lengte = context_lengte
         self.generator = OefeningenGenerator()
-        self.llm = LLMInterface()
+        self.progress = ProgressTracker(leerling_id)
+        self.llm = LLMInterface(sessie_id=self.progress.leerling_id)
+        self.nakijker = RuleGrader()
         self.feedback_gen = FeedbackGenerator(self.tutor, self.llm)
-        self.progress = ProgressTracker()
         self.huidige_oefening: Optional[Oefening] = None
         self.conversatie_geschiedenis: List[Dict] = []
 
@@ -685,7 +611,7 @@ Vraag wat de leerling vandaag wil oefenen of beter begrijpen.
 
 Max 4-5 zinnen.
 """
-        begroeting = self.llm.genereer_response(prompt, temperature=0.6)
+        begroeting = self.llm.genereer_response(prompt, temperature=0.6, site="begroeting")
         self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": begroeting})
         return begroeting
 
@@ -704,7 +630,7 @@ Maak het concreet (bijv. tenses, conditionals, tekstsoort, soort leesvraag).
 
 Antwoord alleen met de vraag in het Nederlands.
 """
-        vraag = self.llm.genereer_response(prompt, temperature=0.6)
+        vraag = self.llm.genereer_response(prompt, temperature=0.6, site="verduidelijkingsvraag")
         self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": vraag})
         return vraag
 
@@ -735,43 +661,28 @@ Geef een duidelijke, korte uitleg (4-7 zinnen) op HAVO 5-niveau over het gevraag
 - Sluit af met een kleine opdracht of vraag (bijv. 'Maak nu zelf 2 zinnen...').
 
 """
-        uitleg = self.llm.genereer_response(prompt, temperature=0.5)
+        uitleg = self.llm.genereer_response(prompt, temperature=0.5, site="uitleg")
         self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": uitleg})
         return uitleg
 
-    def genereer_oefeningen_op_basis_van_keuze(
-        self,
-        categorie: str,
-        keuze_tekst: str,
-        aantal: int = 3
-    ) -> Tuple[List[Oefening], str]:
-        """
-        Maakt op basis van de vrije input van de leerling:
-        - meerdere oefeningen (lijst),
-        - plus een korte introductietekst door de tutor.
-        """
-
-        # Eerst checken of de leerling om uitleg vraagt
-        if self._detect_uitleg(keuze_tekst):
-            uitleg = self.genereer_uitleg(categorie, keuze_tekst)
-            return [], uitleg
-
-        oefeningen: List[Oefening] = []
+    def _plan_oefeningen(self, categorie: str, keuze_tekst: str, aantal: int) -> List[Callable[[], Oefening]]:
+        """Bepaalt welke oefeningen er gemaakt worden (als losse bouwtaken, nog niet uitgevoerd)."""
+        taken: List[Callable[[], Oefening]] = []
 
         if categorie == "grammatica":
             onderwerp_key = self._kies_grammatica_onderwerp(keuze_tekst)
             # mix van gapfill en meerkeuze
             for i in range(aantal):
                 if i % 2 == 0:
-                    oefeningen.append(self.generator.genereer_grammatica_gapfill(onderwerp_key))
+                    taken.append(partial(self.generator.genereer_grammatica_gapfill, onderwerp_key))
                 else:
-                    oefeningen.append(self.generator.genereer_grammatica_meerkeuze(onderwerp_key))
+                    taken.append(partial(self.generator.genereer_grammatica_meerkeuze, onderwerp_key))
 
         elif categorie == "lezen":
             subtypes = ["hoofdgedachte", "detail", "woordbetekenis", "tekstverband", "houding"]
             for _ in range(min(aantal, 3)):
                 subtype = random.choice(subtypes)
-                oefeningen.append(self.generator.genereer_lezen_oefening(subtype))
+                taken.append(partial(self.generator.genereer_lezen_oefening, subtype))
 
         elif categorie == "schrijven":
             # Kies tekstsoort op basis van keuze of random
@@ -781,15 +692,38 @@ Geef een duidelijke, korte uitleg (4-7 zinnen) op HAVO 5-niveau over het gevraag
                 tekstsoort = "email_formeel"
             elif "mail" in lower or "vriend" in lower or "informele" in lower:
                 tekstsoort = "email_informeel"
-            oefeningen.append(self.generator.genereer_schrijven_oefening(tekstsoort))
+            taken.append(partial(self.generator.genereer_schrijven_oefening, tekstsoort))
 
         else:  # willekeurig
             # simpele mix
-            oefeningen.append(self.generator.genereer_grammatica_gapfill(self._kies_grammatica_onderwerp(keuze_tekst)))
-            oefeningen.append(self.generator.genereer_lezen_oefening("detail"))
+            taken.append(partial(self.generator.genereer_grammatica_gapfill, self._kies_grammatica_onderwerp(keuze_tekst)))
+            taken.append(partial(self.generator.genereer_lezen_oefening, "detail"))
+
+        return taken
+
+    def genereer_oefeningen_op_basis_van_keuze(
+        self,
+        categorie: str,
+        keuze_tekst: str,
+        aantal: int = 3
+    ) -> Tuple[List[Oefening], str]:
+        """
+        Maakt op basis van de vrije input van de leerling:
+        - meerdere oefeningen (lijst; `aantal` bij grammatica, hooguit 3 bij lezen, 1 schrijfopdracht,
+          2 bij willekeurig),
+        - plus een korte introductietekst door de tutor.
+        De oefeningen komen uit lokale sjablonen (microseconden); alleen de intro is een
+        LLM-call. Die loopt in een eigen thread terwijl de oefeningen gebouwd worden.
+        """
+
+        # Eerst checken of de leerling om uitleg vraagt
+        if self._detect_uitleg(keuze_tekst):
+            uitleg = self.genereer_uitleg(categorie, keuze_tekst)
+            return [], uitleg
+
+        taken = self._plan_oefeningen(categorie, keuze_tekst, aantal)
 
         # Intro via LLM
-        beschrijving = f"{categorie} - gebaseerd op: '{keuze_tekst}'"
         prompt = f"""{self.tutor.genereer_systeem_prompt(self.context_lengte)}
 
 ## Situatie
@@ -797,14 +731,18 @@ Je gaat de leerling meerdere oefeningen geven.
 
 Samenvatting keuze leerling: "{keuze_tekst}"
 Categorie: {categorie}
-Aantal oefeningen: {len(oefeningen)}
+Aantal oefeningen: {len(taken)}
 
 ## Jouw Taak
 Leg in 2-3 zinnen uit wat jullie nu gaan doen.
 Wees motiverend en duidelijk.
 
 """
-        intro = self.llm.genereer_response(prompt, temperature=0.6)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            intro_future = pool.submit(self.llm.genereer_response, prompt, 0.6, "intro")
+            oefeningen = [taak() for taak in taken]
+            intro = intro_future.result()
+
         self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": intro})
 
         return oefeningen, intro
@@ -815,16 +753,20 @@ Wees motiverend en duidelijk.
             return False, "Er is momenteel geen actieve oefening."
 
         # Schrijfopdrachten → altijd via schrijf-feedback
-        if oefening.type in [OefeningType.SCHRIJVEN_EMAIL, OefeningType.SCHRIJVEN_ARTIKEL, OefeningType.SCHRIJVEN_REVIEW]:
+        if oefening.type in SCHRIJF_TYPES:
             feedback = self.feedback_gen.genereer_schrijf_feedback(oefening, student_antwoord)
             self.progress.registreer_oefening(oefening, True, student_antwoord)
             self.conversatie_geschiedenis.append({"rol": "student", "bericht": student_antwoord})
             self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": feedback})
             return True, feedback
 
-        # Gesloten vragen → LLM-based check
-        is_correct, oordeel = self.llm.check_antwoord(oefening, student_antwoord)
-        feedback = self.feedback_gen.genereer_feedback(oefening, student_antwoord, is_correct)
+        # Gesloten vragen → eerst lokaal nakijken, alleen twijfelgevallen via de LLM
+        oordeel = self.nakijker.beoordeel(student_antwoord, oefening.juist_antwoord, oefening.opties)
+        if oordeel is None:
+            is_correct, oordeel = self.llm.check_antwoord(oefening, student_antwoord)
+        else:
+            is_correct = oordeel == CORRECT
+        feedback = self.feedback_gen.genereer_feedback(oefening, student_antwoord, is_correct, oordeel)
 
         self.progress.registreer_oefening(oefening, is_correct, student_antwoord)
         self.conversatie_geschiedenis.append({"rol": "student", "bericht": student_antwoord})
@@ -852,7 +794,7 @@ Leg dit kort en bemoedigend uit (4-5 zinnen).
 Geef 1-2 concrete tips waar de leerling zich op kan richten.
 
 """
-        presentatie = self.llm.genereer_response(prompt, temperature=0.5)
+        presentatie = self.llm.genereer_response(prompt, temperature=0.5, site="statistieken")
         self.conversatie_geschiedenis.append({"rol": "tutor", "bericht": presentatie})
         return presentatie
 
@@ -895,7 +837,10 @@ class TutorCLI:
         context = input("Context lengte [standaard 3]: ").strip()
         context_lengte = int(context) if context.isdigit() and 1 <= int(context) <= 10 else 3
 
-        self.systeem = AITutorSysteem(tutor_naam=tutor_naam, context_lengte=context_lengte)
+        print("\nWat is je naam of leerlingnummer? Dan wordt je voortgang bewaard.")
+        leerling_id = input("Naam [leeg = anoniem]: ").strip() or None
+
+        self.systeem = AITutorSysteem(tutor_naam=tutor_naam, context_lengte=context_lengte, leerling_id=leerling_id)
 
         print("\n" + "=" * 60)
         begroeting = self.systeem.start_sessie()
@@ -925,6 +870,12 @@ class TutorCLI:
                 print("\n" + "=" * 60)
                 stats = self.systeem.toon_statistieken()
                 print(f"\n{stats}\n")
+                nakijk = self.systeem.nakijker.metrics()
+                print(f"(Zonder LLM nagekeken: {nakijk['lokaal']} van {nakijk['lokaal'] + nakijk['llm']} antwoorden)")
+                for site, m in self.systeem.llm.cache.metrics()["sites"].items():
+                    print(f"(LLM-cache {site}: {m['hits'] + m['disk_hits']} hits, {m['misses']} misses, "
+                          f"hit rate {m['hit_rate'] * 100:.0f}%)")
+                print()
                 continue
 
             if keuze == "6":
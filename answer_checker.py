@@ -1,6 +1,15 @@
 import json
+import os
 import re
 import subprocess
+from contextlib import aclosing
+from typing import Optional
+
+from json_schemas import WRITING_SCORE_SCHEMA, ollama_format, parse_structured
+from json_stream import aread_until_complete, read_until_complete
+from llm_cache import get_cache
+from llm_scheduler import Bezet, get_scheduler, klasse_voor
+from ollama_client import get_client
 
 # ================================================================
 #  Hardcoded oefening JSON's
@@ -133,9 +142,95 @@ def map_mcq_answer_to_index(answer, options):
 #  LLM Interface
 # ================================================================
 
-def call_ollama(prompt: str, model: str = "mistral:instruct") -> str:
+# Alleen als dit aan staat wordt bij een mislukte HTTP-call teruggevallen op `ollama run`
+OLLAMA_CLI_FALLBACK = os.getenv("OLLAMA_CLI_FALLBACK", "0") == "1"
+
+
+def call_ollama(
+    prompt: str,
+    model: str = "mistral:instruct",
+    json_mode: bool = False,
+    schema=None,
+    temperature=None,
+    site: str = "nakijken",
+) -> str:
+    """
+    Stuurt een prompt naar Ollama via de HTTP API (gedeelde keep-alive verbinding, streaming)
+    en retourneert de ruwe output. Met `json_mode` wordt `format: json` meegestuurd (of het
+    `schema`, zie json_schemas) en stopt het lezen zodra het JSON-object compleet is.
+    Geslaagde HTTP-antwoorden gaan via de LLM-cache (zie llm_cache.py).
+    """
+    output_format = None
+    if json_mode:
+        output_format = ollama_format(schema) if schema else "json"
+    options = {"temperature": temperature} if temperature is not None else None
+
+    cache = get_cache()
+    cached = cache.get(site, model, temperature, prompt)
+    if cached is not None:
+        return cached
+
+    def generate() -> str:
+        try:
+            # Nakijken wacht op chat (zie llm_scheduler.py); een volle wachtrij geeft Bezet, geen CLI-fallback
+            with get_scheduler().slot(klasse_voor(site)):
+                pieces = get_client().generate_stream(prompt, model=model, format=output_format, options=options)
+                if json_mode:
+                    response = read_until_complete(pieces, start_chars="{")
+                else:
+                    response = "".join(pieces)
+        except Bezet:
+            raise
+        except Exception as e:
+            if OLLAMA_CLI_FALLBACK:
+                print(f"[Waarschuwing] Ollama HTTP-call mislukt ({e}), terugvallen op `ollama run`...")
+                return call_ollama_cli(prompt, model)
+            raise RuntimeError(f"Ollama HTTP-call mislukt: {e}")
+        cache.put(site, model, temperature, prompt, response)
+        return response
+
+    # Hetzelfde nakijkverzoek dat al loopt (bv. dezelfde tekst twee keer ingestuurd) wordt gedeeld
+    return cache.coalesce(site, model, temperature, prompt, generate)
+
+
+async def acall_ollama(
+    prompt: str,
+    model: str = "mistral:instruct",
+    json_mode: bool = False,
+    schema=None,
+    temperature=None,
+    site: str = "nakijken",
+) -> str:
+    """
+    Async variant van call_ollama (zelfde cache en planner, geen CLI-fallback).
+    Wordt de taak geannuleerd, dan wordt de stream gesloten en stopt Ollama met genereren.
+    """
+    output_format = None
+    if json_mode:
+        output_format = ollama_format(schema) if schema else "json"
+    options = {"temperature": temperature} if temperature is not None else None
+
+    async def generate() -> str:
+        try:
+            # aclosing: ook na een vroege stop (JSON compleet) of annulering gaat de verbinding meteen dicht
+            async with get_scheduler().aslot(klasse_voor(site)), aclosing(
+                get_client().agenerate_stream(prompt, model=model, format=output_format, options=options)
+            ) as pieces:
+                if json_mode:
+                    return await aread_until_complete(pieces, start_chars="{")
+                return "".join([piece async for piece in pieces])
+        except Bezet:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Ollama HTTP-call mislukt: {e}")
+
+    return await get_cache().aget_or_generate(site, model, temperature, prompt, generate)
+
+
+def call_ollama_cli(prompt: str, model: str = "mistral:instruct") -> str:
     """
-    Stuurt een prompt naar Ollama en retourneert de ruwe output (UTF-8 veilig).
+    Fallback: start `ollama run` als los proces (traag: process-start per call).
+    Alleen gebruikt als OLLAMA_CLI_FALLBACK=1.
     """
     try:
         result = subprocess.run(
@@ -160,103 +255,154 @@ def call_ollama(prompt: str, model: str = "mistral:instruct") -> str:
 
 def extract_json_from_llm_response(response: str) -> dict:
     """
-    Improved JSON extraction from LLM response with multiple fallback strategies.
+    JSON uit de LLM-response halen; fences, proza en veelgemaakte fouten worden door
+    json_stream in één doorgang hersteld. Zonder JSON-object: handmatige extractie.
+    Het resultaat heeft altijd overall_score, result, criteria, error_types en comments.
     """
-    # Remove any markdown code fences
-    if "```json" in response:
-        # Extract content between ```json and ```
-        pattern = r"```json\s*(.*?)\s*```"
-        matches = re.findall(pattern, response, re.DOTALL)
-        if matches:
-            response = matches[0]
-    elif "```" in response:
-        # Extract content between ``` and ```
-        pattern = r"```\s*(.*?)\s*```"
-        matches = re.findall(pattern, response, re.DOTALL)
-        if matches:
-            response = matches[0]
-
-    # Try to find JSON object
-    start = response.find("{")
-    end = response.rfind("}")
-
-    if start == -1 or end == -1 or end <= start:
-        raise ValueError("Geen JSON-object gevonden in LLM-output.")
-
-    json_str = response[start:end + 1]
-
-    # Try parsing directly
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        print(f"[Debug] Direct JSON parsing failed: {e}")
-        print(f"[Debug] Attempting to fix JSON...")
+        result, _ = parse_structured(response, WRITING_SCORE_SCHEMA, "writing_score")
+    except ValueError:
+        print("[Debug] Geen JSON-object gevonden, gebruik handmatige extractie...")
+        return extract_fields_manually(response)
+    if not isinstance(result, dict):
+        return extract_fields_manually(response)
+    return normalize_writing_scores(result)
 
-    # Try fixing escaped quotes
-    if '\\"' in json_str:
-        try:
-            cleaned = json_str.replace('\\"', '"')
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            pass
 
-    # Try fixing single quotes (common LLM mistake)
-    try:
-        fixed = json_str.replace("'", '"')
-        return json.loads(fixed)
-    except json.JSONDecodeError:
-        pass
+WRITING_RESULTS = ("correct", "almost", "incorrect")
+WRITING_CRITERIA = ("structure", "content", "language")
+FALLBACK_COMMENT = "Automatische fallback-score (parsing mislukt)."
 
-    # Last resort: extract key fields manually
-    print("[Debug] JSON parsing volledig mislukt, gebruik handmatige extractie...")
-    return extract_fields_manually(response)
+# Handmatige extractie kijkt niet verder dan dit aantal tekens (een LLM-antwoord is veel korter)
+MAX_MANUAL_CHARS = 20_000
 
+_FIELD_PATTERN = re.compile(
+    r"""["']?\b(overall_score|result|comments|structure|content|language)\b["']?[ \t]*[:=][ \t]*"""
+)
+_NUMBER_PATTERN = re.compile(r"-?(?:\d+(?:\.\d*)?|\.\d+)")
+_WORD_PATTERN = re.compile(r"[A-Za-z_]+")
 
-def extract_fields_manually(response: str) -> dict:
+
+def _score(value, default: float) -> float:
+    """Score als float tussen 0 en 1; percentages (85) worden omgerekend."""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return default
+    if score != score:  # NaN
+        return default
+    if 1 < score <= 100:
+        score /= 100
+    return min(max(score, 0.0), 1.0)
+
+
+def _result_for_score(score: float) -> str:
+    # Zelfde grenzen als in de prompt van llm_score_writing
+    if score >= 0.8:
+        return "correct"
+    if score >= 0.5:
+        return "almost"
+    return "incorrect"
+
+
+def normalize_writing_scores(data: dict) -> dict:
     """
-    Manually extract key fields when JSON parsing fails.
+    Maakt van een (mogelijk afgekapt of slordig) LLM-resultaat een volledig schrijfresultaat:
+    ontbrekende velden worden aangevuld, scores begrensd op 0..1 en een ontbrekend of
+    onbekend result wordt afgeleid uit de score.
     """
-    result = {
-        "overall_score": 0.5,
-        "result": "almost",
-        "criteria": {
-            "structure": 0.5,
-            "content": 0.5,
-            "language": 0.5
-        },
-        "error_types": [],
-        "comments": "Automatische fallback-score (parsing mislukt)."
+    has_score = data.get("overall_score") is not None
+    overall = _score(data.get("overall_score"), 0.5)
+
+    raw_criteria = data.get("criteria")
+    raw_criteria = raw_criteria if isinstance(raw_criteria, dict) else {}
+    criteria = {name: _score(raw_criteria.get(name), overall) for name in WRITING_CRITERIA}
+    if not has_score and raw_criteria:
+        overall = round(sum(criteria.values()) / len(criteria), 2)
+
+    result = str(data.get("result") or "").strip().lower()
+    if result not in WRITING_RESULTS:
+        result = _result_for_score(overall)
+
+    error_types = data.get("error_types")
+    if isinstance(error_types, str):
+        error_types = [error_types]
+    if not isinstance(error_types, list):
+        error_types = []
+
+    comments = data.get("comments")
+    return {
+        "overall_score": overall,
+        "result": result,
+        "criteria": criteria,
+        "error_types": [str(e) for e in error_types if e],
+        "comments": comments if isinstance(comments, str) and comments else None,
     }
 
-    # Try to extract overall_score
-    score_match = re.search(r'"overall_score"\s*:\s*([0-9.]+)', response)
-    if score_match:
-        try:
-            result["overall_score"] = float(score_match.group(1))
-        except ValueError:
-            pass
-
-    # Try to extract result
-    result_match = re.search(r'"result"\s*:\s*["\']([^"\']+)["\']', response)
-    if result_match:
-        result["result"] = result_match.group(1)
-
-    # Try to extract comments
-    comments_match = re.search(r'"comments"\s*:\s*["\']([^"\']+)["\']', response)
-    if comments_match:
-        result["comments"] = comments_match.group(1)
 
-    return result
+def _read_value(text: str, pos: int):
+    """Leest een waarde vanaf `pos`: (waarde, nieuwe positie); waarde is None als er niets bruikbaars staat."""
+    if pos >= len(text):
+        return None, pos
+    quote = text[pos]
+    if quote in "\"'":
+        i = pos + 1
+        while True:
+            end = text.find(quote, i)
+            if end == -1:
+                # Afgekapte string: de rest van de regel
+                end = text.find("\n", pos + 1)
+                end = len(text) if end == -1 else end
+                return text[pos + 1:end], end
+            if text[end - 1] != "\\":
+                return text[pos + 1:end].replace("\\" + quote, quote), end + 1
+            i = end + 1
+    match = _NUMBER_PATTERN.match(text, pos)
+    if match:
+        return match.group(0), match.end()
+    match = _WORD_PATTERN.match(text, pos)
+    if match:
+        return match.group(0), match.end()
+    return None, pos
 
 
-def llm_score_writing(prompt: str, rubric: dict, student_answer: str) -> dict:
+def extract_fields_manually(response: str) -> dict:
     """
-    Laat Mistral een objectieve beoordeling geven van een schrijfopdracht.
-    Geen feedback - alleen scores en error types voor de Feedback Generator.
+    Manually extract key fields when JSON parsing fails.
+
+    Eén keer van links naar rechts door (maximaal MAX_MANUAL_CHARS tekens van) de tekst:
+    de eerste bruikbare waarde per veld telt, gelezen strings worden overgeslagen.
+    Roept geen JSON-parser aan, dus kan niet terug in extract_json_from_llm_response lopen.
     """
+    text = response[:MAX_MANUAL_CHARS]
+    found = {}
+    criteria = {}
+    pos = 0
+    while len(found) + len(criteria) < 6:
+        match = _FIELD_PATTERN.search(text, pos)
+        if match is None:
+            break
+        field = match.group(1)
+        value, pos = _read_value(text, match.end())
+        pos = max(pos, match.end())
+        if value is None:
+            continue
+        if field in WRITING_CRITERIA:
+            if field not in criteria and _NUMBER_PATTERN.fullmatch(value):
+                criteria[field] = value
+        elif field not in found:
+            found[field] = value
+
+    if criteria:
+        found["criteria"] = criteria
+    found.setdefault("comments", FALLBACK_COMMENT)
+    return normalize_writing_scores(found)
+
+
+def writing_score_prompt(prompt: str, rubric: dict, student_answer: str) -> str:
     rubric_text = json.dumps(rubric, indent=2, ensure_ascii=False)
 
-    system_prompt = f"""You are an objective English writing assessor for Dutch HAVO 5 students (B1/B2 level).
+    return f"""You are an objective English writing assessor for Dutch HAVO 5 students (B1/B2 level).
 
 CRITICAL: Your response must be ONLY valid JSON. No explanations, no markdown, no backticks.
 
@@ -294,10 +440,32 @@ Rules for scoring:
 
 RESPOND WITH ONLY THE JSON OBJECT NOW:"""
 
+
+def llm_score_writing(prompt: str, rubric: dict, student_answer: str) -> dict:
+    """
+    Laat Mistral een objectieve beoordeling geven van een schrijfopdracht.
+    Geen feedback - alleen scores en error types voor de Feedback Generator.
+    """
     print("\n[Debug] Stuur prompt naar Ollama...")
-    response = call_ollama(system_prompt).strip()
-    print(f"[Debug] Ruwe LLM response (eerste 500 chars):\n{response[:500]}\n")
+    # Temperatuur 0: dezelfde tekst krijgt dezelfde score (en kan dus uit de cache komen)
+    response = call_ollama(
+        writing_score_prompt(prompt, rubric, student_answer),
+        json_mode=True, schema=WRITING_SCORE_SCHEMA, temperature=0.0, site="schrijfbeoordeling",
+    ).strip()
+    return parse_writing_score(response)
+
+
+async def allm_score_writing(prompt: str, rubric: dict, student_answer: str) -> dict:
+    """Async variant van llm_score_writing."""
+    response = (await acall_ollama(
+        writing_score_prompt(prompt, rubric, student_answer),
+        json_mode=True, schema=WRITING_SCORE_SCHEMA, temperature=0.0, site="schrijfbeoordeling",
+    )).strip()
+    return parse_writing_score(response)
 
+
+def parse_writing_score(response: str) -> dict:
+    print(f"[Debug] Ruwe LLM response (eerste 500 chars):\n{response[:500]}\n")
     try:
         result = extract_json_from_llm_response(response)
         print("[Debug] JSON parsing succesvol!")
@@ -316,8 +484,36 @@ def check_writing(exercise: dict, student_answer: str) -> dict:
     Check a writing exercise with LLM evaluation.
     """
     content = exercise["content"]
-    rubric = content["rubric"]
-    prompt = content["prompt"]
+
+    # Try LLM evaluation
+    try:
+        print(f"\n[Info] Evalueer schrijfopdracht met LLM...")
+        llm_result = llm_score_writing(content["prompt"], content["rubric"], student_answer)
+        print(f"[Info] LLM-evaluatie succesvol: score={llm_result['overall_score']}")
+    except Exception as e:
+        print(f"\n[Waarschuwing] LLM-beoordeling is mislukt: {e}")
+        llm_result = None
+
+    return writing_result(exercise, student_answer, llm_result)
+
+
+async def acheck_writing(exercise: dict, student_answer: str) -> dict:
+    """
+    Async variant van check_writing. Annuleren (asyncio) breekt de LLM-call af in plaats van
+    op de fallback-score terug te vallen.
+    """
+    content = exercise["content"]
+    try:
+        llm_result = await allm_score_writing(content["prompt"], content["rubric"], student_answer)
+    except Exception as e:
+        print(f"\n[Waarschuwing] LLM-beoordeling is mislukt: {e}")
+        llm_result = None
+    return writing_result(exercise, student_answer, llm_result)
+
+
+def writing_result(exercise: dict, student_answer: str, llm_result: Optional[dict]) -> dict:
+    """Het nakijkresultaat uit de LLM-scores plus de woordentelling; zonder scores een fallback-score."""
+    content = exercise["content"]
 
     # Word count check
     words = len(student_answer.split())
@@ -330,16 +526,8 @@ def check_writing(exercise: dict, student_answer: str) -> dict:
     elif words > max_wc:
         word_count_error = "too_long"
 
-    # Try LLM evaluation
-    try:
-        print(f"\n[Info] Evalueer schrijfopdracht met LLM...")
-        llm_result = llm_score_writing(prompt, rubric, student_answer)
-        llm_failed = False
-        print(f"[Info] LLM-evaluatie succesvol: score={llm_result['overall_score']}")
-    except Exception as e:
-        print(f"\n[Waarschuwing] LLM-beoordeling is mislukt: {e}")
-        llm_failed = True
-
+    llm_failed = llm_result is None
+    if llm_failed:
         # Fallback score
         base_score = 0.7
         if word_count_error:
@@ -481,6 +669,16 @@ def check_answer(exercise, answer):
     raise ValueError(f"Ongeldig oefeningstype: {t}")
 
 
+async def acheck_answer(exercise, answer):
+    """
+    Async variant van check_answer: alleen schrijfopdrachten gaan naar de LLM (zonder de
+    event loop te blokkeren), de rest wordt direct nagekeken.
+    """
+    if exercise["type"] == "writing":
+        return await acheck_writing(exercise, answer)
+    return check_answer(exercise, answer)
+
+
 
 # ================================================================
 #  CLI (met doorlopende loop)
@@ -0,0 +1,1644 @@
+"""
+Benchmarks voor de AI Tutor backend.
+Alle benchmarks draaien tegen een lokale stub, er is dus geen Ollama of OpenAI-key nodig.
+
+Gebruik:
+    python benchmarks.py              # keuzemenu
+    python benchmarks.py concurrency  # direct één benchmark draaien
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# De benchmarks meten het LLM-pad zelf; bench_llm_cache zet een eigen cache op
+os.environ.setdefault("LLM_CACHE_SIZE", "0")
+# Idem voor de planner: zonder limiet, bench_llm_scheduler zet er zelf een op
+os.environ.setdefault("LLM_MAX_CONCURRENCY", "1000")
+
+
+# ================================================================
+#  Hulpfuncties
+# ================================================================
+
+def percentiel(waarden, p: float) -> float:
+    """Percentiel (0-100) met lineaire interpolatie."""
+    if not waarden:
+        return 0.0
+    gesorteerd = sorted(waarden)
+    k = (len(gesorteerd) - 1) * (p / 100)
+    laag = int(k)
+    hoog = min(laag + 1, len(gesorteerd) - 1)
+    return gesorteerd[laag] + (gesorteerd[hoog] - gesorteerd[laag]) * (k - laag)
+
+
+def print_latency(label: str, latencies):
+    print(
+        f"  {label:<28} p50={percentiel(latencies, 50) * 1000:7.1f} ms  "
+        f"p99={percentiel(latencies, 99) * 1000:7.1f} ms  "
+        f"gem={statistics.mean(latencies) * 1000:7.1f} ms"
+    )
+
+
+# ================================================================
+#  Stub LLM's voor main.py
+# ================================================================
+
+class _StubResponse:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubLLM:
+    """Gedraagt zich als ChatOpenAI, maar wacht alleen `delay` seconden (niet-blokkerend)."""
+
+    def __init__(self, delay: float = 0.2, antwoord: str = "Goed zo, dat klopt!"):
+        self.delay = delay
+        self.antwoord = antwoord
+
+    def invoke(self, messages):
+        time.sleep(self.delay)
+        return _StubResponse(self.antwoord)
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.delay)
+        return _StubResponse(self.antwoord)
+
+
+class BlockingStubLLM(StubLLM):
+    """Simuleert het oude gedrag: een synchrone call binnen een async handler."""
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+# ================================================================
+#  Stub Ollama-server
+# ================================================================
+
+class _StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, net als Ollama zelf
+    antwoord = "Goed zo, dat klopt!"
+    delay = 0.0        # vaste tijd per call (prompt verwerken)
+    token_delay = 0.0  # extra tijd per gegenereerd token
+    json_antwoord = json.dumps({
+        "overall_score": 0.8, "result": "correct",
+        "criteria": {"structure": 0.8, "content": 0.8, "language": 0.8}, "error_types": [],
+    })
+    missing_paths = ()
+    models = ("mistral:7b",)
+    slots = None       # Semaphore: max. gelijktijdige generaties (zoals OLLAMA_NUM_PARALLEL)
+    kv_prefix = 0      # > 0: een al geziene promptprefix van zoveel tekens kost maar 30% van `delay`
+
+    def setup(self):
+        super().setup()
+        # Go (Ollama) zet TCP_NODELAY standaard; zonder dit meet je op keep-alive vooral Nagle
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send_json(self, status: int, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _uitgevallen(self) -> bool:
+        # Gesimuleerde crash: verbinding dicht zonder antwoord (ook op keep-alive verbindingen)
+        if not getattr(self.server, "uitgevallen", False):
+            return False
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+        return True
+
+    def do_GET(self):
+        if self._uitgevallen():
+            return
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": m} for m in self.models]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._uitgevallen():
+            return
+        self.server.requests_seen += 1
+        self.server.prompt_chars += len(body.get("prompt", ""))
+        if self.path in self.missing_paths:
+            self._send_json(404, {"error": "not found"})
+            return
+        if self.slots is not None:
+            with self.slots:
+                self._verwerk_prompt(body.get("prompt", ""))
+        else:
+            self._verwerk_prompt(body.get("prompt", ""))
+        antwoord = self._kies_antwoord(body)
+        tokens = antwoord.split(" ")
+        if body.get("stream", True):
+            regels = [json.dumps({"response": w + " ", "done": False}) + "\n" for w in tokens]
+            regels.append(json.dumps({"response": "", "done": True}) + "\n")
+            content_type = "application/x-ndjson"
+        else:
+            time.sleep(self.token_delay * len(tokens))
+            regels = [json.dumps({"response": antwoord, "done": True})]
+            content_type = "application/json"
+        data = [r.encode("utf-8") for r in regels]
+        per_regel = 1 if len(data) > 1 else len(tokens)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(sum(len(d) for d in data)))
+        self.end_headers()
+        for d in data:
+            if self.token_delay and len(data) > 1:
+                time.sleep(self.token_delay)
+            try:
+                self.wfile.write(d)
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client weg: stoppen met genereren, zoals Ollama bij een gesloten verbinding
+                self.close_connection = True
+                return
+            self.server.tokens_verstuurd += per_regel
+
+    def _verwerk_prompt(self, prompt: str):
+        delay = self.delay
+        if self.kv_prefix:
+            prefix = prompt[:self.kv_prefix]
+            if prefix in self.server.kv_prefixen:
+                self.server.kv_hits += 1
+                delay *= 0.3
+            self.server.kv_prefixen.add(prefix)
+        if delay:
+            time.sleep(delay)
+
+    def _kies_antwoord(self, body) -> str:
+        # Bij format (json of een schema) het JSON-antwoord, anders gewone tekst
+        return self.json_antwoord if body.get("format") else self.antwoord
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # een hele klas tegelijk laten verbinden
+
+
+def start_stub_ollama(delay: float = 0.0, antwoord: str = _StubOllamaHandler.antwoord, missing_paths=(),
+                      token_delay: float = 0.0, json_antwoord: Optional[str] = None,
+                      capacity: Optional[int] = None, kv_prefix: int = 0):
+    """
+    Start een lokale stub-Ollama op een vrije poort; geeft (server, base_url) terug.
+    Paden in `missing_paths` geven een 404 (bv. een oudere server zonder /api/generate).
+    `json_antwoord` is het antwoord bij format=json (anders een nakijk-resultaat).
+    `capacity`: max. gelijktijdige generaties; `kv_prefix`: simuleert hergebruik van de KV-cache.
+    """
+    attrs = {"delay": delay, "token_delay": token_delay, "antwoord": antwoord, "missing_paths": tuple(missing_paths),
+             "kv_prefix": kv_prefix}
+    if json_antwoord is not None:
+        attrs["json_antwoord"] = json_antwoord
+    if capacity is not None:
+        attrs["slots"] = threading.Semaphore(capacity)
+    handler = type("Handler", (_StubOllamaHandler,), attrs)
+    server = _StubServer(("127.0.0.1", 0), handler)
+    server.requests_seen = 0
+    server.prompt_chars = 0
+    server.kv_prefixen = set()
+    server.kv_hits = 0
+    server.tokens_verstuurd = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ================================================================
+#  1) Concurrency van de FastAPI endpoints
+# ================================================================
+
+async def _run_sessions(app, aantal_sessies: int, berichten_per_sessie: int):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        session_ids = []
+        for _ in range(aantal_sessies):
+            r = await client.post("/start_session", json={"topic": "Engels", "tutor_id": "jan"})
+            session_ids.append(r.json()["session_id"])
+
+        # De latency meten we vanaf één gezamenlijk startmoment: bij een blokkerende
+        # handler loopt ook de client op dezelfde event loop vast, dus een starttijd
+        # per request zou de wachttijd in de rij verbergen.
+        start = time.perf_counter()
+
+        async def sessie(session_id):
+            for i in range(berichten_per_sessie):
+                r = await client.post(f"/chat/{session_id}", json={"text": f"Vraag {i}"})
+                r.raise_for_status()
+            latencies.append((time.perf_counter() - start) / berichten_per_sessie)
+
+        await asyncio.gather(*(sessie(sid) for sid in session_ids))
+        totaal = time.perf_counter() - start
+
+    return latencies, totaal
+
+
+def bench_concurrency(aantal_sessies: int = 50, berichten_per_sessie: int = 3, delay: float = 0.2):
+    """
+    p50/p99 latency per /chat-beurt onder `aantal_sessies` parallelle sessies,
+    met een gestubde LLM van `delay` seconden per completion.
+    """
+    import main
+
+    print(f"\n=== Concurrency: {aantal_sessies} sessies x {berichten_per_sessie} berichten, "
+          f"LLM-delay {delay * 1000:.0f} ms ===")
+
+    origineel = main.llm
+    try:
+        for label, stub in [
+            ("blokkerend (llm.invoke)", BlockingStubLLM(delay)),
+            ("async (llm.ainvoke)", StubLLM(delay)),
+        ]:
+            main.llm = stub
+            main.sessions.clear()
+            latencies, totaal = asyncio.run(_run_sessions(main.app, aantal_sessies, berichten_per_sessie))
+            print_latency(label, latencies)
+            print(f"  {'':<28} totale wandkloktijd {totaal:.2f} s")
+    finally:
+        main.llm = origineel
+        main.sessions.clear()
+
+
+# ================================================================
+#  2) Prompt-tokens per beurt met het context-venster
+# ================================================================
+
+def bench_context_window(beurten: int = 200, max_tokens: int = 3000):
+    """
+    Prompt-tokens per LLM-call over een synthetische sessie van `beurten` beurten:
+    volledige geschiedenis (oud gedrag) versus ContextBuilder met tokenbudget.
+    """
+    import random
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from context_window import ContextBuilder, message_tokens
+
+    print(f"\n=== Context-venster: {beurten} beurten, budget {max_tokens} tokens ===")
+
+    rng = random.Random(42)
+    woorden = ("present perfect past simple because however the student wrote a sentence "
+               "about travel school holiday which tense should I use here").split()
+
+    def zin(n):
+        return " ".join(rng.choice(woorden) for _ in range(n)).capitalize() + "."
+
+    builder = ContextBuilder(max_tokens=max_tokens)
+    session = {"history": [SystemMessage(content="Je bent Meester Jan. " + zin(60))]}
+    volledig, venster = [], []
+
+    for _ in range(beurten):
+        session["history"].append(HumanMessage(content=zin(rng.randint(5, 40))))
+        volledig.append(sum(message_tokens(m) for m in session["history"]))
+        start = time.perf_counter()
+        messages = builder.build(session)
+        venster.append((sum(message_tokens(m) for m in messages), time.perf_counter() - start))
+        session["history"].append(AIMessage(content=" ".join(zin(12) for _ in range(rng.randint(2, 8)))))
+
+    for beurt in (1, 10, 50, 100, beurten):
+        print(f"  beurt {beurt:>3}: volledig {volledig[beurt - 1]:>6} tokens   venster {venster[beurt - 1][0]:>5} tokens")
+    print(f"  totaal over de sessie: volledig {sum(volledig):,} tokens, venster {sum(t for t, _ in venster):,} tokens")
+    print(f"  bouwtijd venster: gem {statistics.mean(d for _, d in venster) * 1e6:.0f} µs per beurt")
+
+
+# ================================================================
+#  3) Overhead per Ollama-call: losse requests.post vs gedeelde client
+# ================================================================
+
+def bench_ollama_client(calls: int = 300):
+    """
+    Overhead per call tegen een stub-Ollama zonder modelvertraging:
+    een nieuwe verbinding per `requests.post` (oud gedrag) versus de gedeelde pool.
+    """
+    import requests
+    from ollama_client import OllamaClient
+
+    print(f"\n=== Ollama-client: {calls} calls tegen een stub-server ===")
+    server, base_url = start_stub_ollama()
+    try:
+        payload = {"model": "mistral:7b", "prompt": "Hallo", "stream": False}
+        losse = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            requests.post(f"{base_url}/api/generate", json=payload, timeout=10).json()
+            losse.append(time.perf_counter() - start)
+
+        client = OllamaClient(base_url=base_url)
+        gedeeld, stream = [], []
+        for _ in range(calls):
+            start = time.perf_counter()
+            client.generate("Hallo")
+            gedeeld.append(time.perf_counter() - start)
+        for _ in range(calls):
+            start = time.perf_counter()
+            "".join(client.generate_stream("Hallo"))
+            stream.append(time.perf_counter() - start)
+        client.close()
+
+        print_latency("requests.post (los)", losse)
+        print_latency("OllamaClient.generate", gedeeld)
+        print_latency("OllamaClient.generate_stream", stream)
+    finally:
+        server.shutdown()
+
+
+# ================================================================
+#  4) Endpoint-cache in LLMInterface bij een server zonder /api/generate
+# ================================================================
+
+def bench_endpoint_cache(calls: int = 200):
+    """
+    HTTP-requests en latency per genereer_response-call als het eerste endpoint een 404 geeft:
+    zonder cache (elke call opnieuw zoeken, oud gedrag) versus met de endpoint-cache.
+    """
+    import ai_tutor_main
+
+    print(f"\n=== Endpoint-cache: {calls} calls, /api/generate geeft 404 ===")
+    server, base_url = start_stub_ollama(missing_paths=("/api/generate",))
+    try:
+        llm = ai_tutor_main.LLMInterface(base_url=base_url)
+        for label, cache in [("zonder cache", False), ("met cache", True)]:
+            ai_tutor_main._endpoint_cache.clear()
+            server.requests_seen = 0
+            latencies = []
+            for _ in range(calls):
+                if not cache:
+                    ai_tutor_main._endpoint_cache.clear()
+                start = time.perf_counter()
+                llm.genereer_response("Hallo")
+                latencies.append(time.perf_counter() - start)
+            print_latency(label, latencies)
+            print(f"  {'':<28} {server.requests_seen / calls:.2f} HTTP-requests per call")
+        print(f"  health_check: {llm.health_check()}")
+    finally:
+        server.shutdown()
+
+
+# ================================================================
+#  5) Lokale nakijker: aandeel zonder LLM op een gelabeld corpus
+# ================================================================
+
+def _nakijk_corpus(rng):
+    """Gelabelde antwoorden (oefening, antwoord, verwacht oordeel) op basis van de vaste templates."""
+    from ai_tutor_main import OefeningenGenerator
+
+    generator = OefeningenGenerator()
+    oefeningen = {}
+    for _ in range(300):
+        for oef in (
+            generator.genereer_grammatica_gapfill(rng.choice(["present_simple", "present_perfect", "conditionals", "passive_voice"])),
+            generator.genereer_grammatica_meerkeuze(rng.choice(["modals", "relative_clauses"])),
+            generator.genereer_lezen_oefening(rng.choice(["hoofdgedachte", "detail", "woordbetekenis", "tekstverband", "houding"])),
+        ):
+            oefeningen.setdefault(oef.content, oef)
+
+    def tikfout(tekst):
+        # Eén letter weglaten (geen spatie of leesteken, dat is geen echte tikfout)
+        i = rng.choice([i for i in range(1, len(tekst) - 1) if tekst[i].isalpha()])
+        return tekst[:i] + tekst[i + 1:]
+
+    corpus = []
+    for oef in oefeningen.values():
+        juist = oef.juist_antwoord
+        corpus += [
+            (oef, juist, "CORRECT"),
+            (oef, f"  {juist.upper()}. ", "CORRECT"),
+            (oef, "banana", "INCORRECT"),
+        ]
+        if oef.opties:
+            index = oef.opties.index(juist)
+            fout = next(i for i in range(len(oef.opties)) if i != index)
+            corpus += [
+                (oef, str(index + 1), "CORRECT"),
+                (oef, "abcd"[index], "CORRECT"),
+                (oef, str(fout + 1), "INCORRECT"),
+                (oef, oef.opties[fout].lower(), "INCORRECT"),
+            ]
+            if len(juist) >= 12:
+                corpus.append((oef, tikfout(juist), "CORRECT"))
+        else:
+            corpus.append((oef, juist.replace("n't", " not").replace(" / ", " "), "CORRECT"))
+            if len(juist) >= 6:
+                corpus.append((oef, tikfout(juist), "BIJNA"))
+            # Echte grammaticale fouten: bewust aan de LLM overgelaten als het te dicht bij het goede antwoord ligt
+            corpus.append((oef, juist.split()[-1].rstrip("s") if juist.endswith("s") else juist + "ed", "INCORRECT"))
+    return corpus
+
+
+def bench_rule_grader(llm_delay: float = 0.8):
+    """
+    Aandeel gesloten antwoorden dat de RuleGrader zonder LLM beslist, de juistheid daarvan
+    tegen de labels, en de tijd per antwoord (lokaal versus een LLM-call van `llm_delay` s).
+    """
+    import random
+    from rule_grader import RuleGrader
+
+    corpus = _nakijk_corpus(random.Random(7))
+    print(f"\n=== Lokale nakijker: {len(corpus)} gelabelde antwoorden ===")
+
+    grader = RuleGrader()
+    goed = fout = 0
+    fouten = []
+    start = time.perf_counter()
+    for oef, antwoord, label in corpus:
+        oordeel = grader.beoordeel(antwoord, oef.juist_antwoord, oef.opties)
+        if oordeel is None:
+            continue
+        if oordeel == label:
+            goed += 1
+        else:
+            fout += 1
+            fouten.append((oef.juist_antwoord, antwoord, label, oordeel))
+    duur = time.perf_counter() - start
+
+    m = grader.metrics()
+    print(f"  lokaal beslist: {m['lokaal']} van {len(corpus)} ({m['lokaal_aandeel'] * 100:.1f}%), "
+          f"naar LLM: {m['llm']}")
+    print(f"  juist t.o.v. label: {goed}/{goed + fout}")
+    for juist, antwoord, label, oordeel in fouten[:5]:
+        print(f"    afwijkend: juist={juist!r} antwoord={antwoord!r} label={label} oordeel={oordeel}")
+    print(f"  tijd lokaal: {duur / len(corpus) * 1e6:.1f} µs per antwoord")
+    print(f"  geschatte LLM-tijd: alles via LLM {len(corpus) * llm_delay:.0f} s, "
+          f"met nakijker {m['llm'] * llm_delay:.0f} s (bij {llm_delay * 1000:.0f} ms per call)")
+
+
+# ================================================================
+#  6) submit_answer: nakijken en feedback na elkaar versus tegelijk
+# ================================================================
+
+def bench_submit_pipeline(delay: float = 0.3, rondes: int = 3):
+    """
+    Latency van ConversationManager.submit_answer per oefeningstype tegen een stub-Ollama
+    met `delay` s per LLM-call: oud gedrag (check_answer, dan generate_feedback) versus
+    de stream. Gesloten vragen krijgen hun score lokaal en de feedback start meteen; bij
+    schrijven wacht de feedback op de rubric-score, dus daar zit de winst alleen in de
+    tijd tot de eerste tekst.
+    """
+    import contextlib
+    import io
+    import ollama_client
+    from answer_checker import GAPFILL_EXERCISES, WRITING_EXERCISES, check_answer
+    from conversation_manager import ConversationManager, ExerciseState, SessionState
+    from feedback_generator import generate_feedback
+    from tutor_personalities import TutorPersonaliteiten
+
+    print(f"\n=== submit_answer: LLM-delay {delay * 1000:.0f} ms per call ===")
+    server, base_url = start_stub_ollama(delay=delay)
+    origineel = dict(ollama_client._clients)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = ollama_client.OllamaClient(base_url)
+    try:
+        tutor = TutorPersonaliteiten.meester_jan()
+        for exercise, antwoord in [
+            (GAPFILL_EXERCISES[0], "goes"),
+            (WRITING_EXERCISES[0], "Dear Mr Smith, I was ill yesterday so I could not come to school. " * 4),
+        ]:
+            oud, nieuw, eerste_score = [], [], []
+            for _ in range(rondes):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    check = check_answer(exercise, antwoord)
+                    generate_feedback(exercise, antwoord, check, tutor)
+                    oud.append(time.perf_counter() - start)
+
+                    state = SessionState(tutor=tutor)
+                    state.exercises[exercise["exercise_id"]] = ExerciseState(exercise=exercise)
+                    state.current_exercise_id = exercise["exercise_id"]
+                    start = time.perf_counter()
+                    ConversationManager(state).submit_answer(
+                        antwoord,
+                        on_event=lambda e: e["type"] == "check" and eerste_score.append(time.perf_counter() - start),
+                    )
+                    nieuw.append(time.perf_counter() - start)
+            print(f"  [{exercise['type']}]")
+            print_latency("na elkaar (oud)", oud)
+            print_latency("pipeline", nieuw)
+            print_latency("pipeline: score binnen", eerste_score)
+    finally:
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  7) Oefeningen + intro tegelijk in genereer_oefeningen_op_basis_van_keuze
+# ================================================================
+
+def bench_oefeningen_batch(delay: float = 0.4, aantallen=(3, 10, 20, 30)):
+    """
+    Latency van genereer_oefeningen_op_basis_van_keuze bij `delay` s voor de intro-call:
+    eerst de intro en dan de oefeningen (oud gedrag) versus de intro in een eigen thread
+    terwijl de oefeningen uit de sjablonen gebouwd worden. De oefeningen zelf zijn echt.
+    """
+    import ai_tutor_main
+
+    print(f"\n=== Oefeningen-batch: intro-call {delay * 1000:.0f} ms ===")
+    systeem = ai_tutor_main.AITutorSysteem()
+    systeem.llm.genereer_response = lambda prompt, temperature=0.3, site="algemeen": time.sleep(delay) or "Intro."
+
+    for aantal in aantallen:
+        start = time.perf_counter()
+        systeem.llm.genereer_response("intro", 0.6, "intro")
+        oefeningen = [taak() for taak in systeem._plan_oefeningen("grammatica", "present perfect", aantal)]
+        na_elkaar = time.perf_counter() - start
+        bouwen = na_elkaar - delay
+
+        start = time.perf_counter()
+        oefeningen, _ = systeem.genereer_oefeningen_op_basis_van_keuze("grammatica", "present perfect", aantal)
+        tegelijk = time.perf_counter() - start
+        assert len(oefeningen) == aantal
+        print(f"  aantal {aantal:>3}: bouwen {bouwen * 1000:6.2f} ms   na elkaar {na_elkaar:5.3f} s   "
+              f"intro in eigen thread {tegelijk:5.3f} s")
+
+
+# ================================================================
+#  8) Oefeningen in één batch-call versus één call per oefening
+# ================================================================
+
+def _stub_gapfill(i: int) -> dict:
+    return {
+        "type": "gapfill", "topic": "Present Perfect", "difficulty": "medium",
+        "instructions": "Vul de juiste vorm in.",
+        "content": {"sentence": f"We ___ (visit) Paris {i} times."},
+        "answer_key": {"correct_answer": "have visited"},
+        "metadata": {"theme": "travel", "explanation": "Present perfect voor ervaringen."},
+    }
+
+
+def bench_exercise_batch(n: int = 10, delay: float = 0.5, token_delay: float = 0.01):
+    """
+    generate_exercises_batch (één call, items gestreamd) versus n losse
+    generate_exercise_with_llm-calls tegen een stub-Ollama met `delay` s promptverwerking
+    per call en `token_delay` s per token. Eén item in de batch is ongeldig en wordt los
+    opnieuw gegenereerd.
+    """
+    import ollama_client
+    import exercise_generator
+
+    items = [_stub_gapfill(i) for i in range(n)]
+    items[n // 2]["content"]["sentence"] = "Deze zin heeft geen gat."
+    server, base_url = start_stub_ollama(
+        delay=delay, token_delay=token_delay,
+        antwoord=json.dumps(_stub_gapfill(0)), json_antwoord=json.dumps({"exercises": items}),
+    )
+    # Losse oefeningen en de batch sturen allebei een schema mee; aan het schema zien welke het is
+    server.RequestHandlerClass._kies_antwoord = lambda handler, body: (
+        handler.json_antwoord if "exercises" in str(body.get("format")) else handler.antwoord
+    )
+    origineel = dict(ollama_client._clients)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = ollama_client.OllamaClient(base_url)
+    print(f"\n=== Oefeningen-batch: {n} gapfills, {delay * 1000:.0f} ms per call + {token_delay * 1000:.0f} ms per token ===")
+    try:
+        for label, maak in [
+            ("los (per oefening)", lambda: (exercise_generator.generate_exercise_with_llm(
+                "grammar", "Present Perfect", "travel", exercise_type="gapfill") for _ in range(n))),
+            ("batch (gestreamd)", lambda: exercise_generator.generate_exercises_batch(
+                "grammar", "Present Perfect", "travel", n=n)),
+        ]:
+            server.requests_seen = server.prompt_chars = 0
+            start = time.perf_counter()
+            eerste = None
+            oefeningen = []
+            for oefening in maak():
+                eerste = eerste or time.perf_counter() - start
+                oefeningen.append(oefening)
+            totaal = time.perf_counter() - start
+            assert len(oefeningen) == n and all("___" in o["content"]["sentence"] for o in oefeningen)
+            print(f"  {label:<22} totaal {totaal:5.2f} s  eerste oefening {eerste:5.2f} s  "
+                  f"{server.requests_seen:>2} LLM-calls  {server.prompt_chars:>6} prompt-tekens")
+    finally:
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  9) Streaming JSON-parser versus de oude extractors
+# ================================================================
+
+# Kopieën van de extractors zoals ze vóór json_stream.py in de code stonden
+def _legacy_extract_json_from_text(text: str) -> dict:
+    import json as _json
+    if "```" in text:
+        parts = text.split("```")
+        candidate = ""
+        for part in parts:
+            if "{" in part and "}" in part:
+                candidate = part
+                break
+        if candidate:
+            text = candidate
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end == -1 or end <= start:
+        raise ValueError("Kon geen JSON-object vinden in LLM-output.")
+    return _json.loads(text[start:end + 1])
+
+
+def _legacy_extract_json_from_llm_response(response: str) -> dict:
+    import re
+    if "```json" in response:
+        matches = re.findall(r"```json\s*(.*?)\s*```", response, re.DOTALL)
+        if matches:
+            response = matches[0]
+    elif "```" in response:
+        matches = re.findall(r"```\s*(.*?)\s*```", response, re.DOTALL)
+        if matches:
+            response = matches[0]
+    start = response.find("{")
+    end = response.rfind("}")
+    if start == -1 or end == -1 or end <= start:
+        raise ValueError("Geen JSON-object gevonden in LLM-output.")
+    json_str = response[start:end + 1]
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        pass
+    if '\\"' in json_str:
+        try:
+            return json.loads(json_str.replace('\\"', '"'))
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(json_str.replace("'", '"'))
+    except json.JSONDecodeError:
+        pass
+    raise ValueError("JSON parsing volledig mislukt (handmatige extractie)")
+
+
+def _legacy_extract_and_parse_json(text):
+    import re
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    try:
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+    except Exception:
+        pass
+    return None
+
+
+_VOORBEELD_OEFENING = {
+    "type": "multiple_choice",
+    "question": "Which sentence is in the present perfect?",
+    "options": ["I eat breakfast.", "I have eaten breakfast.", "I will eat breakfast.", "I am eating."],
+    "correct_answer": "I have eaten breakfast.",
+    "explanation": "Have + voltooid deelwoord.",
+}
+
+
+def _json_corpus():
+    """(label, LLM-output, verwachte waarde): varianten zoals Mistral/GPT ze in de praktijk teruggeven."""
+    ex = _VOORBEELD_OEFENING
+    schoon = json.dumps(ex, ensure_ascii=False)
+    mooi = json.dumps(ex, ensure_ascii=False, indent=2)
+    enkele_quotes = (
+        "{'type': 'multiple_choice', 'question': 'Which sentence is in the present perfect?', "
+        "'options': ['I eat breakfast.', 'I have eaten breakfast.', 'I will eat breakfast.', 'I am eating.'], "
+        "'correct_answer': 'I have eaten breakfast.', 'explanation': 'Have + voltooid deelwoord.'}"
+    )
+    return [
+        ("schoon", schoon, ex),
+        ("proza + fence", f"Sure! Here is your exercise:\n```json\n{mooi}\n```\nGood luck!", ex),
+        ("fence zonder taal", f"```\n{mooi}\n```", ex),
+        ("trailing comma", mooi.replace('"explanation"', '"explanation"').replace("\n}", ",\n}"), ex),
+        ("enkele quotes", enkele_quotes, ex),
+        ("escaped quotes", schoon.replace('"', '\\"'), ex),
+        ("commentaar", mooi.replace('"type": "multiple_choice",', '"type": "multiple_choice",  // type oefening'), ex),
+        ("python literals", '{"overall_score": 0.8, "passed": True, "notes": None}', {"overall_score": 0.8, "passed": True, "notes": None}),
+        ("quotes in tekst", '{"question": "She said "hello" to me.", "answer": "said"}', {"question": 'She said "hello" to me.', "answer": "said"}),
+        ("ontbrekende komma", '{"result": "correct"\n "overall_score": 0.9}', {"result": "correct", "overall_score": 0.9}),
+        ("afgekapt", mooi[:-40], None),
+        ("twee objecten", schoon + "\n\nAlternative:\n" + schoon, ex),
+        ("witruimte na json", schoon + "\n" * 40, ex),
+        ("apostrof in enkele quotes", "{'question': 'What's the answer?', 'answer': 'it's'}", {"question": "What's the answer?", "answer": "it's"}),
+    ]
+
+
+def bench_json_stream(herhalingen: int = 300):
+    """
+    Slagingspercentage en parse-tijd op een corpus van typische (kapotte) LLM-outputs:
+    de drie oude extractors versus json_stream, plus het moment waarop de vraag beschikbaar is
+    bij streamen (fractie van de output die binnen moet zijn).
+    """
+    import contextlib
+    import io
+    from json_stream import StreamingJSONParser, parse_json
+
+    corpus = _json_corpus()
+    print(f"\n=== Streaming JSON-parser: {len(corpus)} soorten LLM-output ===")
+
+    def klopt(label, resultaat, verwacht):
+        if verwacht is None:  # afgekapt: de velden die er wél waren moeten kloppen
+            return isinstance(resultaat, dict) and resultaat.get("question") == _VOORBEELD_OEFENING["question"]
+        return resultaat == verwacht
+
+    parsers = [
+        ("extract_json_from_text (oud)", _legacy_extract_json_from_text),
+        ("extract_json_from_llm_response (oud)", _legacy_extract_json_from_llm_response),
+        ("extract_and_parse_json (oud)", _legacy_extract_and_parse_json),
+        ("json_stream.parse_json", parse_json),
+    ]
+    for naam, functie in parsers:
+        gelukt, mislukt = 0, []
+        start = time.perf_counter()
+        for label, tekst, verwacht in corpus:
+            for i in range(herhalingen):
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        resultaat = functie(tekst)
+                except Exception:
+                    resultaat = None
+                if i == 0:
+                    if klopt(label, resultaat, verwacht):
+                        gelukt += 1
+                    else:
+                        mislukt.append(label)
+        duur = (time.perf_counter() - start) / (herhalingen * len(corpus))
+        print(f"  {naam:<38} {gelukt:>2}/{len(corpus)} goed   {duur * 1e6:6.1f} µs per output")
+        if mislukt:
+            print(f"  {'':<38} mis: {', '.join(mislukt)}")
+
+    # Wanneer is de vraag beschikbaar bij streamen (in tokens van ~4 tekens)?
+    tekst = f"Sure! Here is your exercise:\n```json\n{json.dumps(_VOORBEELD_OEFENING, ensure_ascii=False, indent=2)}\n```"
+    chunks = [tekst[i:i + 4] for i in range(0, len(tekst), 4)]
+    parser = StreamingJSONParser(start_chars="{")
+    for n, chunk in enumerate(chunks, 1):
+        if any(path == ("question",) for path, _ in parser.feed(chunk)):
+            print(f"  vraag beschikbaar na {n}/{len(chunks)} chunks ({n / len(chunks) * 100:.0f}% van de output); "
+                  f"oude extractors: na 100%")
+            break
+
+
+# ================================================================
+#  10) Fuzz: afgekapte en verminkte LLM-output bij check_writing
+# ================================================================
+
+def _verminkingen(rng, tekst: str, aantal: int):
+    """Afgekapte, verminkte en opgeblazen varianten van een LLM-antwoord."""
+    for _ in range(aantal):
+        soort = rng.randrange(5)
+        if soort == 0:
+            yield tekst[:rng.randrange(len(tekst))]
+        elif soort == 1:
+            tekens = list(tekst)
+            for _ in range(rng.randint(1, 8)):
+                tekens[rng.randrange(len(tekens))] = rng.choice("{}[]\"',:\\ x9.\n")
+            yield "".join(tekens)
+        elif soort == 2:
+            tekens = list(tekst)
+            for _ in range(rng.randint(1, 8)):
+                del tekens[rng.randrange(len(tekens))]
+            yield "".join(tekens)
+        elif soort == 3:
+            yield "".join(rng.choice("{}[]\"':, abc0.5\n\\") for _ in range(rng.randint(0, 400)))
+        else:
+            yield rng.choice(["[" * 50_000, '"result": "' * 20_000, "{" + '"a": {' * 10_000, "x" * 200_000])
+
+
+def bench_fuzz_writing(aantal: int = 2000, via_check: int = 60):
+    """
+    Voert verminkte beoordelings-JSON aan extract_json_from_llm_response (direct) en aan
+    check_writing (via een stub-Ollama). Elk resultaat moet een geldige score (0..1) en een
+    geldig result hebben; de traagste parse laat zien dat niets kwadratisch of recursief ontploft.
+    """
+    import contextlib
+    import io
+    import random
+    import ollama_client
+    from answer_checker import WRITING_EXERCISES, WRITING_RESULTS, check_writing, extract_json_from_llm_response
+
+    print(f"\n=== Fuzz schrijf-beoordeling: {aantal} verminkte antwoorden ===")
+    rng = random.Random(15)
+    basis = json.dumps({
+        "overall_score": 0.72, "result": "almost",
+        "criteria": {"structure": 0.8, "content": 0.7, "language": 0.65},
+        "error_types": ["grammar", "spelling"], "comments": "Let op de tijden.",
+    }, indent=2)
+
+    def geldig(r):
+        return (r["result"] in WRITING_RESULTS and 0.0 <= r["overall_score"] <= 1.0
+                and all(0.0 <= v <= 1.0 for v in r["criteria"].values()))
+
+    fouten, traagste, duren = [], 0.0, []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tekst in _verminkingen(rng, basis, aantal):
+            start = time.perf_counter()
+            try:
+                ok = geldig(extract_json_from_llm_response(tekst))
+            except Exception as e:
+                ok = False
+                tekst = f"{type(e).__name__}: {tekst[:60]!r}"
+            duur = time.perf_counter() - start
+            duren.append(duur)
+            traagste = max(traagste, duur)
+            if not ok:
+                fouten.append(tekst[:80])
+    print(f"  extract_json_from_llm_response  {aantal - len(fouten)}/{aantal} geldig   "
+          f"p50={percentiel(duren, 50) * 1e6:.0f} µs  traagste={traagste * 1000:.1f} ms")
+    for f in fouten[:5]:
+        print(f"    fout bij: {f!r}")
+
+    server, base_url = start_stub_ollama()
+    # call_ollama stopt met lezen zodra het object compleet is; de reset die dat geeft is verwacht
+    server.handle_error = lambda request, client_address: None
+    origineel = dict(ollama_client._clients)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = ollama_client.OllamaClient(base_url)
+    try:
+        exercise = WRITING_EXERCISES[0]
+        goed = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tekst in _verminkingen(rng, basis, via_check):
+                server.RequestHandlerClass.json_antwoord = tekst or " "
+                resultaat = check_writing(exercise, "Dear Sir, I could not come to school yesterday. " * 3)
+                goed += resultaat["result"] in WRITING_RESULTS and 0.0 <= resultaat["score"] <= 1.0
+        print(f"  check_writing via stub-Ollama   {goed}/{via_check} geldig")
+    finally:
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  11) Structured output: parse-resultaten met en zonder JSON-schema
+# ================================================================
+
+_GELDIGE_GAPFILL = {
+    "exercise_id": "ex_1", "type": "gapfill", "topic": "Present Simple", "difficulty": "medium",
+    "instructions": "Vul de juiste vorm in.", "content": {"sentence": "She ___ (work) at school."},
+    "answer_key": {"correct_answer": "works"}, "metadata": {"theme": "school", "explanation": "He/she/it + s."},
+}
+_GELDIGE_SCORE = {
+    "overall_score": 0.72, "result": "almost",
+    "criteria": {"structure": 0.8, "content": 0.7, "language": 0.65}, "error_types": ["grammar"],
+}
+
+
+def _vrije_varianten(data: dict):
+    """Foutpatronen zoals Mistral ze zonder schema (alleen format=json of een prompt-instructie) teruggeeft."""
+    schoon = json.dumps(data, ensure_ascii=False)
+    zonder_laatste = dict(list(data.items())[:-1])
+    als_tekst = {k: str(v) if isinstance(v, (int, float)) else v for k, v in data.items()}
+    return [
+        schoon,
+        schoon,
+        f"Here is the JSON:\n```json\n{json.dumps(data, indent=2)}\n```",
+        json.dumps(data, indent=2).replace("\n}", ",\n}"),
+        json.dumps(zonder_laatste),
+        json.dumps(als_tekst),
+        json.dumps({**data, "note": "extra veld"}),
+        str(data),  # Python-dict: enkele quotes
+    ]
+
+
+def bench_structured_output(rondes: int = 40):
+    """
+    Hoe vaak parsen direct lukt, gerepareerd moet worden of niet aan het schema voldoet: zonder
+    schema (LLM_STRUCTURED_OUTPUT=0) versus met schema in `format`. De stub bootst constrained
+    decoding na: met een schema komt er altijd schema-conforme JSON terug, zonder schema een
+    mix van de foutpatronen hierboven. Telt ook hoeveel oefeningen daarna bruikbaar zijn.
+    """
+    import contextlib
+    import io
+    import itertools
+    import json_schemas
+    import ollama_client
+    from answer_checker import llm_score_writing
+    from exercise_generator import generate_exercise_with_llm, validate_exercise
+
+    print(f"\n=== Structured output: {rondes} oefeningen + {rondes} beoordelingen per modus ===")
+    server, base_url = start_stub_ollama()
+    server.handle_error = lambda request, client_address: None
+    vrij = {
+        "gapfill": itertools.cycle(_vrije_varianten(_GELDIGE_GAPFILL)),
+        "score": itertools.cycle(_vrije_varianten(_GELDIGE_SCORE)),
+    }
+
+    def kies_antwoord(handler, body):
+        soort = "gapfill" if "gapfill" in body.get("prompt", "") else "score"
+        if isinstance(body.get("format"), dict):
+            return json.dumps(_GELDIGE_GAPFILL if soort == "gapfill" else _GELDIGE_SCORE)
+        return next(vrij[soort])
+
+    server.RequestHandlerClass._kies_antwoord = kies_antwoord
+    origineel = dict(ollama_client._clients)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = ollama_client.OllamaClient(base_url)
+    origineel_modus = json_schemas.STRUCTURED_OUTPUT
+    json_schemas.parse_stats.reset()
+    try:
+        for modus in (False, True):
+            json_schemas.STRUCTURED_OUTPUT = modus
+            bruikbaar = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(rondes):
+                    try:
+                        oefening = generate_exercise_with_llm("grammar", "Present Simple", "school", "medium", "gapfill")
+                        bruikbaar += not validate_exercise(oefening, "gapfill")
+                    except Exception:
+                        pass
+                    llm_score_writing("Write an email.", {"structure": "..."}, "Dear Sir, ...")
+            print(f"  {'met schema' if modus else 'zonder schema':<14} bruikbare oefeningen: {bruikbaar}/{rondes}")
+        for naam, m in json_schemas.parse_stats.metrics().items():
+            print(f"    {naam:<24} direct {m['direct']:>3}  hersteld {m['hersteld']:>3}  "
+                  f"ongeldig {m['ongeldig']:>3}  mislukt {m['mislukt']:>3}  ({m['direct_aandeel'] * 100:.0f}% direct)")
+    finally:
+        json_schemas.STRUCTURED_OUTPUT = origineel_modus
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  12) LLM-cache: herhaalde prompts in een klas vol sessies
+# ================================================================
+
+def bench_llm_cache(sessies: int = 30, delay: float = 0.05):
+    """
+    Een klas van `sessies` leerlingen doorloopt dezelfde stappen als in de CLI: begroeting,
+    verduidelijkingsvraag, uitleg over een grammatica-onderwerp en feedback op een fout
+    antwoord. Zonder cache versus met LRU-cache, en daarna een "herstart" die alleen de
+    SQLite-laag nog heeft. Toont hit rates per aanroepplek.
+    """
+    import contextlib
+    import io
+    import os.path
+    import random
+    import tempfile
+    import ai_tutor_main
+    import llm_cache
+
+    print(f"\n=== LLM-cache: {sessies} sessies, {delay * 1000:.0f} ms per LLM-call ===")
+    server, base_url = start_stub_ollama(delay=delay)
+    rng = random.Random(17)
+    categorieen = ["grammatica", "lezen", "schrijven"]
+    keuzes = ["uitleg over de present perfect", "leg uit: conditionals", "uitleg passive voice"]
+    oefening = ai_tutor_main.Oefening(
+        type=ai_tutor_main.OefeningType.GRAMMATICA_GAPFILL,
+        moeilijkheid=ai_tutor_main.Moeilijkheidsgraad.MAKKELIJK,
+        onderwerp="present_simple", instructie="Vul in.",
+        content="She ___ (work) at a hospital every day.", juist_antwoord="works",
+    )
+    foute_antwoorden = ["work", "working", "worked"]
+
+    def klas():
+        systeem = ai_tutor_main.AITutorSysteem()
+        systeem.llm = ai_tutor_main.LLMInterface(base_url=base_url)
+        systeem.feedback_gen.llm = systeem.llm
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(sessies):
+                systeem.start_sessie()
+                categorie = rng.choice(categorieen)
+                systeem.genereer_verduidelijkingsvraag(categorie)
+                systeem.genereer_uitleg("grammatica", rng.choice(keuzes))
+                systeem.feedback_gen.genereer_feedback(oefening, rng.choice(foute_antwoorden), False)
+        return time.perf_counter() - start, systeem.llm.cache.metrics()
+
+    origineel = llm_cache._cache
+    with tempfile.TemporaryDirectory() as tmp:
+        pad = os.path.join(tmp, "llm_cache.db")
+        try:
+            for label, cache in [
+                ("zonder cache", llm_cache.LLMCache(max_entries=0)),
+                ("LRU + SQLite", llm_cache.LLMCache(sqlite_path=pad)),
+                ("na herstart (SQLite)", llm_cache.LLMCache(sqlite_path=pad)),
+            ]:
+                llm_cache._cache = cache
+                server.requests_seen = 0
+                duur, metrics = klas()
+                print(f"  {label:<22} {duur:5.2f} s  {server.requests_seen:>3} LLM-calls")
+                for site, m in metrics["sites"].items():
+                    if label != "zonder cache":
+                        print(f"    {site:<22} hits {m['hits']:>3}  disk {m['disk_hits']:>3}  "
+                              f"misses {m['misses']:>3}  hit rate {m['hit_rate'] * 100:3.0f}%")
+        finally:
+            llm_cache._cache = origineel
+            server.shutdown()
+
+
+# ================================================================
+#  13) Feedback-templates voor gesloten vragen met een vast oordeel
+# ================================================================
+
+def bench_feedback_templates(leerlingen: int = 30, delay: float = 0.1):
+    """
+    Een klas maakt dezelfde vijf gap-fill templates; de meeste antwoorden zijn goed of een
+    veelgemaakte fout. Feedback-latency en LLM-calls (voorgrond + achtergrond) zonder en met
+    feedback-templates; de lokale nakijker beslist, de LLM-cache staat uit.
+    """
+    import contextlib
+    import io
+    import random
+    import ai_tutor_main
+    import feedback_templates
+
+    print(f"\n=== Feedback-templates: {leerlingen} leerlingen x 5 oefeningen, {delay * 1000:.0f} ms per LLM-call ===")
+    server, base_url = start_stub_ollama(delay=delay)
+    generator = ai_tutor_main.OefeningenGenerator()
+    rng = random.Random(18)
+    oefeningen = [generator.genereer_grammatica_gapfill("present_simple") for _ in range(5)]
+    fouten = {o.id: [o.juist_antwoord.split()[0] + "s", "is " + o.juist_antwoord] for o in oefeningen}
+
+    def antwoord(oefening):
+        kans = rng.random()
+        if kans < 0.6:
+            return rng.choice([oefening.juist_antwoord, oefening.juist_antwoord.upper()])
+        if kans < 0.9:
+            return rng.choice(fouten[oefening.id])
+        return f"iets anders {rng.randrange(1000)}"  # fout antwoord dat nog niemand gaf
+
+    origineel = feedback_templates._templates
+    try:
+        for label, templates in [
+            ("zonder templates", feedback_templates.FeedbackTemplateCache(varianten=0)),
+            ("met templates", feedback_templates.FeedbackTemplateCache(varianten=3)),
+        ]:
+            feedback_templates._templates = templates
+            systeem = ai_tutor_main.AITutorSysteem()
+            systeem.llm = ai_tutor_main.LLMInterface(base_url=base_url)
+            systeem.feedback_gen = ai_tutor_main.FeedbackGenerator(systeem.tutor, systeem.llm)
+            server.requests_seen = 0
+            latencies = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(leerlingen):
+                    for oefening in oefeningen:
+                        start = time.perf_counter()
+                        systeem.controleer_antwoord(oefening, antwoord(oefening))
+                        latencies.append(time.perf_counter() - start)
+            while templates.metrics()["bezig"]:
+                time.sleep(0.05)
+            m = templates.metrics()
+            print_latency(label, latencies)
+            print(f"  {'':<28} {server.requests_seen} LLM-calls (waarvan {m['achtergrond']} op de achtergrond), "
+                  f"hit rate {m['hit_rate'] * 100:.0f}%, {m['formuleringen']} formuleringen")
+    finally:
+        feedback_templates._templates = origineel
+        server.shutdown()
+
+
+# ================================================================
+#  14) Oefeningenbank: opzoeken in plaats van templates opnieuw opbouwen
+# ================================================================
+
+def _school_items(aantal: int) -> list:
+    onderwerpen = ["present_simple", "past_simple", "present_perfect", "conditionals", "passive_voice", "modals"]
+    items = []
+    for i in range(aantal):
+        onderwerp = onderwerpen[i % len(onderwerpen)]
+        if i % 2:
+            items.append({"soort": "meerkeuze", "onderwerp": onderwerp, "moeilijkheid": 1 + i % 3,
+                          "vraag": f"Question {i}: she ___ here.", "opties": ["is", "are", "be", "am"],
+                          "antwoord": "is", "uitleg": "He/she/it + is."})
+        else:
+            items.append({"soort": "gapfill", "onderwerp": onderwerp, "moeilijkheid": 1 + i % 3,
+                          "vraag": f"Sentence {i}: he ___ (go) to school.", "antwoord": "goes",
+                          "uitleg": "Present Simple: bij he/she/it voeg je -s toe."})
+    return items
+
+
+def bench_exercise_bank(calls: int = 5000, school_items=(0, 1000, 20000)):
+    """
+    Tijd per gegenereerde oefening: templates per call opnieuw opbouwen (oud gedrag, hier
+    nagebootst door de dict van alle items van die soort per call te maken) versus de
+    geïndexeerde oefeningenbank, met 0 tot 20.000 extra schoolitems uit een JSON-bestand.
+    """
+    import random
+    import tempfile
+    import ai_tutor_main
+    import exercise_bank
+
+    print(f"\n=== Oefeningenbank: {calls} oefeningen per meting ===")
+    rng = random.Random(19)
+    origineel = exercise_bank._bank
+    try:
+        for extra in school_items:
+            with tempfile.TemporaryDirectory() as map_:
+                pad = os.path.join(map_, "school.json")
+                with open(pad, "w", encoding="utf-8") as f:
+                    json.dump({"items": _school_items(extra)}, f)
+                start = time.perf_counter()
+                bank = exercise_bank.ExerciseBank.laad([pad])
+                laadtijd = time.perf_counter() - start
+            exercise_bank._bank = bank
+            generator = ai_tutor_main.OefeningenGenerator()
+            onderwerpen = list(generator.grammatica_onderwerpen)
+
+            def opnieuw_opbouwen(onderwerp):
+                templates = {}
+                for item in bank.items("gapfill"):
+                    templates.setdefault(item.onderwerp, []).append(item)
+                if onderwerp not in templates:
+                    onderwerp = rng.choice(list(templates))
+                item = rng.choice(templates[onderwerp])
+                info = generator._info(item)
+                return generator._oefening(item, ai_tutor_main.OefeningType.GRAMMATICA_GAPFILL,
+                                           info["moeilijkheid"], info["naam"], "Vul in.")
+
+            resultaten = []
+            for functie in (opnieuw_opbouwen, generator.genereer_grammatica_gapfill):
+                start = time.perf_counter()
+                for _ in range(calls):
+                    functie(rng.choice(onderwerpen))
+                resultaten.append((time.perf_counter() - start) / calls * 1e6)
+            print(f"  {bank.metrics()['items']:>6} items (laden {laadtijd * 1000:6.1f} ms): "
+                  f"opnieuw opbouwen {resultaten[0]:9.1f} us   bank {resultaten[1]:6.1f} us per oefening")
+    finally:
+        exercise_bank._bank = origineel
+
+
+# ================================================================
+#  15) Voortgang: tellers in SQLite in plaats van de geschiedenis scannen
+# ================================================================
+
+class _LegacyProgressTracker:
+    """ProgressTracker zoals hij was: lijst in het geheugen, statistieken door alles te scannen."""
+
+    def __init__(self):
+        self.geschiedenis = []
+        self.fouten_per_onderwerp = {}
+
+    def registreer(self, onderwerp: str, is_correct: bool):
+        self.geschiedenis.append({"onderwerp": onderwerp, "correct": is_correct})
+        if not is_correct:
+            self.fouten_per_onderwerp[onderwerp] = self.fouten_per_onderwerp.get(onderwerp, 0) + 1
+
+    def get_statistieken(self):
+        totaal = len(self.geschiedenis)
+        correct = sum(1 for item in self.geschiedenis if item["correct"])
+        return {"totaal": totaal, "correct": correct, "percentage": round((correct / totaal) * 100, 1)}
+
+    def get_zwakke_punten(self):
+        gesorteerd = sorted(self.fouten_per_onderwerp.items(), key=lambda x: x[1], reverse=True)
+        return [onderwerp for onderwerp, _ in gesorteerd[:3]]
+
+
+def bench_progress_store(pogingen=(1000, 10000, 100000), leerlingen: int = 5000, opvragingen: int = 200):
+    """
+    get_statistieken + get_zwakke_punten bij een groeiende geschiedenis: oude tracker (scan over
+    de lijst) versus ProgressStore (tellers in SQLite-bestand). Daarna: schrijfkosten per poging,
+    een herstart, en een export van `leerlingen` leerlingen voor een docenten-dashboard.
+    """
+    import random
+    import tempfile
+    import progress_store
+
+    print(f"\n=== Voortgang: statistieken bij een groeiende geschiedenis ({opvragingen} opvragingen) ===")
+    rng = random.Random(20)
+    onderwerpen = ["Present Simple", "Past Simple", "Present Perfect", "Conditionals", "Passive Voice", "Modals"]
+    with tempfile.TemporaryDirectory() as map_:
+        pad = os.path.join(map_, "voortgang.db")
+        store = progress_store.ProgressStore(pad)
+        oud = _LegacyProgressTracker()
+        geregistreerd, schrijftijd = 0, 0.0
+        for doel in pogingen:
+            rijen = [(rng.choice(onderwerpen), rng.random() < 0.7) for _ in range(doel - geregistreerd)]
+            for onderwerp, correct in rijen:
+                oud.registreer(onderwerp, correct)
+            start = time.perf_counter()
+            for onderwerp, correct in rijen:
+                store.registreer("leerling_1", "grammatica_gapfill", onderwerp, correct, "antwoord")
+            schrijftijd += time.perf_counter() - start
+            geregistreerd = doel
+
+            resultaten = []
+            for opvragen in (lambda: (oud.get_statistieken(), oud.get_zwakke_punten()),
+                             lambda: (store.statistieken("leerling_1"), store.zwakke_punten("leerling_1"))):
+                start = time.perf_counter()
+                for _ in range(opvragingen):
+                    uitkomst = opvragen()
+                resultaten.append((time.perf_counter() - start) / opvragingen * 1e6)
+            assert uitkomst[0] == oud.get_statistieken()
+            print(f"  {doel:>7} pogingen: lijst scannen {resultaten[0]:9.1f} us   SQLite-tellers {resultaten[1]:6.1f} us")
+        print(f"  schrijven: {schrijftijd / geregistreerd * 1e6:.1f} us per poging (log + tellers, één transactie)")
+
+        start = time.perf_counter()
+        herstart = progress_store.ProgressStore(pad)
+        stats = herstart.statistieken("leerling_1")
+        print(f"  na herstart: {stats['totaal']} pogingen terug in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        for i in range(leerlingen):
+            for _ in range(5):
+                herstart.registreer(f"leerling_{i:05d}", "lezen_detail", rng.choice(onderwerpen), rng.random() < 0.6, "a")
+        start = time.perf_counter()
+        aantal = herstart.schrijf_csv(os.path.join(map_, "klas.csv"))
+        print(f"  export: {aantal} leerlingen naar CSV in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+# ================================================================
+#  16) Router over meerdere Ollama-servers
+# ================================================================
+
+def bench_llm_router(backends: int = 3, leerlingen: int = 48, beurten: int = 4, delay: float = 0.1,
+                     capacity: int = 2):
+    """
+    Een klas stuurt tegelijk chatbeurten (per leerling een eigen vast promptbegin). Elke stub-server
+    doet `capacity` generaties tegelijk en rekent een al geziene promptprefix als KV-cache-hit
+    (30% van de tijd). Eén server versus de router (least outstanding), met en zonder sticky
+    sessies; daarna valt één server uit tijdens de run.
+    """
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_router import LLMRouter
+    from ollama_client import OllamaClient
+
+    print(f"\n=== LLM-router: {leerlingen} leerlingen x {beurten} beurten, {backends} servers "
+          f"(capaciteit {capacity}, {delay * 1000:.0f} ms per call) ===")
+
+    def meet(label, client, servers, sticky: bool, na_start=None):
+        for server in servers:
+            server.requests_seen = server.kv_hits = 0
+            server.kv_prefixen.clear()
+        latencies, fouten = [], []
+
+        def leerling(i):
+            rng = random.Random(i)
+            prefix = f"[leerling {i:03d}] " + "systeemprompt en eerdere beurten " * 4
+            for beurt in range(beurten):
+                time.sleep(rng.uniform(0, delay * 6))  # leerling leest en typt
+                start = time.perf_counter()
+                try:
+                    client.generate(prefix + f"vraag {beurt}", session_id=f"sessie_{i}" if sticky else None)
+                except Exception as e:
+                    fouten.append(e)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=leerlingen) as pool:
+            futures = [pool.submit(leerling, i) for i in range(leerlingen)]
+            if na_start is not None:
+                time.sleep(delay * 2)
+                na_start()
+            for f in futures:
+                f.result()
+        totaal = time.perf_counter() - start
+        kv = sum(s.kv_hits for s in servers) / max(1, leerlingen * beurten)
+        print_latency(label, latencies)
+        print(f"  {'':<28} totaal {totaal:5.2f} s, KV-prefix hits {kv * 100:3.0f}%, fouten {len(fouten)}, "
+              f"per server {[s.requests_seen for s in servers]}")
+        if fouten:
+            print(f"  {'':<28} eerste fout: {fouten[0]!r:.120}")
+
+    servers = [start_stub_ollama(delay=delay, capacity=capacity, kv_prefix=40) for _ in range(backends)]
+    urls = [url for _, url in servers]
+    servers = [server for server, _ in servers]
+    try:
+        meet("1 server", OllamaClient(base_url=urls[0]), servers[:1], sticky=False)
+        for sticky in (False, True):
+            router = LLMRouter([(url, capacity) for url in urls], health_interval=0, sticky_wacht=delay)
+            meet(f"router{' + sticky' if sticky else ''}", router, servers, sticky)
+            router.close()
+
+        # Uitval: halverwege gaat de laatste server uit; calls moeten naar de andere
+        router = LLMRouter([(url, capacity) for url in urls], health_interval=0, sticky_wacht=delay)
+
+        def uitval():
+            servers[-1].uitgevallen = True
+
+        meet("router, 1 server valt uit", router, servers, sticky=True, na_start=uitval)
+        m = router.metrics()
+        print(f"  {'':<28} failovers {m['failovers']}, sticky verhuisd {m['sticky_verhuisd']}, "
+              f"gezond {[b['healthy'] for b in m['backends']]}")
+        router.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+# ================================================================
+#  17) Identieke prompts die tegelijk lopen samenvoegen (single-flight)
+# ================================================================
+
+def bench_coalescing(leerlingen: int = 30, delay: float = 0.3, capacity: int = 4):
+    """
+    Een klas opent tegelijk dezelfde les: start_sessie, verduidelijkingsvraag en de intro bij
+    de oefeningen, allemaal met dezelfde prompt; de server doet `capacity` generaties tegelijk.
+    Upstream-calls en latency zonder samenvoegen,
+    met alleen de cache (helpt niet: alles loopt tegelijk) en met single-flight.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import ai_tutor_main
+    import llm_cache
+
+    print(f"\n=== Single-flight: {leerlingen} leerlingen openen tegelijk dezelfde les, "
+          f"{delay * 1000:.0f} ms per LLM-call, {capacity} tegelijk ===")
+    server, base_url = start_stub_ollama(delay=delay, capacity=capacity)
+    origineel = llm_cache._cache
+    try:
+        for label, cache in [
+            ("zonder samenvoegen", llm_cache.LLMCache(max_entries=0, coalesce=False)),
+            ("alleen cache", llm_cache.LLMCache(max_entries=1000, coalesce=False)),
+            ("single-flight", llm_cache.LLMCache(max_entries=0, coalesce=True)),
+        ]:
+            llm_cache._cache = cache
+            systemen = []
+            for _ in range(leerlingen):
+                systeem = ai_tutor_main.AITutorSysteem()
+                systeem.llm = ai_tutor_main.LLMInterface(base_url=base_url)
+                systeem.feedback_gen = ai_tutor_main.FeedbackGenerator(systeem.tutor, systeem.llm)
+                systemen.append(systeem)
+            server.requests_seen = 0
+            latencies = []
+
+            def les(systeem):
+                start = time.perf_counter()
+                systeem.start_sessie()
+                systeem.genereer_verduidelijkingsvraag("grammatica")
+                systeem.genereer_oefeningen_op_basis_van_keuze("grammatica", "present perfect oefenen", aantal=2)
+                latencies.append(time.perf_counter() - start)
+
+            with ThreadPoolExecutor(max_workers=leerlingen) as pool:
+                list(pool.map(les, systemen))
+            print_latency(label, latencies)
+            print(f"  {'':<28} {server.requests_seen} upstream-calls, {cache.metrics()['coalesced']} gedeeld")
+    finally:
+        llm_cache._cache = origineel
+        server.shutdown()
+
+
+# ================================================================
+#  18) Planner: chat voor nakijken voor prefetch, 429 bij een volle wachtrij
+# ================================================================
+
+def bench_llm_scheduler(leerlingen: int = 6, berichten: int = 3, nakijken: int = 16, prefetch: int = 24,
+                        delay: float = 0.2, capacity: int = 4):
+    """
+    Een server met `capacity` plekken krijgt tegelijk `prefetch` oefeningen voor de voorraad en
+    `nakijken` schrijfopdrachten; intussen sturen `leerlingen` elk `berichten` chatberichten.
+    Zonder planner sluit een chatbericht achter al het achtergrondwerk aan; met planner gaat
+    chat voor, dan nakijken, en vervalt prefetch dat te lang wacht. Daarna een piek van
+    chatberichten tegen een kleine wachtrij: wat niet past krijgt direct "te druk".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import answer_checker
+    import exercise_generator
+    import llm_scheduler
+    import ollama_client
+    import tutor_personalities
+    from llm_scheduler import INTERACTIEF, PREFETCH, Bezet, LLMScheduler, als
+
+    print(f"\n=== Planner: {prefetch} prefetch + {nakijken} nakijken tegelijk, {leerlingen} leerlingen "
+          f"chatten ({capacity} plekken, {delay * 1000:.0f} ms per call) ===")
+    server, base_url = start_stub_ollama(delay=delay, capacity=capacity)
+    origineel = dict(ollama_client._clients)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = ollama_client.OllamaClient(base_url)
+    origineel_scheduler = llm_scheduler._scheduler
+
+    def voorraad(i):
+        with als(PREFETCH):
+            try:
+                exercise_generator.call_ollama(f"Maak oefening {i} voor de voorraad.")
+            except Bezet:
+                pass
+
+    def nakijk(i, tijden):
+        start = time.perf_counter()
+        answer_checker.call_ollama(f"Beoordeel schrijfopdracht {i}.", site="nakijken")
+        tijden.append(time.perf_counter() - start)
+
+    def chat(leerling, tijden):
+        time.sleep(0.1)  # het achtergrondwerk staat al in de rij
+        for j in range(berichten):
+            start = time.perf_counter()
+            tutor_personalities.call_ollama(f"Leerling {leerling} vraagt {j}.", site="chat", session_id=f"l{leerling}")
+            tijden.append(time.perf_counter() - start)
+            time.sleep(0.3)  # leestijd
+
+    try:
+        for label, scheduler in [
+            ("zonder planner", LLMScheduler(max_gelijktijdig=1000)),
+            ("met planner", LLMScheduler(max_gelijktijdig=capacity, deadlines={PREFETCH: 2.0})),
+        ]:
+            llm_scheduler._scheduler = scheduler
+            chat_tijden, nakijk_tijden = [], []
+            with ThreadPoolExecutor(max_workers=prefetch + nakijken + leerlingen) as pool:
+                taken = [pool.submit(voorraad, i) for i in range(prefetch)]
+                taken += [pool.submit(nakijk, i, nakijk_tijden) for i in range(nakijken)]
+                taken += [pool.submit(chat, i, chat_tijden) for i in range(leerlingen)]
+                for taak in taken:
+                    taak.result()
+            print_latency(f"{label}: chat", chat_tijden)
+            print_latency(f"{label}: nakijken", nakijk_tijden)
+            verlopen = scheduler.metrics()["klassen"][PREFETCH]["verlopen"]
+            print(f"  {'':<28} prefetch vervallen na de deadline: {verlopen}/{prefetch}")
+
+        # Piek: iedereen tegelijk, maar maximaal 8 wachtenden
+        scheduler = LLMScheduler(max_gelijktijdig=capacity, max_wachtrij={INTERACTIEF: 8})
+        client = ollama_client.get_client()
+        geweigerd, weiger_tijden = [], []
+
+        def piek(i):
+            start = time.perf_counter()
+            try:
+                with scheduler.slot(INTERACTIEF, f"p{i}"):
+                    client.generate(f"Piek {i}", model="mistral:7b")
+            except Bezet as e:
+                geweigerd.append(e.retry_after)
+                weiger_tijden.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=40) as pool:
+            list(pool.map(piek, range(40)))
+        print(f"  piek van 40 chatberichten: {40 - len(geweigerd)} bediend, {len(geweigerd)} direct geweigerd "
+              f"(max. {max(weiger_tijden, default=0) * 1000:.1f} ms, Retry-After {max(geweigerd, default=0)} s)")
+    finally:
+        llm_scheduler._scheduler = origineel_scheduler
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  19) Persona-prompt: één keer renderen, stabiele prefix voor de KV-cache
+# ================================================================
+
+def _legacy_systeem_prompt(tutor, context_lengte: int = 3) -> str:
+    """TutorPersoonlijkheid.genereer_systeem_prompt van vóór de memoisatie (per call opnieuw, variabele regel midden in de regels)."""
+    return f"""[ROL]
+{tutor.rol}
+
+[GEDRAG]
+{tutor.gedrag}
+
+[REGELS]
+{tutor.regels}
+- Onthoud de laatste {context_lengte} interacties voor context.
+- Antwoord altijd in het Nederlands, behalve bij Engelse voorbeelden.
+- Geef geen interne overwegingen weer.
+"""
+
+
+def bench_persona_prompt(calls: int = 100000):
+    """
+    Tijd per systeemprompt (per call opnieuw opbouwen versus gememoiseerd) en hoeveel tekens
+    de chatprompts (context_lengte 3) en feedbackprompts (context_lengte 1) van dezelfde tutor
+    vooraan gemeen hebben: dat deel haalt Ollama met keep_alive uit de KV-cache.
+    """
+    import ai_tutor_main
+
+    print(f"\n=== Persona-prompt: {calls} keer renderen ===")
+    for tutor in (ai_tutor_main.TutorPersonaliteiten.meester_jan(), ai_tutor_main.TutorPersonaliteiten.coach_sara()):
+        resultaten = []
+        for functie in (lambda n: _legacy_systeem_prompt(tutor, n), tutor.genereer_systeem_prompt):
+            start = time.perf_counter()
+            for i in range(calls):
+                functie(1 if i % 2 else 3)
+            resultaten.append((time.perf_counter() - start) / calls)
+        print(f"  {tutor.naam:<14} per call {resultaten[0] * 1e6:6.2f} µs -> {resultaten[1] * 1e6:6.2f} µs")
+        for label, chat, feedback in [
+            ("oude volgorde", _legacy_systeem_prompt(tutor, 3), _legacy_systeem_prompt(tutor, 1)),
+            ("nieuwe volgorde", tutor.genereer_systeem_prompt(3), tutor.genereer_systeem_prompt(1)),
+        ]:
+            gedeeld = len(os.path.commonprefix([chat, feedback]))
+            print(f"  {'':<14} {label:<16} gedeelde prefix chat/feedback {gedeeld:5d} van {len(chat)} tekens "
+                  f"({gedeeld / len(chat):.0%})")
+
+
+# ================================================================
+#  20) Async ConversationManager: afbreken als de leerling wegnavigeert
+# ================================================================
+
+def bench_async_cancel(leerlingen: int = 20, weg: int = 10, na: float = 0.2, token_delay: float = 0.02,
+                       tokens: int = 60):
+    """
+    Een klas levert tegelijk een schrijfopdracht in (rubric-beoordeling en feedback streamen,
+    `tokens` tokens van `token_delay` s); `weg` leerlingen verlaten na `na` s de pagina.
+    Sync loopt hun generatie gewoon door tot het eind; async breekt hem af met cancel().
+    Gemeten: tokens die de stub-Ollama nog genereerde, hoe snel het afbreken klaar is
+    en of de plekken in de planner vrijkomen.
+    """
+    import contextlib
+    import io
+    from concurrent.futures import ThreadPoolExecutor
+    import ollama_client
+    from answer_checker import WRITING_EXERCISES
+    from conversation_manager import AsyncConversationManager, ConversationManager, ExerciseState, SessionState
+    from llm_scheduler import get_scheduler
+    from tutor_personalities import TutorPersonaliteiten
+
+    print(f"\n=== Async ConversationManager: {leerlingen} schrijfopdrachten, {weg} leerlingen weg na "
+          f"{na * 1000:.0f} ms, {tokens} tokens à {token_delay * 1000:.0f} ms ===")
+    exercise = WRITING_EXERCISES[0]
+    antwoord = "Dear Mr Smith, I was ill yesterday so I could not come to school. " * 4
+    server, base_url = start_stub_ollama(antwoord=" ".join(["woord"] * tokens), token_delay=token_delay)
+    origineel = dict(ollama_client._clients)
+    # Twee streams per leerling; een kleinere async pool laat ze op een verbinding wachten
+    client = ollama_client.OllamaClient(base_url, pool_size=2 * leerlingen)
+    ollama_client._clients[ollama_client.OLLAMA_BASE_URL.rstrip("/")] = client
+    scheduler = get_scheduler()
+
+    def nieuwe_state():
+        state = SessionState(tutor=TutorPersonaliteiten.meester_jan())
+        state.exercises[exercise["exercise_id"]] = ExerciseState(exercise=exercise)
+        state.current_exercise_id = exercise["exercise_id"]
+        return state
+
+    def sync_klas():
+        # Wegnavigeren kan hier niet: de thread loopt door en het resultaat wordt weggegooid
+        with ThreadPoolExecutor(max_workers=leerlingen) as pool:
+            list(pool.map(lambda i: ConversationManager(nieuwe_state()).submit_answer(antwoord + str(i)), range(leerlingen)))
+
+    async def async_klas():
+        managers = [AsyncConversationManager(nieuwe_state(), sessie_id=f"leerling-{i}") for i in range(leerlingen)]
+        taken = [asyncio.ensure_future(m.submit_answer(antwoord + str(i))) for i, m in enumerate(managers)]
+        await asyncio.sleep(na)
+        start = time.perf_counter()
+        for m in managers[:weg]:
+            m.cancel()
+        await asyncio.wait(taken[:weg])
+        afbreken = time.perf_counter() - start
+        actief = scheduler.metrics()["actief"]
+        await asyncio.gather(*taken[weg:])
+        return afbreken, actief, sum(t.cancelled() for t in taken[:weg])
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sync_klas()
+            sync_tijd = time.perf_counter() - start
+        sync_tokens, server.tokens_verstuurd = server.tokens_verstuurd, 0
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            afbreken, actief, afgebroken = asyncio.run(async_klas())
+            async_tijd = time.perf_counter() - start
+        time.sleep(token_delay * 2)  # de stub merkt de gesloten verbinding bij het volgende token
+        async_tokens = server.tokens_verstuurd
+
+        print(f"  {'sync':<28} {sync_tokens:>6} tokens gegenereerd, klas klaar na {sync_tijd:.2f} s")
+        print(f"  {'async + cancel()':<28} {async_tokens:>6} tokens gegenereerd, klas klaar na {async_tijd:.2f} s")
+        print(f"  {afgebroken}/{weg} afgebroken in {afbreken * 1000:.1f} ms; "
+              f"planner-plekken daarna in gebruik: {actief} (van de {leerlingen - weg} blijvers)")
+    finally:
+        ollama_client._clients.clear()
+        ollama_client._clients.update(origineel)
+        server.shutdown()
+
+
+# ================================================================
+#  CLI
+# ================================================================
+
+BENCHMARKS = {
+    "concurrency": bench_concurrency,
+    "context": bench_context_window,
+    "ollama_client": bench_ollama_client,
+    "endpoint_cache": bench_endpoint_cache,
+    "rule_grader": bench_rule_grader,
+    "submit_pipeline": bench_submit_pipeline,
+    "oefeningen_batch": bench_oefeningen_batch,
+    "exercise_batch": bench_exercise_batch,
+    "json_stream": bench_json_stream,
+    "fuzz_writing": bench_fuzz_writing,
+    "structured_output": bench_structured_output,
+    "llm_cache": bench_llm_cache,
+    "feedback_templates": bench_feedback_templates,
+    "exercise_bank": bench_exercise_bank,
+    "progress_store": bench_progress_store,
+    "llm_router": bench_llm_router,
+    "coalescing": bench_coalescing,
+    "llm_scheduler": bench_llm_scheduler,
+    "persona_prompt": bench_persona_prompt,
+    "async_cancel": bench_async_cancel,
+}
+
+
+def run_cli():
+    print("=== AI Tutor benchmarks ===")
+    namen = list(BENCHMARKS)
+    for i, naam in enumerate(namen, 1):
+        print(f"  {i}) {naam}")
+    print("  a) Alles draaien")
+    keuze = input(">> ").strip().lower()
+
+    if keuze == "a":
+        for functie in BENCHMARKS.values():
+            functie()
+    elif keuze.isdigit() and 1 <= int(keuze) <= len(namen):
+        BENCHMARKS[namen[int(keuze) - 1]]()
+    else:
+        print("Ongeldige keuze.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for naam in sys.argv[1:]:
+            BENCHMARKS[naam]()
+    else:
+        run_cli()
@@ -0,0 +1,125 @@
+# context_window.py
+"""
+Token-budget voor de chatgeschiedenis die naar de LLM gaat.
+
+- Het systeembericht (positie 0) gaat altijd mee.
+- De meest recente beurten gaan mee zolang ze binnen `max_tokens` passen.
+- Oudere beurten worden samengevat in een doorlopende samenvatting. Die samenvatting wordt
+  incrementeel bijgewerkt: alleen beurten die sinds de vorige keer uit het venster zijn
+  gevallen worden erbij gevouwen, de rest wordt niet opnieuw verwerkt.
+
+De samenvattings-state staat in de sessie-dict zelf (`summary`, `summary_upto`), zodat hij
+mee bewaard wordt door de SessionStore.
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optioneel
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Aantal tokens; zonder tiktoken een schatting van ~4 tekens per token."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(msg: Any) -> int:
+    # +4 voor de rol/scheidingstokens die de chat-API per bericht toevoegt
+    return count_tokens(str(msg.content)) + 4
+
+
+def extractive_summary_line(msg: Any, max_chars: int = 160) -> str:
+    """Standaard samenvatter: eerste zin van een beurt, afgekapt op `max_chars`."""
+    prefix = "Leerling" if isinstance(msg, HumanMessage) else "Tutor"
+    text = " ".join(str(msg.content).split())
+    first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first) > max_chars:
+        first = first[:max_chars - 3].rstrip() + "..."
+    return f"- {prefix}: {first}"
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        summary_max_tokens: int = 400,
+        summarize_line: Callable[[Any], str] = extractive_summary_line,
+    ):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarize_line = summarize_line
+
+    def _fold(self, summary: str, new_lines: List[str]) -> str:
+        """Voegt regels toe aan de samenvatting; de oudste regels vallen eraf als het budget op is."""
+        lines = [l for l in summary.split("\n") if l] + new_lines
+        total = sum(count_tokens(l) for l in lines)
+        while lines and total > self.summary_max_tokens:
+            total -= count_tokens(lines.pop(0))
+        return "\n".join(lines)
+
+    def build(
+        self,
+        session: Dict[str, Any],
+        extra: Optional[List[Any]] = None,
+        max_tokens: Optional[int] = None,
+        persist: Optional[bool] = None,
+    ) -> List[Any]:
+        """
+        Geeft de berichtenlijst voor de LLM terug: systeembericht, eventuele samenvatting,
+        de recente beurten die binnen het budget passen en daarna `extra` (bv. een instructie).
+
+        Met een eigen `max_tokens` (bv. een kleiner venster voor een oefening) wordt de
+        samenvatting alleen voor deze call aangevuld en niet in de sessie bewaard; anders zou
+        de volgende call met het standaardbudget beurten zowel samengevat als letterlijk sturen.
+        `persist` overschrijft die keuze.
+        """
+        if persist is None:
+            persist = max_tokens is None
+        history = session["history"]
+        extra = extra or []
+        budget = max_tokens if max_tokens is not None else self.max_tokens
+
+        system, turns = history[0], history[1:]
+        used = message_tokens(system) + sum(message_tokens(m) for m in extra)
+        used += self.summary_max_tokens  # ruimte reserveren voor de samenvatting
+
+        # Van nieuw naar oud beurten toevoegen zolang het budget het toelaat (minstens één)
+        start = len(turns)
+        while start > 0:
+            cost = message_tokens(turns[start - 1])
+            if used + cost > budget and start < len(turns):
+                break
+            used += cost
+            start -= 1
+
+        # Incrementeel: alleen beurten die nieuw uit het venster zijn gevallen samenvatten.
+        # `summary_upto` is een absolute index; `history_dropped` telt beurten die de
+        # SessionStore vooraan heeft weggeknipt.
+        summary = session.get("summary", "")
+        dropped = session.get("history_dropped", 0)
+        folded_until = max(session.get("summary_upto", 0) - dropped, 0)
+        if start > folded_until:
+            summary = self._fold(summary, [self.summarize_line(m) for m in turns[folded_until:start]])
+            if persist:
+                session["summary"] = summary
+                session["summary_upto"] = dropped + start
+        else:
+            # Wat al in de samenvatting zit niet nog eens letterlijk meesturen
+            start = max(start, min(folded_until, len(turns) - 1))
+
+        messages = [system]
+        if summary:
+            messages.append(SystemMessage(content=f"Samenvatting van het eerdere gesprek:\n{summary}"))
+        messages.extend(turns[start:])
+        messages.extend(extra)
+        return messages
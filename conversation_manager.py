@@ -1,7 +1,9 @@
 # conversation_manager.py
 
+import asyncio
+from contextlib import aclosing
 from dataclasses import dataclass, field, asdict
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, List, Optional, Set
 import textwrap
 
 from tutor_personalities import (
@@ -9,10 +11,12 @@ from tutor_personalities import (
     TutorPersoonlijkheid,
     BASE_TUTOR_RULES,
     call_ollama as llm_chat_call,
+    acall_ollama as allm_chat_call,
 )
-from exercise_generator import generate_exercise_with_llm
-from answer_checker import check_answer
-from feedback_generator import generate_feedback
+from exercise_generator import generate_exercise_with_llm, agenerate_exercise_with_llm
+from answer_checker import check_answer, acheck_answer
+from feedback_generator import feedback_result, generate_feedback_stream, agenerate_feedback_stream
+from llm_scheduler import als
 
 
 # ================================================================
@@ -149,38 +153,58 @@ class ConversationManager:
             theme=cfg.theme,
             difficulty=cfg.difficulty,
         )
+        return self._start_exercise(exercise)
+
+    def _start_exercise(self, exercise: Dict[str, Any]) -> Dict[str, Any]:
         ex_id = exercise["exercise_id"]
         self.state.exercises[ex_id] = ExerciseState(exercise=exercise)
         self.state.current_exercise_id = ex_id
         return exercise
 
-    def submit_answer(self, answer: str) -> Dict[str, Any]:
+    def submit_answer_stream(self, answer: str) -> Iterator[Dict[str, Any]]:
         """
-        Antwoord op huidige oefening nakijken + feedback genereren.
+        Antwoord nakijken + feedback genereren, als stroom van events:
+        - {"type": "check", "check_result": ...}        zodra de score bekend is
+        - {"type": "feedback_delta", "text": ...}        stukjes feedbacktekst
+        - {"type": "done", "check_result", "feedback", "summary_message"}
+
+        Gesloten vragen worden direct (zonder LLM) nagekeken, dus de feedback start meteen.
+        Bij schrijfopdrachten start de feedback pas als de rubric-score er is, zodat de tekst
+        de score niet kan tegenspreken (geen lof bij een 4/10).
         """
         if not self.state.current_exercise_id:
             raise ValueError("Geen actieve oefening.")
 
         ex_state = self.state.exercises[self.state.current_exercise_id]
         exercise = ex_state.exercise
+        personality = self.state.tutor
+        pieces: List[str] = []
 
-        # 1) Nakijken
         check_result = check_answer(exercise, answer)
+        yield {"type": "check", "check_result": check_result}
+        for piece in generate_feedback_stream(exercise, answer, check_result, personality):
+            pieces.append(piece)
+            yield {"type": "feedback_delta", "text": piece}
+
+        yield self._finish_answer(ex_state, answer, check_result, "".join(pieces).strip())
+
+    def _finish_answer(
+        self,
+        ex_state: ExerciseState,
+        answer: str,
+        check_result: Dict[str, Any],
+        feedback_text: str,
+    ) -> Dict[str, Any]:
+        """Slaat antwoord, score en feedback op en geeft het "done"-event."""
+        exercise = ex_state.exercise
+        feedback = feedback_result(exercise, check_result, self.state.tutor, feedback_text)
 
-        # 2) Feedback genereren (met gekozen tutor)
-        feedback_result = generate_feedback(
-            exercise=exercise,
-            student_answer=answer,
-            check_result=check_result,
-            personality=self.state.tutor,
-        )
-
-        # 3) State updaten
+        # State updaten
         ex_state.last_answer = answer
         ex_state.last_check = check_result
-        ex_state.last_feedback = feedback_result
+        ex_state.last_feedback = feedback
 
-        # 4) Kort chatbericht ook in history (optioneel)
+        # Kort chatbericht ook in history (optioneel)
         summary_text = (
             f"Ik heb je antwoord nagekeken op oefening {exercise['exercise_id']}. "
             f"Resultaat: {check_result['result']} (score {check_result.get('score', 0):.2f})."
@@ -188,11 +212,30 @@ class ConversationManager:
         self.state.history.append(ChatTurn(role="tutor", text=summary_text))
 
         return {
+            "type": "done",
             "check_result": check_result,
-            "feedback": feedback_result,
+            "feedback": feedback,
             "summary_message": summary_text,
         }
 
+    def submit_answer(
+        self,
+        answer: str,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Antwoord op huidige oefening nakijken + feedback genereren.
+        Met `on_event` komen score en feedbackstukjes binnen zodra ze klaar zijn
+        (zie submit_answer_stream); het eindresultaat blijft hetzelfde.
+        """
+        result: Dict[str, Any] = {}
+        for event in self.submit_answer_stream(answer):
+            if on_event is not None:
+                on_event(event)
+            if event["type"] == "done":
+                result = {k: v for k, v in event.items() if k != "type"}
+        return result
+
     # ---------- Chat / uitleg ---------- #
 
     def _build_explanation_prompt(self, user_message: str, ex_state: ExerciseState) -> str:
@@ -328,6 +371,17 @@ NU HET ANTWOORD VOOR DE LEERLING:
         Verwerkt een gewone chatboodschap van de leerling.
         Geeft alleen de tekst van het tutor-antwoord terug.
         """
+        prompt = self._chat_prompt(text)
+        try:
+            answer = llm_chat_call(prompt)
+        except Exception as e:
+            answer = self._chat_error(e)
+
+        self.state.history.append(ChatTurn(role="tutor", text=answer))
+        return answer
+
+    def _chat_prompt(self, text: str) -> str:
+        """Zet de boodschap in de history en kiest de prompt (uitleg bij de oefening of algemene chat)."""
         self.state.history.append(ChatTurn(role="user", text=text))
 
         lower = text.lower()
@@ -342,14 +396,124 @@ NU HET ANTWOORD VOOR DE LEERLING:
             prompt = self._build_explanation_prompt(text, ex_state)
         else:
             prompt = self._build_general_chat_prompt(text)
+        return prompt
+
+    @staticmethod
+    def _chat_error(e: Exception) -> str:
+        return (
+            "Er ging iets mis bij het aanroepen van de taalmodule. "
+            f"Technische fout: {e}"
+        )
+
 
+# ================================================================
+#  Async Conversatie Manager
+# ================================================================
+
+class AsyncConversationManager(ConversationManager):
+    """
+    Zelfde state en prompts als ConversationManager, maar met een awaitable API:
+    wachten op het model blokkeert geen thread, dus één event loop bedient veel leerlingen.
+
+    Elke aanroep draait als eigen asyncio-taak (met `sessie_id` als leerling voor de planner
+    en de sticky routing). Verlaat de leerling de pagina, dan breekt `cancel()` alle lopende
+    generaties af: de verbinding met Ollama gaat dicht zodat het model stopt, de plek in de
+    planner komt vrij en de aanroeper krijgt asyncio.CancelledError. Een afgebroken generatie
+    verandert de state niet (behalve een al opgeslagen chatboodschap van de leerling).
+    """
+
+    def __init__(self, state: SessionState, sessie_id: Optional[str] = None):
+        super().__init__(state)
+        self.sessie_id = sessie_id
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _task(self, coro) -> asyncio.Task:
+        with als(leerling=self.sessie_id):
+            task = asyncio.get_running_loop().create_task(coro)  # neemt de context (leerling) over
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def cancel(self) -> int:
+        """Breekt alle lopende generaties van deze sessie af; geeft het aantal afgebroken taken."""
+        lopend = [task for task in self._tasks if not task.done()]
+        for task in lopend:
+            task.cancel()
+        return len(lopend)
+
+    @property
+    def busy(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    # ---------- Oefeningen ---------- #
+
+    async def request_new_exercise(self) -> Dict[str, Any]:
+        cfg = self.state.config
+        exercise = await self._task(agenerate_exercise_with_llm(
+            skill=cfg.skill,
+            topic=cfg.topic,
+            theme=cfg.theme,
+            difficulty=cfg.difficulty,
+        ))
+        return self._start_exercise(exercise)
+
+    async def submit_answer_stream(self, answer: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Zelfde events als ConversationManager.submit_answer_stream. Nakijken en feedback
+        draaien in een eigen taak; stopt de lezer eerder (aclose), dan wordt die afgebroken.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        producer = self._task(self._answer_events(answer, events.put_nowait))
         try:
-            answer = llm_chat_call(prompt)
+            while (event := await events.get()) is not None:
+                yield event
+            await producer  # geeft een fout of CancelledError van de producer door
+        finally:
+            producer.cancel()
+
+    async def _answer_events(self, answer: str, emit: Callable[[Optional[Dict[str, Any]]], None]):
+        try:
+            if not self.state.current_exercise_id:
+                raise ValueError("Geen actieve oefening.")
+
+            ex_state = self.state.exercises[self.state.current_exercise_id]
+            exercise = ex_state.exercise
+            personality = self.state.tutor
+            pieces: List[str] = []
+
+            check_result = await acheck_answer(exercise, answer)
+            emit({"type": "check", "check_result": check_result})
+            async with aclosing(agenerate_feedback_stream(exercise, answer, check_result, personality)) as stream:
+                async for piece in stream:
+                    pieces.append(piece)
+                    emit({"type": "feedback_delta", "text": piece})
+
+            emit(self._finish_answer(ex_state, answer, check_result, "".join(pieces).strip()))
+        finally:
+            emit(None)
+
+    async def submit_answer(
+        self,
+        answer: str,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        async with aclosing(self.submit_answer_stream(answer)) as events:
+            async for event in events:
+                if on_event is not None:
+                    on_event(event)
+                if event["type"] == "done":
+                    result = {k: v for k, v in event.items() if k != "type"}
+        return result
+
+    # ---------- Chat / uitleg ---------- #
+
+    async def handle_user_chat(self, text: str) -> str:
+        prompt = self._chat_prompt(text)
+        try:
+            answer = await self._task(allm_chat_call(prompt, session_id=self.sessie_id))
         except Exception as e:
-            answer = (
-                "Er ging iets mis bij het aanroepen van de taalmodule. "
-                f"Technische fout: {e}"
-            )
+            answer = self._chat_error(e)
 
         self.state.history.append(ChatTurn(role="tutor", text=answer))
         return answer
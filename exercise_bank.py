@@ -0,0 +1,235 @@
+# exercise_bank.py
+"""
+Oefeningenbank voor de vaste templates van OefeningenGenerator (gap-fill, meerkeuze, lezen, schrijven).
+
+De items staan in `exercise_bank.json` en worden één keer per proces ingelezen en geïndexeerd:
+- `kies(soort, onderwerp, moeilijkheid)` is O(1), ook met duizenden items,
+- elk item krijgt een content-id (hash van de inhoud); hetzelfde item uit twee bestanden telt één keer.
+
+Scholen kunnen eigen items toevoegen met JSON- of YAML-bestanden (YAML alleen als PyYAML
+geïnstalleerd is) in hetzelfde formaat: een lijst items, of {"items": [...]}.
+
+    {"soort": "gapfill",   "onderwerp": "present_simple", "moeilijkheid": 1,
+     "vraag": "She ___ (work) ...", "antwoord": "works", "uitleg": "..."}
+    {"soort": "meerkeuze", "onderwerp": "modals", "vraag": "...", "opties": [...], "antwoord": "must"}
+    {"soort": "lezen",     "onderwerp": "detail", "tekst": "...", "vraag": "...", "opties": [...], "antwoord": "..."}
+    {"soort": "schrijven", "onderwerp": "artikel", "instructie": "...", "rubric": {"structuur": "...", ...}}
+
+Configuratie via environment variabelen:
+    EXERCISE_BANK_PATHS (extra bestanden of mappen, gescheiden door os.pathsep)
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:  # alleen nodig voor YAML-bestanden
+    yaml = None
+
+STANDAARD_BANK = Path(__file__).with_name("exercise_bank.json")
+
+SOORTEN = ("gapfill", "meerkeuze", "lezen", "schrijven")
+_MOEILIJKHEDEN = {"makkelijk": 1, "easy": 1, "gemiddeld": 2, "medium": 2, "moeilijk": 3, "hard": 3}
+_EXTENSIES = (".json", ".yaml", ".yml")
+
+
+@dataclass(frozen=True)
+class BankItem:
+    id: str
+    soort: str
+    onderwerp: str
+    moeilijkheid: int
+    content: str
+    juist_antwoord: str
+    opties: Optional[Tuple[str, ...]] = None
+    uitleg: Optional[str] = None
+    instructie: Optional[str] = None
+
+
+def inhoud_id(data: Dict[str, Any]) -> str:
+    """Content-hash van een item (zonder moeilijkheid): dezelfde oefening geeft hetzelfde id."""
+    inhoud = {k: v for k, v in data.items() if k not in ("id", "moeilijkheid")}
+    tekst = json.dumps(inhoud, sort_keys=True, ensure_ascii=False)
+    return "bank_" + hashlib.sha1(tekst.encode("utf-8")).hexdigest()[:16]
+
+
+def _moeilijkheid(waarde: Any) -> int:
+    if waarde is None:
+        return 2
+    if isinstance(waarde, str) and not waarde.isdigit():
+        niveau = _MOEILIJKHEDEN.get(waarde.strip().lower())
+        if niveau is None:
+            raise ValueError(f"onbekende moeilijkheid {waarde!r} (verwacht 1, 2, 3 of een van {', '.join(_MOEILIJKHEDEN)})")
+        return niveau
+    niveau = int(waarde)
+    if niveau not in (1, 2, 3):
+        raise ValueError(f"moeilijkheid {waarde!r} moet 1, 2 of 3 zijn")
+    return niveau
+
+
+def maak_item(data: Dict[str, Any]) -> BankItem:
+    """Zet een item uit een bankbestand om; ValueError bij een onbekende soort of moeilijkheid of een ontbrekend veld."""
+    soort = data.get("soort")
+    if soort not in SOORTEN:
+        raise ValueError(f"onbekende soort {soort!r} (verwacht een van {', '.join(SOORTEN)})")
+    try:
+        if soort == "schrijven":
+            content = json.dumps(data["rubric"], ensure_ascii=False)
+            antwoord, opties = "", None
+        else:
+            content = data["vraag"] if soort != "lezen" else f"{data['tekst']}\n\n{data['vraag']}"
+            antwoord = data["antwoord"]
+            opties = tuple(data["opties"]) if soort != "gapfill" else None
+            if opties is not None and antwoord not in opties:
+                raise ValueError(f"antwoord {antwoord!r} staat niet tussen de opties")
+        return BankItem(
+            id=data.get("id") or inhoud_id(data),
+            soort=soort,
+            onderwerp=data["onderwerp"],
+            moeilijkheid=_moeilijkheid(data.get("moeilijkheid")),
+            content=content,
+            juist_antwoord=antwoord,
+            opties=opties,
+            uitleg=data.get("uitleg"),
+            instructie=data.get("instructie"),
+        )
+    except KeyError as e:
+        raise ValueError(f"veld {e.args[0]!r} ontbreekt") from None
+
+
+def lees_bestand(pad: Path) -> List[Dict[str, Any]]:
+    with open(pad, encoding="utf-8") as f:
+        if pad.suffix == ".json":
+            data = json.load(f)
+        elif yaml is None:
+            raise ImportError(f"{pad}: voor YAML-bestanden is PyYAML nodig (pip install pyyaml)")
+        else:
+            data = yaml.safe_load(f)
+    if isinstance(data, dict):
+        data = data.get("items", [])
+    if not isinstance(data, list):
+        raise ValueError(f"{pad}: verwacht een lijst items of {{\"items\": [...]}}")
+    return data
+
+
+def _bestanden(paden: Iterable[str]) -> List[Path]:
+    gevonden: List[Path] = []
+    for pad in map(Path, paden):
+        if pad.is_dir():
+            gevonden.extend(sorted(p for p in pad.iterdir() if p.suffix in _EXTENSIES))
+        else:
+            gevonden.append(pad)
+    return gevonden
+
+
+class ExerciseBank:
+    def __init__(self, items: Iterable[BankItem] = ()):
+        self._per_id: Dict[str, BankItem] = {}
+        # (soort, onderwerp, moeilijkheid) met None als "maakt niet uit" -> items
+        self._index: Dict[Tuple[str, Optional[str], Optional[int]], List[BankItem]] = {}
+        self._onderwerpen: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self.voeg_toe(items)
+
+    @classmethod
+    def laad(cls, paden: Iterable[str] = ()) -> "ExerciseBank":
+        """De standaardbank plus de items uit `paden` (bestanden of mappen met .json/.yaml)."""
+        bank = cls()
+        for pad in [STANDAARD_BANK, *_bestanden(paden)]:
+            try:
+                bank.voeg_toe(maak_item(data) for data in lees_bestand(pad))
+            except ValueError as e:
+                raise ValueError(f"{pad}: {e}") from None
+        return bank
+
+    @classmethod
+    def from_env(cls) -> "ExerciseBank":
+        paden = [p for p in os.getenv("EXERCISE_BANK_PATHS", "").split(os.pathsep) if p.strip()]
+        return cls.laad(paden)
+
+    def voeg_toe(self, items: Iterable[BankItem]) -> int:
+        """Voegt items toe (dubbele content-ids worden overgeslagen); geeft het aantal nieuwe items."""
+        nieuw = 0
+        with self._lock:
+            for item in items:
+                if item.id in self._per_id:
+                    continue
+                self._per_id[item.id] = item
+                for sleutel in (
+                    (item.soort, None, None),
+                    (item.soort, item.onderwerp, None),
+                    (item.soort, None, item.moeilijkheid),
+                    (item.soort, item.onderwerp, item.moeilijkheid),
+                ):
+                    self._index.setdefault(sleutel, []).append(item)
+                onderwerpen = self._onderwerpen.setdefault(item.soort, [])
+                if item.onderwerp not in onderwerpen:
+                    onderwerpen.append(item.onderwerp)
+                nieuw += 1
+        return nieuw
+
+    # ---------- Opvragen ---------- #
+
+    def get(self, item_id: str) -> Optional[BankItem]:
+        return self._per_id.get(item_id)
+
+    def items(self, soort: str, onderwerp: Optional[str] = None, moeilijkheid: Optional[int] = None) -> List[BankItem]:
+        return self._index.get((soort, onderwerp, moeilijkheid), [])
+
+    def onderwerpen(self, soort: str) -> List[str]:
+        return list(self._onderwerpen.get(soort, []))
+
+    def kies(
+        self,
+        soort: str,
+        onderwerp: Optional[str] = None,
+        moeilijkheid: Optional[int] = None,
+        rng: Optional[random.Random] = None,
+    ) -> BankItem:
+        """
+        Willekeurig item van deze soort (en dit onderwerp / deze moeilijkheid).
+        Zonder items voor het onderwerp wordt eerst een willekeurig onderwerp gekozen,
+        net als de oude templates deden. KeyError als er van deze soort niets is.
+        """
+        rng = rng or random
+        if onderwerp is not None and not self.items(soort, onderwerp):
+            if not self._onderwerpen.get(soort):
+                raise KeyError(soort)
+            onderwerp = rng.choice(self._onderwerpen[soort])
+        kandidaten = self.items(soort, onderwerp, moeilijkheid) or self.items(soort, onderwerp)
+        if not kandidaten:
+            raise KeyError(soort)
+        return rng.choice(kandidaten)
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "items": len(self._per_id),
+            "per_soort": {soort: len(self.items(soort)) for soort in SOORTEN},
+            "onderwerpen": {soort: len(o) for soort, o in self._onderwerpen.items()},
+        }
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_bank: Optional[ExerciseBank] = None
+_bank_lock = threading.Lock()
+
+
+def get_exercise_bank() -> ExerciseBank:
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = ExerciseBank.from_env()
+    return _bank
@@ -1,15 +1,28 @@
 import uuid
 import json
+import logging
 import textwrap
 import random
-from typing import Optional
-
-import requests
+from typing import Iterator, List, Optional
+
+from json_schemas import (
+    exercise_batch_schema,
+    exercise_schema,
+    ollama_format,
+    parse_stats,
+    parse_structured,
+    validate,
+)
+from json_stream import iter_array_items
+from llm_scheduler import als, get_scheduler, klasse_voor
+from ollama_client import get_client
 
 # Config
-OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "mistral:7b"
 
+# Bibliotheekcode (ook door de API-server gebruikt): waarschuwingen via logging, niet naar stdout
+logger = logging.getLogger(__name__)
+
 
 DIFFICULTIES = ["easy", "medium", "hard"]
 SKILLS = ["grammar", "reading", "writing"]
@@ -57,65 +70,34 @@ def topic_family(topic: str) -> str:
 
 # ------------------ Ollama / LLM ------------------ #
 
-def call_ollama(prompt: str, model: str = OLLAMA_MODEL, stream: bool = False) -> str:
-
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": stream,
-    }
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-    resp.raise_for_status()
-    data = resp.json()
-    # bij stream=False geeft Ollama één JSON-object terug met key "response"
-    return data.get("response", "")
-
-
-def extract_json_from_text(text: str) -> dict:
-
-    # strip eventuele code fences
-    if "```" in text:
-        # simpele aanpak: pak alles tussen eerste ``` en laatste ```
-        parts = text.split("```")
-        # zoek stuk waar waarschijnlijk JSON in zit
-        candidate = ""
-        for part in parts:
-            if "{" in part and "}" in part:
-                candidate = part
-                break
-        if candidate:
-            text = candidate
+def call_ollama(prompt: str, model: str = OLLAMA_MODEL, stream: bool = False, format=None,
+                site: str = "oefening") -> str:
+    """
+    `format`: "json" of een JSON-schema waar de output aan moet voldoen (zie json_schemas).
+    De call wacht op een plek bij het model volgens de klasse van `site` (zie llm_scheduler.py).
+    """
+    client = get_client()
+    with get_scheduler().slot(klasse_voor(site)):
+        if stream:
+            return "".join(client.generate_stream(prompt, model=model, format=format))
+        # bij stream=False geeft Ollama één JSON-object terug met key "response"
+        return client.generate(prompt, model=model, format=format)
 
-    # zoek eerste { en laatste }
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        raise ValueError("Kon geen JSON-object vinden in LLM-output.")
 
-    json_str = text[start:end+1]
-    return json.loads(json_str)
+async def acall_ollama(prompt: str, model: str = OLLAMA_MODEL, format=None, site: str = "oefening") -> str:
+    """Async variant van call_ollama; wordt de taak geannuleerd, dan breekt de verbinding en stopt Ollama."""
+    async with get_scheduler().aslot(klasse_voor(site)):
+        return await get_client().agenerate(prompt, model=model, format=format)
 
 
 # ------------------ Promptbouwers ------------------ #
 
-def build_llm_prompt(
-    exercise_type: str,
-    skill: str,
-    topic: str,
-    theme: str,
-    difficulty: str,
-) -> str:
+def build_type_spec(exercise_type: str, topic: str, theme_norm: str, difficulty: str):
     """
-    Bouwt een instructie voor Mistral die uitlegt:
-    - wie de leerling is (Nederlandse HAVO 5 → B1/B2)
-    - wat voor oefeningstype we willen
-    - welke JSON-structuur exact gebruikt moet worden
-    - dat er ALLEEN JSON terug moet komen
+    Beschrijving + JSON-voorbeeld voor één oefeningstype.
+    Geeft (type_description, base_schema) terug; gedeeld door de enkele en de batch-prompt.
     """
 
-    theme_norm = normalize_theme(theme)
-    topic = topic or "General English"
-
     # Extra context per type
     # Extra context per type
     if exercise_type == "gapfill":
@@ -201,6 +183,28 @@ def build_llm_prompt(
     }}
     """).strip()
 
+    return type_description, base_schema
+
+
+def build_llm_prompt(
+    exercise_type: str,
+    skill: str,
+    topic: str,
+    theme: str,
+    difficulty: str,
+) -> str:
+    """
+    Bouwt een instructie voor Mistral die uitlegt:
+    - wie de leerling is (Nederlandse HAVO 5 → B1/B2)
+    - wat voor oefeningstype we willen
+    - welke JSON-structuur exact gebruikt moet worden
+    - dat er ALLEEN JSON terug moet komen
+    """
+
+    theme_norm = normalize_theme(theme)
+    topic = topic or "General English"
+    type_description, base_schema = build_type_spec(exercise_type, topic, theme_norm, difficulty)
+
     prompt = textwrap.dedent(f"""
     Jij bent een AI-tutor die oefeningen Engels maakt voor Nederlandse leerlingen van HAVO 5 (ongeveer B1/B2 niveau).
 
@@ -242,13 +246,7 @@ def build_llm_prompt(
 
 # ------------------ Generator op basis van LLM ------------------ #
 
-def generate_exercise_with_llm(
-    skill: str,
-    topic: str,
-    theme: str,
-    difficulty: str = "medium",
-    exercise_type: Optional[str] = None,
-) -> dict:
+def resolve_skill_and_type(skill: str, difficulty: str, exercise_type: Optional[str] = None):
     skill = (skill or "").lower()
     if skill not in SKILLS:
         skill = "grammar"
@@ -261,18 +259,12 @@ def generate_exercise_with_llm(
     if exercise_type not in valid_types:
         # bij grammar random gapfill/mcq, anders eerste (reading/writing)
         exercise_type = random.choice(valid_types) if len(valid_types) > 1 else valid_types[0]
+    return skill, difficulty, exercise_type
 
-    prompt = build_llm_prompt(exercise_type, skill, topic, theme, difficulty)
-
-    raw_output = call_ollama(prompt)
-    parsed = extract_json_from_text(raw_output)
 
-    # Zorgen dat exercise_id bestaat en type/difficulty/topic zijn ingevuld
-    if "exercise_id" not in parsed or not parsed["exercise_id"]:
-        parsed["exercise_id"] = generate_exercise_id()
-    else:
-        # we kunnen ook onze eigen id overrulen, om het formaat consistent te houden
-        parsed["exercise_id"] = generate_exercise_id()
+def finalize_exercise(parsed: dict, exercise_type: str, topic: str, theme: str, difficulty: str) -> dict:
+    # Altijd een eigen id, om het formaat consistent te houden
+    parsed["exercise_id"] = generate_exercise_id()
 
     # fallback / sanity checks
     parsed["type"] = exercise_type
@@ -287,6 +279,199 @@ def generate_exercise_with_llm(
     return parsed
 
 
+def validate_exercise(ex: dict, exercise_type: str) -> List[str]:
+    """Controleert of een gegenereerde oefening bruikbaar is; geeft een lijst met problemen terug."""
+    if not isinstance(ex, dict):
+        return ["geen object"]
+    problems = []
+    content = ex.get("content")
+    if not isinstance(content, dict):
+        return ["content ontbreekt"]
+    answer_key = ex.get("answer_key") or {}
+
+    if exercise_type == "gapfill":
+        if "___" not in str(content.get("sentence", "")):
+            problems.append("sentence zonder ___")
+        if not str(answer_key.get("correct_answer", "")).strip():
+            problems.append("correct_answer ontbreekt")
+    elif exercise_type in ("mcq", "reading"):
+        if exercise_type == "reading" and not str(content.get("passage", "")).strip():
+            problems.append("passage ontbreekt")
+        if not str(content.get("question", "")).strip():
+            problems.append("question ontbreekt")
+        options = content.get("options")
+        index = answer_key.get("correct_index")
+        if not isinstance(options, list) or len(options) < 2:
+            problems.append("te weinig options")
+        elif not isinstance(index, int) or not 0 <= index < len(options):
+            problems.append("correct_index ongeldig")
+        elif answer_key.get("correct_option") not in (None, options[index]):
+            problems.append("correct_option past niet bij correct_index")
+    elif exercise_type == "writing":
+        if not str(content.get("prompt", "")).strip():
+            problems.append("prompt ontbreekt")
+        if not isinstance(content.get("rubric"), dict):
+            problems.append("rubric ontbreekt")
+    return problems
+
+
+def generate_exercise_with_llm(
+    skill: str,
+    topic: str,
+    theme: str,
+    difficulty: str = "medium",
+    exercise_type: Optional[str] = None,
+) -> dict:
+    skill, difficulty, exercise_type = resolve_skill_and_type(skill, difficulty, exercise_type)
+
+    prompt = build_llm_prompt(exercise_type, skill, topic, theme, difficulty)
+
+    schema = exercise_schema(exercise_type)
+    raw_output = call_ollama(prompt, format=ollama_format(schema))
+    parsed, _ = parse_structured(raw_output, schema, "exercise")
+
+    return finalize_exercise(parsed, exercise_type, topic, theme, difficulty)
+
+
+async def agenerate_exercise_with_llm(
+    skill: str,
+    topic: str,
+    theme: str,
+    difficulty: str = "medium",
+    exercise_type: Optional[str] = None,
+) -> dict:
+    """Async variant van generate_exercise_with_llm (zelfde prompt, schema en validatie)."""
+    skill, difficulty, exercise_type = resolve_skill_and_type(skill, difficulty, exercise_type)
+
+    prompt = build_llm_prompt(exercise_type, skill, topic, theme, difficulty)
+
+    schema = exercise_schema(exercise_type)
+    raw_output = await acall_ollama(prompt, format=ollama_format(schema))
+    parsed, _ = parse_structured(raw_output, schema, "exercise")
+
+    return finalize_exercise(parsed, exercise_type, topic, theme, difficulty)
+
+
+# ------------------ Batch: meerdere oefeningen in één LLM-call ------------------ #
+
+def build_llm_batch_prompt(
+    exercise_types: List[str],
+    skill: str,
+    topic: str,
+    theme: str,
+    difficulty: str,
+) -> str:
+    """
+    Zelfde instructies als build_llm_prompt, maar vraagt om N oefeningen in één JSON-object
+    {"exercises": [...]}. Elk type wordt maar één keer beschreven.
+    """
+    theme_norm = normalize_theme(theme)
+    topic = topic or "General English"
+
+    specs = []
+    for exercise_type in dict.fromkeys(exercise_types):
+        type_description, base_schema = build_type_spec(exercise_type, topic, theme_norm, difficulty)
+        specs.append(f'Type "{exercise_type}":\n{type_description}\n\nVoorbeeld:\n{base_schema}')
+    specs_text = "\n\n".join(specs)
+    order = ", ".join(f"{i}. {t}" for i, t in enumerate(exercise_types, 1))
+
+    prompt = textwrap.dedent(f"""
+    Jij bent een AI-tutor die oefeningen Engels maakt voor Nederlandse leerlingen van HAVO 5 (ongeveer B1/B2 niveau).
+
+    Doel:
+    - Genereer {len(exercise_types)} verschillende oefeningen in JSON-formaat.
+    - De leerling kan zelf een topic en thema kiezen, die moet jij verwerken in elke oefening.
+    - Houd het Engels passend bij HAVO 5 (niet te makkelijk, niet te moeilijk).
+
+    Instellingen:
+    - Skill: {skill}
+    - Topic (grammatica / vaardigheid): "{topic}"
+    - Theme (inhoudelijk thema): "{theme_norm}"
+    - Difficulty: {difficulty}
+    - Types, in deze volgorde: {order}
+
+    Richtlijnen per type:
+    __SPECS__
+
+    Belangrijk:
+    - De veldnamen moeten precies overeenkomen met de voorbeelden hierboven.
+    - "instructions" is in het Nederlands.
+    - De inhoud van de oefeningen (zin, tekst, prompt) is in het Engels.
+    - Zorg dat elke oefening echt het gegeven topic EN het thema gebruikt, en dat de oefeningen onderling verschillen.
+    - Geef ALLEEN een JSON-object terug in de vorm {{"exercises": [ ... ]}}, zonder extra uitleg of tekst eromheen.
+
+    Nu: genereer de {len(exercise_types)} oefeningen.
+    """).strip()
+
+    # Na dedent invullen: de specs bevatten zelf meerdere regels met eigen inspringing
+    return prompt.replace("__SPECS__", specs_text)
+
+
+def generate_exercises_batch(
+    skill: str,
+    topic: str,
+    theme: str,
+    difficulty: str = "medium",
+    n: int = 5,
+    max_retries: int = 2,
+) -> Iterator[dict]:
+    """
+    Genereert `n` oefeningen met één LLM-call (prompt-prefix één keer verwerkt) en geeft
+    elke oefening terug zodra hij uit de stream geparsed en gevalideerd is.
+    Ontbrekende of ongeldige items worden daarna los opnieuw gegenereerd (max. `max_retries`
+    pogingen per item); items die dan nog steeds falen worden overgeslagen.
+    """
+    skill, difficulty, _ = resolve_skill_and_type(skill, difficulty)
+    exercise_types = [resolve_skill_and_type(skill, difficulty)[2] for _ in range(n)]
+
+    prompt = build_llm_batch_prompt(exercise_types, skill, topic, theme, difficulty)
+    batch_format = ollama_format(exercise_batch_schema(exercise_types))
+    failed: List[str] = []
+    received = 0
+
+    # Een batch is werk voor de voorraad: wijkt voor chat en nakijken (zie llm_scheduler.py)
+    pieces = get_scheduler().stream(
+        lambda: get_client().generate_stream(prompt, model=OLLAMA_MODEL, format=batch_format),
+        klasse_voor("exercise_batch"),
+    )
+    try:
+        for item in iter_array_items(pieces):
+            if received >= n:
+                break
+            exercise_type = exercise_types[received]
+            received += 1
+            # Het model mag het type anders kiezen dan gevraagd, zolang het binnen de skill past
+            if isinstance(item, dict) and item.get("type") in TYPES_PER_SKILL[skill]:
+                exercise_type = item["type"]
+            # Per item tellen: direct = voldoet aan het schema
+            valid = not validate(item, exercise_schema(exercise_type))
+            parse_stats.record("exercise_batch", "direct" if valid else "ongeldig")
+            if item is None or validate_exercise(item, exercise_type):
+                failed.append(exercise_type)
+                continue
+            yield finalize_exercise(item, exercise_type, topic, theme, difficulty)
+    except Exception as e:
+        logger.warning("Batch-generatie afgebroken, ontbrekende items worden los gegenereerd: %s", e)
+    finally:
+        # De plek bij het model vrijgeven voordat items los opnieuw gegenereerd worden
+        pieces.close()
+
+    # Wat niet (goed) uit de batch kwam: los opnieuw genereren
+    for _ in exercise_types[received:]:
+        parse_stats.record("exercise_batch", "mislukt")
+    failed.extend(exercise_types[received:])
+    for exercise_type in failed:
+        for _ in range(max_retries):
+            try:
+                with als(klasse_voor("exercise_batch")):
+                    exercise = generate_exercise_with_llm(skill, topic, theme, difficulty, exercise_type)
+            except Exception:
+                continue
+            if not validate_exercise(exercise, exercise_type):
+                yield exercise
+                break
+
+
 # ------------------ CLI ------------------ #
 
 def ask_with_default(prompt_text: str, default: str = "") -> str:
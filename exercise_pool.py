@@ -0,0 +1,156 @@
+# exercise_pool.py
+"""
+Voorraad kant-en-klare oefeningen per (topic, theme, skill).
+
+Een achtergrondtaak houdt elke voorraad op `depth` oefeningen. Het endpoint pakt er
+direct één uit; alleen als de voorraad leeg is wordt er live gegenereerd.
+Oefeningen ouder dan `max_age_seconds` worden weggegooid in plaats van uitgedeeld.
+
+Het thema is vrije tekst van de client, dus de voorraad is begrensd:
+- er wordt pas aangevuld voor een combinatie die vaker dan één keer gevraagd is
+  (of waarvan het thema in `allow_themes` staat); een eenmalig thema kost dus geen
+  extra LLM-calls bovenop de live generatie,
+- hooguit `max_keys` combinaties (LRU); combinaties die `idle_seconds` niet gevraagd
+  zijn verdwijnen, inclusief hun aanvultaak.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+PoolKey = Tuple[str, str, str]
+
+
+@dataclass
+class PoolEntry:
+    exercises: Deque[Tuple[float, Dict[str, Any]]] = field(default_factory=deque)
+    requests: int = 0
+    last_used: float = 0.0
+    refill: Optional[asyncio.Task] = None
+
+
+class ExercisePool:
+    def __init__(
+        self,
+        generate: Callable[[str, str, str], Awaitable[Optional[Dict[str, Any]]]],
+        depth: int = 3,
+        refill_concurrency: int = 2,
+        max_age_seconds: float = 30 * 60,
+        max_keys: int = 200,
+        idle_seconds: float = 30 * 60,
+        min_requests: int = 2,
+        allow_themes: Iterable[str] = (),
+    ):
+        self.generate = generate
+        self.depth = depth
+        self.max_age_seconds = max_age_seconds
+        self.refill_concurrency = refill_concurrency
+        self.max_keys = max(1, max_keys)
+        self.idle_seconds = idle_seconds
+        self.min_requests = min_requests
+        self.allow_themes = {t.strip().lower() for t in allow_themes if t.strip()}
+
+        # Volgorde = laatst gevraagd achteraan (LRU)
+        self._entries: "OrderedDict[PoolKey, PoolEntry]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale_discarded": 0,
+            "generated": 0,
+            "failed": 0,
+            "evicted": 0,
+        }
+
+    @staticmethod
+    def key(topic: str, theme: str, skill: str) -> PoolKey:
+        return ((topic or "").strip().lower(), (theme or "").strip().lower(), (skill or "general").strip().lower())
+
+    def _drop_stale(self, pool: Deque[Tuple[float, Dict[str, Any]]]):
+        if not self.max_age_seconds:
+            return
+        grens = time.monotonic() - self.max_age_seconds
+        while pool and pool[0][0] < grens:
+            pool.popleft()
+            self._counters["stale_discarded"] += 1
+
+    def _evict(self, now: float):
+        """Gooit combinaties weg die te lang niet gevraagd zijn of boven `max_keys` uitkomen."""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            idle = self.idle_seconds and now - entry.last_used > self.idle_seconds
+            if not idle and len(self._entries) <= self.max_keys:
+                break
+            del self._entries[key]
+            if entry.refill is not None:
+                entry.refill.cancel()
+            self._counters["evicted"] += 1
+
+    def _entry(self, key: PoolKey) -> PoolEntry:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = PoolEntry()
+        self._entries.move_to_end(key)
+        entry.last_used = now
+        self._evict(now)
+        return entry
+
+    def _wants_refill(self, key: PoolKey, entry: PoolEntry) -> bool:
+        return entry.requests >= self.min_requests or key[1] in self.allow_themes
+
+    async def get(self, topic: str, theme: str, skill: str) -> Optional[Dict[str, Any]]:
+        """Geeft een oefening uit de voorraad (of None bij een lege voorraad) en vult daarna aan."""
+        key = self.key(topic, theme, skill)
+        entry = self._entry(key)
+        entry.requests += 1
+        self._drop_stale(entry.exercises)
+
+        exercise = None
+        if entry.exercises:
+            exercise = entry.exercises.popleft()[1]
+            self._counters["hits"] += 1
+        else:
+            self._counters["misses"] += 1
+
+        if self._wants_refill(key, entry):
+            self.schedule_refill(topic, theme, skill)
+        return exercise
+
+    def schedule_refill(self, topic: str, theme: str, skill: str):
+        """Start (hooguit één) achtergrondtaak die de voorraad voor deze combinatie aanvult."""
+        key = self.key(topic, theme, skill)
+        entry = self._entries.get(key) or self._entry(key)
+        if entry.refill is not None and not entry.refill.done():
+            return
+        entry.refill = asyncio.create_task(self._refill(entry, topic, theme, skill))
+
+    async def _refill(self, entry: PoolEntry, topic: str, theme: str, skill: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.refill_concurrency)
+        pool = entry.exercises
+        failures = 0
+        while len(pool) < self.depth and failures < 3:
+            async with self._semaphore:
+                try:
+                    exercise = await self.generate(topic, theme, skill)
+                except Exception:
+                    exercise = None
+            if exercise:
+                pool.append((time.monotonic(), exercise))
+                self._counters["generated"] += 1
+            else:
+                failures += 1
+                self._counters["failed"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / total, 3) if total else 0.0,
+            "pooled": sum(len(e.exercises) for e in self._entries.values()),
+            "keys": len(self._entries),
+            "refilling": sum(1 for e in self._entries.values() if e.refill is not None and not e.refill.done()),
+        }
@@ -1,10 +1,15 @@
 # feedback_generator.py
 import json
 import textwrap
+from contextlib import aclosing
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Iterator, Optional
 
-import requests
+from feedback_templates import get_feedback_templates
+from llm_cache import get_cache
+from llm_scheduler import get_scheduler, klasse_voor
+from ollama_client import get_client
+from rule_grader import BIJNA, CORRECT, INCORRECT
 
 # Let op: dit importeert je bestaande onderdelen
 from answer_checker import (
@@ -15,25 +20,57 @@ from answer_checker import (
 )
 from tutor_personalities import TutorPersonaliteiten, TutorPersoonlijkheid
 
+# Vaste oefeningen: hun feedback is herbruikbaar via de templates
+STATIC_EXERCISE_IDS = frozenset(
+    ex["exercise_id"] for ex in (*MCQ_EXERCISES, *GAPFILL_EXERCISES, *WRITING_EXERCISES)
+)
+
 # ------------------ Config Ollama ------------------ #
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "mistral:7b"
 
+# Zelfde temperatuur als de feedback in ai_tutor_main.py; laag genoeg om gecachet te worden,
+# zodat hetzelfde foute antwoord op dezelfde oefening niet opnieuw naar de LLM gaat
+FEEDBACK_TEMPERATURE = 0.4
+
 
-def call_ollama(prompt: str, model: str = OLLAMA_MODEL, stream: bool = False) -> str:
+def call_ollama(
+    prompt: str,
+    model: str = OLLAMA_MODEL,
+    stream: bool = False,
+    temperature: Optional[float] = None,
+    site: str = "feedback",
+) -> str:
     """
-    Eenvoudige HTTP-call naar Ollama, zelfde stijl als in exercise_generator.py
+    HTTP-call naar Ollama via de gedeelde client, zelfde stijl als in exercise_generator.py
+    Antwoorden gaan via de LLM-cache (zie llm_cache.py).
     """
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": stream,
-    }
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-    resp.raise_for_status()
-    data = resp.json()
-    return data.get("response", "")
+    client = get_client()
+    options = {"temperature": temperature} if temperature is not None else None
+
+    def generate() -> str:
+        with get_scheduler().slot(klasse_voor(site)):
+            if stream:
+                return "".join(client.generate_stream(prompt, model=model, options=options))
+            return client.generate(prompt, model=model, options=options)
+
+    return get_cache().get_or_generate(site, model, temperature, prompt, generate)
+
+
+async def acall_ollama(
+    prompt: str,
+    model: str = OLLAMA_MODEL,
+    temperature: Optional[float] = None,
+    site: str = "feedback",
+) -> str:
+    """Async variant van call_ollama; annuleren breekt de lopende generatie af."""
+    options = {"temperature": temperature} if temperature is not None else None
+
+    async def generate() -> str:
+        async with get_scheduler().aslot(klasse_voor(site)):
+            return await get_client().agenerate(prompt, model=model, options=options)
+
+    return await get_cache().aget_or_generate(site, model, temperature, prompt, generate)
 
 
 # ------------------ Feedback generator kern ------------------ #
@@ -205,25 +242,13 @@ def build_feedback_prompt(
     return prompt
 
 
-def generate_feedback(
+def feedback_result(
     exercise: Dict[str, Any],
-    student_answer: str,
     check_result: Dict[str, Any],
     personality: TutorPersoonlijkheid,
+    feedback_text: str,
 ) -> Dict[str, Any]:
-    """
-    Hoofdfunctie voor andere onderdelen:
-    - bouwt de LLM-prompt
-    - roept Ollama/Mistral aan
-    - geeft een klein, gestructureerd resultaat terug
-    """
-    prompt = build_feedback_prompt(exercise, student_answer, check_result, personality)
-    print("\n[Debug] Verstuur feedback-prompt naar Ollama...")
-    response = call_ollama(prompt).strip()
-    print(f"[Debug] Ruwe LLM-respons (eerste 400 chars):\n{response[:400]}\n")
-
-    feedback_text = response.strip()
-
+    """Het kleine, gestructureerde resultaat dat andere onderdelen verwachten."""
     return {
         "exercise_id": exercise.get("exercise_id"),
         "result": check_result.get("result"),
@@ -237,6 +262,160 @@ def generate_feedback(
     }
 
 
+def feedback_template_key(
+    exercise: Dict[str, Any],
+    student_answer: str,
+    check_result: Optional[Dict[str, Any]],
+    personality: TutorPersoonlijkheid,
+):
+    """
+    Sleutel voor de feedback-templates (zie feedback_templates.py), of None als de feedback
+    niet herbruikbaar is: schrijfopdrachten, nog geen oordeel, of een oefening zonder vast id.
+    Vast zijn de hardcoded oefeningen uit answer_checker.py (mcq_01, gap_01, ...) en oefeningen
+    met een expliciet `template_id`; gegenereerde oefeningen krijgen elke keer een nieuw
+    `exercise_id` en delen nooit een sleutel.
+    """
+    oefening_id = exercise.get("template_id")
+    if not oefening_id and exercise.get("exercise_id") in STATIC_EXERCISE_IDS:
+        oefening_id = exercise["exercise_id"]
+    if check_result is None or not oefening_id or exercise.get("type") == "writing":
+        return None
+    oordeel = {"correct": CORRECT, "almost": BIJNA}.get(check_result.get("result"), INCORRECT)
+    return get_feedback_templates().sleutel(oefening_id, oordeel, personality.naam, student_answer)
+
+
+def generate_feedback(
+    exercise: Dict[str, Any],
+    student_answer: str,
+    check_result: Dict[str, Any],
+    personality: TutorPersoonlijkheid,
+) -> Dict[str, Any]:
+    """
+    Hoofdfunctie voor andere onderdelen:
+    - bouwt de LLM-prompt
+    - roept Ollama/Mistral aan (of haalt herbruikbare feedback uit de templates)
+    - geeft een klein, gestructureerd resultaat terug
+    """
+    prompt = build_feedback_prompt(exercise, student_answer, check_result, personality)
+    sleutel = feedback_template_key(exercise, student_answer, check_result, personality)
+    if sleutel is None:
+        print("\n[Debug] Verstuur feedback-prompt naar Ollama...")
+        response = call_ollama(prompt, temperature=FEEDBACK_TEMPERATURE).strip()
+    else:
+        oefening_id, oordeel, persona, _ = sleutel
+        response = get_feedback_templates().feedback(
+            oefening_id, oordeel, persona, student_answer,
+            lambda temperature: call_ollama(prompt, temperature=temperature),
+            temperature=FEEDBACK_TEMPERATURE,
+        ).strip()
+    print(f"[Debug] Ruwe LLM-respons (eerste 400 chars):\n{response[:400]}\n")
+
+    return feedback_result(exercise, check_result, personality, response.strip())
+
+
+async def agenerate_feedback(
+    exercise: Dict[str, Any],
+    student_answer: str,
+    check_result: Dict[str, Any],
+    personality: TutorPersoonlijkheid,
+) -> Dict[str, Any]:
+    """Async variant van generate_feedback (zelfde prompt en templates)."""
+    prompt = build_feedback_prompt(exercise, student_answer, check_result, personality)
+    sleutel = feedback_template_key(exercise, student_answer, check_result, personality)
+    if sleutel is None:
+        response = await acall_ollama(prompt, temperature=FEEDBACK_TEMPERATURE)
+    else:
+        templates = get_feedback_templates()
+        response = templates.zoek(sleutel, student_answer)
+        if response is None:
+            response = await acall_ollama(prompt, temperature=FEEDBACK_TEMPERATURE)
+            templates.bewaar(sleutel, response, student_answer)
+        else:
+            # Extra formuleringen op de achtergrond-threads van de templates, via de sync call
+            templates.vul_aan(sleutel, student_answer, lambda temperature: call_ollama(prompt, temperature=temperature))
+    return feedback_result(exercise, check_result, personality, response.strip())
+
+
+def generate_feedback_stream(
+    exercise: Dict[str, Any],
+    student_answer: str,
+    check_result: Dict[str, Any],
+    personality: TutorPersoonlijkheid,
+    model: str = OLLAMA_MODEL,
+) -> Iterator[str]:
+    """
+    Streaming variant: geeft de feedbacktekst in stukjes terug zodra Ollama ze stuurt.
+    Herbruikbare feedback uit de templates komt als één stuk terug.
+    """
+    prompt = build_feedback_prompt(exercise, student_answer, check_result, personality)
+    options = {"temperature": FEEDBACK_TEMPERATURE}
+    pieces = get_cache().stream(
+        "feedback", model, FEEDBACK_TEMPERATURE, prompt,
+        lambda: get_scheduler().stream(
+            lambda: get_client().generate_stream(prompt, model=model, options=options), klasse_voor("feedback"),
+        ),
+    )
+    sleutel = feedback_template_key(exercise, student_answer, check_result, personality)
+    if sleutel is None:
+        return pieces
+    return _stream_with_templates(sleutel, student_answer, pieces, prompt, model)
+
+
+def _stream_with_templates(sleutel, student_answer: str, pieces: Iterator[str], prompt: str, model: str) -> Iterator[str]:
+    templates = get_feedback_templates()
+
+    def genereer(temperature: float) -> str:
+        return call_ollama(prompt, model=model, temperature=temperature)
+
+    tekst = templates.zoek(sleutel, student_answer)
+    if tekst is None:
+        received = []
+        for piece in pieces:
+            received.append(piece)
+            yield piece
+        templates.bewaar(sleutel, "".join(received), student_answer)
+    else:
+        yield tekst
+        templates.vul_aan(sleutel, student_answer, genereer)
+
+
+async def agenerate_feedback_stream(
+    exercise: Dict[str, Any],
+    student_answer: str,
+    check_result: Dict[str, Any],
+    personality: TutorPersoonlijkheid,
+    model: str = OLLAMA_MODEL,
+) -> AsyncIterator[str]:
+    """
+    Async variant van generate_feedback_stream. Stopt de lezer (aclose of annulering), dan
+    wordt de verbinding met Ollama gesloten en stopt de generatie; er wordt dan niets bewaard.
+    """
+    prompt = build_feedback_prompt(exercise, student_answer, check_result, personality)
+    sleutel = feedback_template_key(exercise, student_answer, check_result, personality)
+    templates = get_feedback_templates()
+    if sleutel is not None:
+        tekst = templates.zoek(sleutel, student_answer)
+        if tekst is not None:
+            yield tekst
+            templates.vul_aan(sleutel, student_answer, lambda t: call_ollama(prompt, model=model, temperature=t))
+            return
+
+    async def generate() -> AsyncIterator[str]:
+        async with get_scheduler().aslot(klasse_voor("feedback")), aclosing(get_client().agenerate_stream(
+            prompt, model=model, options={"temperature": FEEDBACK_TEMPERATURE},
+        )) as pieces:
+            async for piece in pieces:
+                yield piece
+
+    received = []
+    async with aclosing(get_cache().astream("feedback", model, FEEDBACK_TEMPERATURE, prompt, generate)) as pieces:
+        async for piece in pieces:
+            received.append(piece)
+            yield piece
+    if sleutel is not None:
+        templates.bewaar(sleutel, "".join(received), student_answer)
+
+
 # ------------------ CLI om te testen ------------------ #
 
 def choose_tutor() -> TutorPersoonlijkheid:
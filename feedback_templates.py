@@ -0,0 +1,196 @@
+# feedback_templates.py
+"""
+Kant-en-klare feedback voor gesloten vragen met een vaste uitkomst.
+
+Bij een statische oefening (bv. een item uit de oefeningenbank) liggen de vraag, het juiste
+antwoord en de uitleg vast. Feedback hangt dan alleen nog af van:
+- de oefening (een vast id, zoals het content-id uit de bank),
+- het oordeel (CORRECT / BIJNA / INCORRECT),
+- de tutor-persoonlijkheid,
+- bij een fout antwoord: het (genormaliseerde) antwoord zelf.
+
+Per sleutel worden een paar formuleringen bewaard. De eerste komt uit de gewone LLM-call;
+pas als een sleutel opnieuw gebruikt wordt, komt de rest op de achtergrond (met een hogere
+temperatuur, voor variatie). Zo kosten sleutels die maar één leerling ooit raakt geen extra
+calls. Daarna komt de feedback direct uit de cache, met om en om een andere formulering en
+het letterlijke antwoord van de leerling erin. De LLM wordt dus alleen nog aangeroepen voor
+een fout antwoord dat nog niemand gegeven heeft.
+
+Gegenereerde oefeningen (elke keer andere inhoud) horen hier niet: die delen nooit een sleutel.
+
+Configuratie via environment variabelen:
+    FEEDBACK_TEMPLATE_VARIANTS (standaard 3), FEEDBACK_TEMPLATE_WORKERS (standaard 2),
+    FEEDBACK_TEMPLATE_MAX_KEYS (standaard 5000)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llm_scheduler import PREFETCH, als
+from rule_grader import CORRECT, normaliseer
+
+TemplateKey = Tuple[str, str, str, str]
+
+# Temperatuur voor de extra formuleringen; boven de drempel van de LLM-cache, dus echt nieuw
+VARIANT_TEMPERATURE = 0.9
+
+
+def bruikbaar(tekst: Optional[str]) -> bool:
+    # LLMInterface geeft bij fouten een placeholder terug die met "[LLM" begint
+    return bool(tekst and tekst.strip()) and not tekst.startswith("[LLM")
+
+
+class FeedbackTemplateCache:
+    def __init__(self, varianten: int = 3, workers: int = 2, max_keys: int = 5000):
+        self.varianten = varianten
+        self.max_keys = max_keys
+
+        # sleutel -> lijst van (tekst, antwoord waarmee hij gemaakt is); volgorde = LRU
+        self._templates: "OrderedDict[TemplateKey, List[Tuple[str, str]]]" = OrderedDict()
+        self._volgende: Dict[TemplateKey, int] = {}
+        self._bezig: set = set()
+        self._aangevuld: set = set()  # één aanvulronde per sleutel, ook als er dubbele formuleringen uitkwamen
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="feedback-templates")
+        self._counters = {"hits": 0, "misses": 0, "achtergrond": 0, "achtergrond_mislukt": 0}
+
+    @classmethod
+    def from_env(cls) -> "FeedbackTemplateCache":
+        return cls(
+            varianten=int(os.getenv("FEEDBACK_TEMPLATE_VARIANTS", "3")),
+            workers=int(os.getenv("FEEDBACK_TEMPLATE_WORKERS", "2")),
+            max_keys=int(os.getenv("FEEDBACK_TEMPLATE_MAX_KEYS", "5000")),
+        )
+
+    @staticmethod
+    def sleutel(oefening_id: str, oordeel: str, persona: str, antwoord: str) -> TemplateKey:
+        # Bij een goed antwoord maakt de precieze schrijfwijze niet uit
+        return (oefening_id, oordeel.upper(), persona, "" if oordeel.upper() == CORRECT else normaliseer(antwoord))
+
+    # ---------- Opvragen en opslaan ---------- #
+
+    def zoek(self, sleutel: TemplateKey, antwoord: str) -> Optional[str]:
+        """Een bewaarde formulering (steeds een andere), of None als deze sleutel nieuw is."""
+        with self._lock:
+            varianten = self._templates.get(sleutel)
+            if not varianten:
+                self._counters["misses"] += 1
+                return None
+            self._templates.move_to_end(sleutel)
+            index = self._volgende.get(sleutel, 0)
+            self._volgende[sleutel] = index + 1
+            self._counters["hits"] += 1
+            tekst, origineel = varianten[index % len(varianten)]
+        return self._personaliseer(tekst, origineel, antwoord)
+
+    def bewaar(self, sleutel: TemplateKey, tekst: str, antwoord: str):
+        if not bruikbaar(tekst):
+            return
+        with self._lock:
+            varianten = self._templates.setdefault(sleutel, [])
+            self._templates.move_to_end(sleutel)
+            if len(varianten) < self.varianten and all(t != tekst for t, _ in varianten):
+                varianten.append((tekst.strip(), antwoord.strip()))
+            while len(self._templates) > self.max_keys:
+                oud, _ = self._templates.popitem(last=False)
+                self._volgende.pop(oud, None)
+                self._aangevuld.discard(oud)
+
+    def vul_aan(self, sleutel: TemplateKey, antwoord: str, genereer: Callable[[float], str]):
+        """Genereert op de achtergrond formuleringen tot er `varianten` zijn (hooguit één taak per sleutel)."""
+        with self._lock:
+            aantal = len(self._templates.get(sleutel, []))
+            if aantal >= self.varianten or sleutel in self._bezig or sleutel in self._aangevuld:
+                return
+            self._bezig.add(sleutel)
+        self._pool.submit(self._vul_aan, sleutel, antwoord, genereer, self.varianten - aantal)
+
+    def _vul_aan(self, sleutel: TemplateKey, antwoord: str, genereer: Callable[[float], str], aantal: int):
+        try:
+            for _ in range(aantal):
+                try:
+                    # Achtergrondwerk: wijkt voor chat en nakijken (zie llm_scheduler.py)
+                    with als(PREFETCH):
+                        tekst = genereer(VARIANT_TEMPERATURE)
+                except Exception:
+                    tekst = None
+                with self._lock:
+                    self._counters["achtergrond" if bruikbaar(tekst) else "achtergrond_mislukt"] += 1
+                if not bruikbaar(tekst):
+                    break
+                self.bewaar(sleutel, tekst, antwoord)
+        finally:
+            with self._lock:
+                self._bezig.discard(sleutel)
+                if sleutel in self._templates:
+                    self._aangevuld.add(sleutel)
+
+    def feedback(
+        self,
+        oefening_id: str,
+        oordeel: str,
+        persona: str,
+        antwoord: str,
+        genereer: Callable[[float], str],
+        temperature: float,
+    ) -> str:
+        """
+        Feedback uit de cache, of één keer via `genereer(temperature)` en daarna bewaard.
+        Bij een treffer worden ontbrekende formuleringen op de achtergrond aangevuld.
+        """
+        sleutel = self.sleutel(oefening_id, oordeel, persona, antwoord)
+        tekst = self.zoek(sleutel, antwoord)
+        if tekst is None:
+            tekst = genereer(temperature)
+            self.bewaar(sleutel, tekst, antwoord)
+        else:
+            self.vul_aan(sleutel, antwoord, genereer)
+        return tekst
+
+    @staticmethod
+    def _personaliseer(tekst: str, origineel: str, antwoord: str) -> str:
+        """Het letterlijke antwoord van deze leerling in plaats van dat van de eerste leerling."""
+        antwoord = antwoord.strip()
+        if len(origineel) >= 2 and antwoord and origineel != antwoord:
+            tekst = tekst.replace(f'"{origineel}"', f'"{antwoord}"').replace(f"'{origineel}'", f"'{antwoord}'")
+        return tekst
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            totaal = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / totaal, 3) if totaal else 0.0,
+                "sleutels": len(self._templates),
+                "formuleringen": sum(len(v) for v in self._templates.values()),
+                "bezig": len(self._bezig),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._volgende.clear()
+            self._aangevuld.clear()
+            self._counters = {k: 0 for k in self._counters}
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_templates: Optional[FeedbackTemplateCache] = None
+_templates_lock = threading.Lock()
+
+
+def get_feedback_templates() -> FeedbackTemplateCache:
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                _templates = FeedbackTemplateCache.from_env()
+    return _templates
@@ -13,13 +13,52 @@ export interface Exercise {
   explanation: string;
 }
 
+export interface ChatTurn {
+  seq: number;
+  role: "user" | "tutor" | "exercise";
+  text?: string;
+  exercise?: Exercise;
+}
+
+// De server stuurt per beurt alleen de nieuwe turns (delta) mee; hier houden we de volledige lijst bij
+const historyCache: Record<string, { seq: number; turns: ChatTurn[] }> = {};
+
+export async function fetchHistory(sessionId: string, after = 0, limit = 100) {
+  const response = await fetch(`${API_URL}/history/${sessionId}?after=${after}&limit=${limit}`);
+  if (!response.ok) throw new Error("History fetch failed");
+  return response.json() as Promise<{ turns: ChatTurn[]; next_cursor: number; has_more: boolean; seq: number }>;
+}
+
+async function mergeDelta(sessionId: string, delta: ChatTurn[]) {
+  const cache = (historyCache[sessionId] ??= { seq: 0, turns: [] });
+
+  // Gat in de volgnummers (bijv. een gemist antwoord): haal de ontbrekende turns op via de cursor
+  if (delta.length && delta[0].seq > cache.seq + 1) {
+    let cursor = cache.seq;
+    let hasMore = true;
+    while (hasMore) {
+      const page = await fetchHistory(sessionId, cursor);
+      cache.turns.push(...page.turns.filter(t => t.seq > cache.seq));
+      if (page.turns.length) cache.seq = page.turns[page.turns.length - 1].seq;
+      cursor = page.next_cursor;
+      hasMore = page.has_more && page.turns.length > 0;
+    }
+  }
+  for (const turn of delta) {
+    if (turn.seq > cache.seq) { cache.turns.push(turn); cache.seq = turn.seq; }
+  }
+  return cache.turns;
+}
+
 export async function createSession(config: SessionConfig) {
   // CHECK: Hier moet /start_session staan (niet /api/session)
   const response = await fetch(`${API_URL}/start_session`, { 
     method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(config),
   });
   if (!response.ok) throw new Error("Start session failed");
-  return response.json();
+  const data = await response.json();
+  historyCache[data.session_id] = { seq: data.state.seq ?? 0, turns: [] };
+  return data;
 }
 
 export async function sendMessage(sessionId: string, text: string) {
@@ -27,7 +66,51 @@ export async function sendMessage(sessionId: string, text: string) {
     method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ text }),
   });
   if (!response.ok) throw new Error("Send message failed");
-  return response.json();
+  const data = await response.json();
+  const chat_history = await mergeDelta(sessionId, data.state.delta || []);
+  return { ...data, state: { ...data.state, chat_history } };
+}
+
+export interface StreamHandlers {
+  onToken?: (text: string) => void;
+  // Losse velden van de oefening (bijv. de vraag) zodra ze compleet zijn, vóór de volledige oefening
+  onExerciseField?: (field: string, value: unknown) => void;
+  onExercise?: (exercise: Exercise) => void;
+}
+
+// Streaming variant van sendMessage: tokens komen binnen via Server-Sent Events
+export async function streamMessage(sessionId: string, text: string, handlers: StreamHandlers = {}) {
+  const response = await fetch(`${API_URL}/chat_stream/${sessionId}`, {
+    method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ text }),
+  });
+  if (!response.ok || !response.body) throw new Error("Send message failed");
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done: { text: string; theme: string; seq: number; delta: ChatTurn[] } | null = null;
+
+  while (true) {
+    const { value, done: streamDone } = await reader.read();
+    if (streamDone) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE events worden gescheiden door een lege regel
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || "{}");
+
+      if (event === "token") handlers.onToken?.(data.text);
+      else if (event === "exercise_field") handlers.onExerciseField?.(data.field, data.value);
+      else if (event === "exercise") handlers.onExercise?.(data.exercise);
+      else if (event === "done") { done = data; await mergeDelta(sessionId, data.delta || []); }
+      else if (event === "error") throw new Error(data.detail || "Send message failed");
+    }
+  }
+  return done;
 }
 
 export async function setTheme(sessionId: string, theme: string) {
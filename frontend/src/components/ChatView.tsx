@@ -138,18 +138,40 @@ export function ChatView({ vak }: Props) {
     setMessage("");
     setIsLoading(true);
 
+    // Het tutor-bericht groeit mee met de binnenkomende tokens
+    const tutorMsgId = Date.now() + 1;
+    const updateTutorText = (update: (text: string) => string) => setMessages(prev => {
+        const exists = prev.some(m => m.id === tutorMsgId);
+        if (!exists) return [...prev, { id: tutorMsgId, type: "tutor", text: update("") }];
+        return prev.map(m => m.id === tutorMsgId ? { ...m, text: update(m.text || "") } : m);
+    });
+
+    // De oefening verschijnt al zodra de vraag binnen is en wordt daarna aangevuld
+    const exerciseMsgId = Date.now() + 2;
+    const upsertExercise = (update: Partial<api.Exercise>) => setMessages(prev => {
+        const base: api.Exercise = { type: "multiple_choice", question: "", options: [], correct_answer: "", explanation: "" };
+        const exists = prev.some(m => m.id === exerciseMsgId);
+        if (!exists) return [...prev, { id: exerciseMsgId, type: "exercise", exercise: { ...base, ...update } }];
+        return prev.map(m => m.id === exerciseMsgId ? { ...m, exercise: { ...base, ...m.exercise, ...update } } : m);
+    });
+
     try {
-      const data = await api.sendMessage(sessionId, textToSend);
-      if (data && data.state && data.state.chat_history) {
-          const lastMsg = data.state.chat_history[data.state.chat_history.length - 1];
-          const newMessages: UIMessage[] = data.state.chat_history.map((msg: any, idx: number) => {
-            if (msg.role === 'exercise' || msg.exercise) return { id: Date.now() + idx, type: 'exercise', exercise: msg.exercise };
-            return { id: Date.now() + idx, type: msg.role === 'user' ? 'user' : 'tutor', text: msg.text || "..." };
-          });
-          setMessages(newMessages);
-          
+      let exercise = null as api.Exercise | null;
+      const partial: Partial<api.Exercise> = {};
+      const done = await api.streamMessage(sessionId, textToSend, {
+          onToken: (token) => { setIsLoading(false); updateTutorText(text => text + token); },
+          onExerciseField: (field, value) => {
+              (partial as Record<string, unknown>)[field] = value;
+              if (partial.question) upsertExercise(partial);
+          },
+          onExercise: (ex) => { exercise = ex; },
+      });
+      if (done) {
+          updateTutorText(() => done.text);
+          const ex = exercise;
+          if (ex) upsertExercise(ex);
           // Ook hier geven we expliciet de activeTutorId mee
-          if (lastMsg && lastMsg.role !== 'user' && lastMsg.role !== 'exercise') playTutorAudio(lastMsg.text, activeTutorId);
+          if (done.text) playTutorAudio(done.text, activeTutorId);
       }
     } catch (error) { console.error(error); } finally { setIsLoading(false); }
   };
@@ -0,0 +1,270 @@
+# json_schemas.py
+"""
+JSON-schema's voor alle gestructureerde LLM-output (oefeningen, batches, nakijkresultaat).
+
+Het schema gaat mee als Ollama `format` of als OpenAI `response_format`, zodat het model
+alleen geldige JSON in de juiste vorm kan teruggeven. Na het parsen wordt de output nog
+tegen hetzelfde schema gecontroleerd en per aanroepplek bijgehouden hoe vaak de JSON direct
+geldig was, gerepareerd moest worden of niet aan het schema voldeed.
+
+Met LLM_STRUCTURED_OUTPUT=0 gaan de schema's niet mee (oude gedrag: alleen "format": "json"
+of een instructie in de prompt); de metrics staan per modus, zodat je beide kunt vergelijken.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from json_stream import parse_json
+
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+
+Schema = Dict[str, Any]
+
+# ================================================================
+#  Bouwstenen
+# ================================================================
+
+STRING: Schema = {"type": "string"}
+SCORE: Schema = {"type": "number", "minimum": 0, "maximum": 1}
+
+
+def _object(properties: Dict[str, Schema]) -> Schema:
+    # Alle velden verplicht en geen extra velden: vereist door OpenAI's strict mode
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def _strings(min_items: int = 0, max_items: Optional[int] = None) -> Schema:
+    schema: Schema = {"type": "array", "items": STRING}
+    if min_items:
+        schema["minItems"] = min_items
+    if max_items is not None:
+        schema["maxItems"] = max_items
+    return schema
+
+
+# ================================================================
+#  Oefeningen (exercise_generator)
+# ================================================================
+
+_EXERCISE_CONTENT = {
+    "gapfill": _object({"sentence": STRING}),
+    "mcq": _object({"question": STRING, "options": _strings(4, 4)}),
+    "reading": _object({"passage": STRING, "question": STRING, "options": _strings(4, 4)}),
+    "writing": _object({
+        "prompt": STRING,
+        "rubric": _object({"structure": STRING, "content": STRING, "language": STRING, "length": STRING}),
+        "word_limit": _object({"min": {"type": "integer"}, "max": {"type": "integer"}}),
+    }),
+}
+
+_OPTION_ANSWER = _object({
+    "correct_index": {"type": "integer", "minimum": 0, "maximum": 3},
+    "correct_option": STRING,
+})
+
+_EXERCISE_ANSWER_KEY = {
+    "gapfill": _object({"correct_answer": STRING}),
+    "mcq": _OPTION_ANSWER,
+    "reading": _OPTION_ANSWER,
+    "writing": {"type": "null"},
+}
+
+
+def exercise_schema(exercise_type: str) -> Schema:
+    """Schema voor één oefening van `exercise_type` (gapfill, mcq, reading of writing)."""
+    return _object({
+        "exercise_id": STRING,
+        "type": {"type": "string", "enum": [exercise_type]},
+        "topic": STRING,
+        "difficulty": {"type": "string", "enum": ["easy", "medium", "hard"]},
+        "instructions": STRING,
+        "content": _EXERCISE_CONTENT[exercise_type],
+        "answer_key": _EXERCISE_ANSWER_KEY[exercise_type],
+        "metadata": _object({"theme": STRING, "explanation": STRING}),
+    })
+
+
+def exercise_batch_schema(exercise_types: List[str]) -> Schema:
+    """Schema voor {"exercises": [...]}; elk item moet een van de gevraagde types zijn."""
+    item_schemas = [exercise_schema(t) for t in dict.fromkeys(exercise_types)]
+    items = item_schemas[0] if len(item_schemas) == 1 else {"anyOf": item_schemas}
+    return _object({
+        "exercises": {
+            "type": "array",
+            "items": items,
+            "minItems": len(exercise_types),
+            "maxItems": len(exercise_types),
+        },
+    })
+
+
+# ================================================================
+#  Nakijken en chat-oefeningen
+# ================================================================
+
+WRITING_SCORE_SCHEMA = _object({
+    "overall_score": SCORE,
+    "result": {"type": "string", "enum": ["correct", "almost", "incorrect"]},
+    "criteria": _object({"structure": SCORE, "content": SCORE, "language": SCORE}),
+    "error_types": _strings(),
+})
+
+# De oefening die main.py in het chatgesprek laat maken
+CHAT_EXERCISE_SCHEMA = _object({
+    "type": {"type": "string", "enum": ["writing", "gap_fill", "multiple_choice"]},
+    "question": STRING,
+    "options": _strings(),
+    "correct_answer": STRING,
+    "explanation": STRING,
+})
+
+
+def _mode(structured: Optional[bool]) -> bool:
+    return STRUCTURED_OUTPUT if structured is None else structured
+
+
+def ollama_format(schema: Schema, structured: Optional[bool] = None):
+    """Waarde voor Ollama's `format`: het schema zelf, of alleen "json" als schema's uit staan."""
+    return schema if _mode(structured) else "json"
+
+
+def openai_response_format(name: str, schema: Schema) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+# ================================================================
+#  Validatie
+# ================================================================
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def validate(value: Any, schema: Schema, path: str = "$") -> List[str]:
+    """
+    Controleert `value` tegen het deel van JSON Schema dat hierboven gebruikt wordt
+    (type, enum, properties/required/additionalProperties, items, min/max, anyOf).
+    Geeft een lijst met problemen terug; leeg betekent geldig.
+    """
+    if "anyOf" in schema:
+        for option in schema["anyOf"]:
+            if not validate(value, option, path):
+                return []
+        return [f"{path}: past bij geen van de toegestane vormen"]
+
+    expected = schema.get("type")
+    if expected is not None:
+        python_type = _TYPES[expected]
+        # bool is in Python een int, maar in JSON geen getal
+        if not isinstance(value, python_type) or (isinstance(value, bool) and expected != "boolean"):
+            return [f"{path}: verwacht {expected}, kreeg {type(value).__name__}"]
+
+    problems: List[str] = []
+    if "enum" in schema and value not in schema["enum"]:
+        problems.append(f"{path}: {value!r} niet in {schema['enum']}")
+    if "minimum" in schema and value < schema["minimum"]:
+        problems.append(f"{path}: {value} < {schema['minimum']}")
+    if "maximum" in schema and value > schema["maximum"]:
+        problems.append(f"{path}: {value} > {schema['maximum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                problems.append(f"{path}.{key}: ontbreekt")
+        for key, item in value.items():
+            if key in properties:
+                problems.extend(validate(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                problems.append(f"{path}.{key}: onbekend veld")
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            problems.append(f"{path}: minder dan {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            problems.append(f"{path}: meer dan {schema['maxItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                problems.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return problems
+
+
+# ================================================================
+#  Parse-statistieken
+# ================================================================
+
+class ParseStats:
+    """Telt per aanroepplek en modus (schema / vrij) hoe de LLM-output geparsed kon worden."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def record(self, site: str, status: str, structured: Optional[bool] = None):
+        """`status`: "direct" (json.loads), "hersteld" (json_stream), "ongeldig" (schema) of "mislukt"."""
+        key = (site, "schema" if _mode(structured) else "vrij")
+        with self._lock:
+            counters = self._counters.setdefault(key, {"direct": 0, "hersteld": 0, "ongeldig": 0, "mislukt": 0})
+            counters[status] += 1
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for (site, mode), counters in sorted(self._counters.items()):
+                total = sum(counters.values())
+                result[f"{site}/{mode}"] = {
+                    **counters,
+                    "totaal": total,
+                    "direct_aandeel": round(counters["direct"] / total, 3) if total else 0.0,
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+parse_stats = ParseStats()
+
+
+def parse_status(repaired: bool, problems: List[str]) -> str:
+    if problems:
+        return "ongeldig"
+    return "hersteld" if repaired else "direct"
+
+
+def parse_structured(
+    raw: str,
+    schema: Schema,
+    site: str,
+    structured: Optional[bool] = None,
+) -> Tuple[Any, List[str]]:
+    """
+    Parseert LLM-output: eerst gewoon json.loads, bij een fout herstellen met json_stream.
+    Geeft (waarde, schema-problemen) terug en telt het resultaat mee in `parse_stats`.
+    ValueError als er helemaal geen JSON in de output staat.
+    """
+    try:
+        value, repaired = json.loads(raw), False
+    except (ValueError, RecursionError):  # RecursionError: extreem diep genest, json_stream kapt dat af
+        try:
+            value, repaired = parse_json(raw, start_chars="{"), True
+        except ValueError:
+            parse_stats.record(site, "mislukt", structured)
+            raise
+    problems = validate(value, schema)
+    parse_stats.record(site, parse_status(repaired, problems), structured)
+    return value, problems
@@ -0,0 +1,402 @@
+# json_stream.py
+"""
+Incrementele JSON-parser voor LLM-output.
+
+Leest de tokenstream teken voor teken (één keer) en geeft elk veld terug zodra het
+gesloten is, zodat bijvoorbeeld de vraag al getoond kan worden terwijl de opties nog
+binnenkomen. Veelgemaakte LLM-fouten worden in dezelfde doorgang hersteld:
+- tekst of ```json-fences vóór het object en alles ná het object wordt genegeerd,
+- enkele quotes ('...'), ge-escapete quotes rond het hele object ({\"a\": 1}),
+- losse aanhalingstekens binnen een string ("He said "hi" to me"),
+- ontbrekende of overbodige komma's, sleutels zonder quotes, // commentaar,
+- Python/JS-waarden (True, False, None, undefined),
+- afgekapte output: open strings, arrays en objecten worden bij close() gesloten.
+
+Gebruik:
+    parser = StreamingJSONParser()
+    for chunk in stream:
+        for path, value in parser.feed(chunk):
+            ...                     # bv. (("content", "question"), "Which ...?")
+    data = parser.close()
+
+    data = parse_json(tekst)        # alles in één keer
+"""
+
+import json
+import re
+from typing import Any, AsyncIterable, Iterable, Iterator, List, Optional, Tuple
+
+Path = Tuple[Any, ...]
+Event = Tuple[Path, Any]
+
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = {
+    "true": True, "True": True,
+    "false": False, "False": False,
+    "null": None, "None": None, "undefined": None, "NaN": None,
+}
+_NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+_DELIMITERS = set(",:]}[{\"' \t\r\n\\/")
+# Na een afsluitend aanhalingsteken moet (na witruimte) een van deze tekens volgen,
+# anders hoorde het aanhalingsteken bij de tekst
+_AFTER_STRING = set(",:]}\"'\\")
+# Dieper genest dan dit komt in een oefening of beoordeling niet voor; verder lezen
+# zou bij kapotte output (bv. "[[[[...") alleen tijd kosten
+MAX_DEPTH = 64
+
+
+def _decode_string(raw: str) -> str:
+    """Verwerkt escapes in een string; onbekende escapes blijven letterlijk staan."""
+    if "\\" not in raw:
+        return raw
+    out: List[str] = []
+    i = 0
+    while i < len(raw):
+        ch = raw[i]
+        if ch != "\\" or i + 1 >= len(raw):
+            out.append(ch)
+            i += 1
+            continue
+        nxt = raw[i + 1]
+        if nxt == "u" and re.match(r"[0-9a-fA-F]{4}", raw[i + 2:i + 6]):
+            # Opeenvolgende \uXXXX samen decoderen (surrogate pairs)
+            j = i
+            while re.match(r"\\u[0-9a-fA-F]{4}", raw[j:j + 6]):
+                j += 6
+            try:
+                out.append(json.loads('"' + raw[i:j] + '"'))
+            except ValueError:
+                out.append(raw[i:j])
+            i = j
+            continue
+        out.append(_ESCAPES.get(nxt, "\\" + nxt))
+        i += 2
+    return "".join(out)
+
+
+def _bare_value(token: str) -> Any:
+    if token in _LITERALS:
+        return _LITERALS[token]
+    if _NUMBER.match(token):
+        return float(token) if any(c in token for c in ".eE") else int(token)
+    return token
+
+
+class StreamingJSONParser:
+    def __init__(self, start_chars: str = "{[", max_depth: int = MAX_DEPTH):
+        # Pas bij een van deze tekens begint het JSON-deel (alles ervoor is proza)
+        self.start_chars = start_chars
+        self.max_depth = max_depth
+        self.value: Any = None
+        self.done = False
+        self.repairs = 0
+        self.first_array_path: Optional[Path] = None
+
+        self._stack: List[dict] = []
+        self._string: Optional[List[str]] = None  # open string (ruwe tekens)
+        self._quote = ""                          # '"', "'" of '\\"'
+        self._escaped = False
+        self._closing: Optional[List[str]] = None # mogelijk sluitend quote + witruimte erna
+        self._bare: Optional[List[str]] = None    # open token zonder quotes
+        self._comment = False
+        self._backslash = False                   # losse backslash buiten een string
+        self._events: List[Event] = []
+
+    # ---------- Publiek ---------- #
+
+    def feed(self, chunk: str) -> List[Event]:
+        """Verwerkt een stuk tekst; geeft de velden terug die daardoor compleet zijn geworden."""
+        self._events = []
+        for ch in chunk:
+            if self.done:
+                break
+            self._char(ch)
+        return self._events
+
+    def close(self) -> Any:
+        """Einde van de stream: sluit wat nog open staat en geeft de (herstelde) waarde terug."""
+        self._events = []
+        self._close_all()
+        return self.value
+
+    def _close_all(self):
+        if not self.done:
+            if self._closing is not None:
+                self._finish_string()
+            elif self._string is not None:
+                self.repairs += 1
+                self._finish_string()
+            self._finish_bare()
+            while self._stack:
+                self.repairs += 1
+                self._close_container()
+
+    @property
+    def started(self) -> bool:
+        return self.value is not None
+
+    # ---------- Tekens ---------- #
+
+    def _char(self, ch: str):
+        if self._closing is not None:
+            if ch in " \t\r\n":
+                self._closing.append(ch)
+                return
+            if ch in _AFTER_STRING:
+                self._finish_string()
+            else:
+                # Het aanhalingsteken hoorde bij de tekst
+                self.repairs += 1
+                self._string.append("'" if self._quote == "'" else '\\"')
+                self._string.extend(self._closing)
+                self._closing = None
+                self._string.append(ch)
+                return
+
+        if self._string is not None:
+            self._string_char(ch)
+            return
+
+        if self._comment:
+            if ch == "\n":
+                self._comment = False
+            return
+
+        if not self._stack:
+            if ch in self.start_chars and not self.started:
+                self._open_container(ch)
+            elif ch == "\\" and not self.started:
+                return
+            return
+
+        if self._bare is not None:
+            if ch not in _DELIMITERS:
+                self._bare.append(ch)
+                return
+            self._finish_bare()
+
+        if self._backslash:
+            self._backslash = False
+            if ch == '"':
+                self._open_string('\\"')
+                return
+
+        if ch in " \t\r\n,:":
+            return
+        if ch in "{[":
+            self._open_container(ch)
+        elif ch in "}]":
+            self._close_container(ch)
+        elif ch in "\"'":
+            self._open_string(ch)
+        elif ch == "\\":
+            self._backslash = True
+        elif ch == "/":
+            self._comment = True
+        elif ch == "`":
+            self.repairs += 1
+        else:
+            self._bare = [ch]
+
+    def _string_char(self, ch: str):
+        if self._quote == '\\"':
+            # String die met \" begon: \" sluit hem ook weer
+            if self._escaped:
+                self._escaped = False
+                if ch == '"':
+                    self._closing = []
+                    return
+                self._string.extend(("\\", ch))
+                return
+            if ch == "\\":
+                self._escaped = True
+                return
+            self._string.append(ch)
+            return
+
+        if self._escaped:
+            self._escaped = False
+            self._string.append(ch)
+            return
+        if ch == "\\":
+            self._escaped = True
+            self._string.append(ch)
+            return
+        if ch == self._quote:
+            self._closing = []
+            return
+        if ch == '"':
+            # Dubbele quote binnen een '...'-string: escapen zodat de decode klopt
+            self._string.append('\\"')
+            return
+        if ch in "\n\r" and self._quote == '"':
+            self.repairs += 1
+        self._string.append(ch)
+
+    # ---------- Waarden ---------- #
+
+    def _open_string(self, quote: str):
+        if quote != '"':
+            self.repairs += 1
+        self._string = []
+        self._quote = quote
+        self._escaped = False
+        self._closing = None
+
+    def _finish_string(self):
+        raw = "".join(self._string)
+        self._string = None
+        self._closing = None
+        self._emit_scalar(_decode_string(raw), is_string=True)
+
+    def _finish_bare(self):
+        if self._bare is None:
+            return
+        token = "".join(self._bare)
+        self._bare = None
+        frame = self._stack[-1] if self._stack else None
+        if token not in _LITERALS and not _NUMBER.match(token):
+            self.repairs += 1
+        if frame is not None and frame["type"] == "obj" and frame["key"] is None:
+            frame["key"] = token  # sleutel zonder quotes
+            return
+        self._emit_scalar(_bare_value(token), is_string=False)
+
+    def _emit_scalar(self, value: Any, is_string: bool):
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame["type"] == "obj":
+            if frame["key"] is None:
+                frame["key"] = value if is_string else str(value)
+                return
+            key = frame["key"]
+            frame["key"] = None
+            frame["value"][key] = value
+            self._events.append((frame["path"] + (key,), value))
+        else:
+            frame["value"].append(value)
+            self._events.append((frame["path"] + (len(frame["value"]) - 1,), value))
+
+    # ---------- Containers ---------- #
+
+    def _open_container(self, ch: str):
+        if len(self._stack) >= self.max_depth:
+            # Te diep genest: stoppen en houden wat er tot nu toe staat
+            self.repairs += 1
+            self._close_all()
+            return
+        container: Any = {} if ch == "{" else []
+        if not self._stack:
+            path: Path = ()
+            self.value = container
+        else:
+            parent = self._stack[-1]
+            if parent["type"] == "obj":
+                key = parent["key"]
+                if key is None:
+                    # Object of array op een sleutel-positie: onder een verzonnen sleutel zetten
+                    self.repairs += 1
+                    key = f"_{len(parent['value'])}"
+                parent["key"] = None
+                parent["value"][key] = container
+                path = parent["path"] + (key,)
+            else:
+                parent["value"].append(container)
+                path = parent["path"] + (len(parent["value"]) - 1,)
+        if ch == "[" and self.first_array_path is None:
+            self.first_array_path = path
+        self._stack.append({
+            "type": "obj" if ch == "{" else "arr",
+            "value": container,
+            "key": None,
+            "path": path,
+        })
+
+    def _close_container(self, ch: Optional[str] = None):
+        if ch is not None:
+            wanted = "obj" if ch == "}" else "arr"
+            if not any(f["type"] == wanted for f in self._stack):
+                self.repairs += 1
+                return  # sluitteken zonder bijbehorende opening: negeren
+            # Tussenliggende (vergeten) containers ook sluiten
+            while self._stack[-1]["type"] != wanted:
+                self.repairs += 1
+                self._close_container()
+        frame = self._stack.pop()
+        if frame["type"] == "obj" and frame["key"] is not None:
+            self.repairs += 1  # sleutel zonder waarde
+        self._events.append((frame["path"], frame["value"]))
+        if not self._stack:
+            self.done = True
+
+
+# ================================================================
+#  Hulpfuncties
+# ================================================================
+
+def parse_json(text: str, start_chars: str = "{[") -> Any:
+    """Parseert (en herstelt) JSON uit een volledige LLM-response; ValueError als er geen JSON in staat."""
+    parser = StreamingJSONParser(start_chars)
+    parser.feed(text)
+    value = parser.close()
+    if value is None:
+        raise ValueError("Geen JSON gevonden in LLM-output.")
+    return value
+
+
+def iter_json_events(pieces: Iterable[str], start_chars: str = "{[") -> Iterator[Event]:
+    """(pad, waarde) voor elk veld zodra het compleet is; als laatste het (herstelde) geheel met pad ()."""
+    parser = StreamingJSONParser(start_chars)
+    for piece in pieces:
+        for event in parser.feed(piece):
+            yield event
+        if parser.done:
+            return
+    if not parser.done and parser.started:
+        parser.close()
+        yield (), parser.value
+
+
+def iter_array_items(pieces: Iterable[str], start_chars: str = "{[") -> Iterator[Any]:
+    """
+    Geeft elk element van de eerste array terug zodra het compleet is (bv. de oefeningen
+    in {"exercises": [...]}), zonder op de rest van de output te wachten.
+    """
+    parser = StreamingJSONParser(start_chars)
+    for piece in pieces:
+        for path, value in parser.feed(piece):
+            array_path = parser.first_array_path
+            if array_path is None:
+                continue
+            if path == array_path:
+                return
+            if len(path) == len(array_path) + 1 and path[:-1] == array_path:
+                yield value
+        if parser.done:
+            return
+    # Afgekapte stream: een half item wordt niet doorgegeven
+
+
+def read_until_complete(pieces: Iterable[str], start_chars: str = "{[") -> str:
+    """Leest de stream tot de JSON-waarde compleet is en geeft de gelezen tekst terug."""
+    parser = StreamingJSONParser(start_chars)
+    buffer = []
+    for piece in pieces:
+        buffer.append(piece)
+        parser.feed(piece)
+        if parser.done:
+            break
+    return "".join(buffer)
+
+
+async def aread_until_complete(pieces: AsyncIterable[str], start_chars: str = "{[") -> str:
+    """Async variant van read_until_complete; stopt met lezen (en dus met genereren) zodra de waarde compleet is."""
+    parser = StreamingJSONParser(start_chars)
+    buffer = []
+    async for piece in pieces:
+        buffer.append(piece)
+        parser.feed(piece)
+        if parser.done:
+            break
+    return "".join(buffer)
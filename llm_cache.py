@@ -0,0 +1,378 @@
+# llm_cache.py
+"""
+Cache voor LLM-antwoorden, gedeeld door alle Ollama-aanroepen.
+
+- Sleutel: model + temperatuur + hash van de genormaliseerde prompt (witruimte samengevoegd),
+  dus dezelfde begroeting, uitleg of feedback op hetzelfde foute antwoord komt uit de cache.
+- Boven `max_temperature` wordt de cache overgeslagen: daar is variatie juist de bedoeling.
+  Zonder expliciete temperatuur geldt Ollama's standaard (0.8), dus ook die calls gaan langs.
+- TTL per aanroepplek (`site`), bv. uitleg langer dan feedback.
+- Opslag: LRU in het geheugen, optioneel met een SQLite-bestand eronder dat een herstart overleeft.
+- Alleen geslaagde calls worden bewaard; fouten en fallback-teksten nooit.
+- Single-flight: identieke calls (zelfde model, prompt en temperatuur tot `max_temperature`)
+  die tegelijk lopen, delen één upstream-call (zie single_flight.py). Dat werkt ook als de
+  cache zelf uit staat; `coalesced` in de metrics telt de uitgespaarde calls.
+- Async (`aget_or_generate`, `astream`): dezelfde cache, maar zonder single-flight (die wacht
+  met threads). Een geannuleerde call wordt niet bewaard.
+
+Configuratie via environment variabelen:
+    LLM_CACHE_SIZE (standaard 1000, 0 = uit), LLM_CACHE_PATH (SQLite-bestand, standaard geen),
+    LLM_CACHE_TTL (standaard-TTL in seconden), LLM_CACHE_MAX_TEMPERATURE (standaard 0.7),
+    LLM_CACHE_TTLS (per plek, bv. "uitleg=86400,feedback=600"),
+    LLM_COALESCE (standaard 1, 0 = identieke calls niet samenvoegen)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from single_flight import Afgebroken, SingleFlight
+
+# Temperatuur die Ollama gebruikt als de call er zelf geen meestuurt
+OLLAMA_DEFAULT_TEMPERATURE = 0.8
+
+DEFAULT_TTLS: Dict[str, float] = {
+    "begroeting": 24 * 3600,
+    "verduidelijkingsvraag": 24 * 3600,
+    "uitleg": 7 * 24 * 3600,
+    "intro": 24 * 3600,
+    "nakijken": 7 * 24 * 3600,
+    "schrijfbeoordeling": 7 * 24 * 3600,
+    "feedback": 24 * 3600,
+}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def _parse_ttls(raw: str) -> Dict[str, float]:
+    ttls = {}
+    for part in raw.split(","):
+        site, _, seconds = part.partition("=")
+        if site.strip() and seconds.strip():
+            ttls[site.strip()] = float(seconds)
+    return ttls
+
+
+class LLMCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        default_ttl: float = 3600,
+        ttls: Optional[Dict[str, float]] = None,
+        max_temperature: float = 0.7,
+        sqlite_path: Optional[str] = None,
+        coalesce: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_temperature = max_temperature
+
+        # sleutel -> (verloopt_op, antwoord); volgorde = LRU (oudste eerst)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self.coalesce_enabled = coalesce
+        self.flights = SingleFlight()
+
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " site TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " response TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        return cls(
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+            default_ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+            ttls=_parse_ttls(os.getenv("LLM_CACHE_TTLS", "")),
+            max_temperature=float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.7")),
+            sqlite_path=os.getenv("LLM_CACHE_PATH") or None,
+            coalesce=os.getenv("LLM_COALESCE", "1") == "1",
+        )
+
+    # ---------- Sleutels ---------- #
+
+    @staticmethod
+    def key(model: str, temperature: Optional[float], prompt: str) -> str:
+        data = f"{model}\x00{temperature}\x00{normalize_prompt(prompt)}"
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def deterministisch(self, temperature: Optional[float]) -> bool:
+        if temperature is None:
+            temperature = OLLAMA_DEFAULT_TEMPERATURE
+        return temperature <= self.max_temperature
+
+    def cacheable(self, temperature: Optional[float]) -> bool:
+        return bool(self.max_entries) and self.deterministisch(temperature)
+
+    def coalescable(self, temperature: Optional[float]) -> bool:
+        return self.coalesce_enabled and self.deterministisch(temperature)
+
+    def ttl(self, site: str) -> float:
+        return self.ttls.get(site, self.default_ttl)
+
+    def _count(self, site: str, what: str):
+        with self._lock:
+            counters = self._counters.setdefault(
+                site, {"hits": 0, "disk_hits": 0, "misses": 0, "bypass": 0, "stores": 0, "coalesced": 0}
+            )
+            counters[what] += 1
+
+    # ---------- Opvragen en opslaan ---------- #
+
+    def get(self, site: str, model: str, temperature: Optional[float], prompt: str) -> Optional[str]:
+        """Antwoord uit de cache, of None (ook bij een te hoge temperatuur)."""
+        if not self.cacheable(temperature):
+            self._count(site, "bypass")
+            return None
+        key = self.key(model, temperature, prompt)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            self._count(site, "hits")
+            return entry[1]
+
+        response = self._load(key, now)
+        if response is None:
+            self._count(site, "misses")
+            return None
+        self._count(site, "disk_hits")
+        return response
+
+    def put(self, site: str, model: str, temperature: Optional[float], prompt: str, response: str):
+        if not self.cacheable(temperature) or not response:
+            return
+        key = self.key(model, temperature, prompt)
+        expires = time.time() + self.ttl(site)
+        self._remember(key, expires, response)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, site, expires, response) VALUES (?, ?, ?, ?)",
+                    (key, site, expires, response),
+                )
+                self._db.commit()
+        self._count(site, "stores")
+
+    def coalesce(
+        self,
+        site: str,
+        model: str,
+        temperature: Optional[float],
+        prompt: str,
+        generate: Callable[[], str],
+    ) -> str:
+        """
+        `generate()`, maar gedeeld met een identieke call die al loopt (zelfde resultaat of fout).
+        Bewaart niets; daarvoor zorgt `generate` zelf of `get_or_generate`.
+        """
+        if not self.coalescable(temperature):
+            return generate()
+        response, gedeeld = self.flights.do(self.key(model, temperature, prompt), generate)
+        if gedeeld:
+            self._count(site, "coalesced")
+        return response
+
+    def get_or_generate(
+        self,
+        site: str,
+        model: str,
+        temperature: Optional[float],
+        prompt: str,
+        generate: Callable[[], str],
+    ) -> str:
+        """Antwoord uit de cache, anders `generate()` aanroepen (gedeeld met gelijktijdige calls) en bewaren."""
+        cached = self.get(site, model, temperature, prompt)
+        if cached is not None:
+            return cached
+
+        def generate_and_put() -> str:
+            response = generate()
+            self.put(site, model, temperature, prompt, response)
+            return response
+
+        return self.coalesce(site, model, temperature, prompt, generate_and_put)
+
+    def stream(
+        self,
+        site: str,
+        model: str,
+        temperature: Optional[float],
+        prompt: str,
+        generate: Callable[[], Iterable[str]],
+    ) -> Iterator[str]:
+        """
+        Streaming variant: een cache-hit komt als één stuk terug; anders worden de stukjes
+        doorgegeven en pas bewaard als de stream helemaal gelezen is. Loopt dezelfde stream
+        al, dan komt diens volledige tekst als één stuk terug.
+        """
+        cached = self.get(site, model, temperature, prompt)
+        if cached is not None:
+            yield cached
+            return
+        if not self.coalescable(temperature):
+            yield from self._stream_and_put(site, model, temperature, prompt, generate)
+            return
+
+        key = self.key(model, temperature, prompt)
+        flight, leader = self.flights.begin(key)
+        if not leader:
+            try:
+                response = flight.wacht()
+            except Afgebroken:
+                # De leider las zijn stream niet uit: zelf genereren
+                yield from self._stream_and_put(site, model, temperature, prompt, generate)
+                return
+            self._count(site, "coalesced")
+            yield response
+            return
+
+        pieces = []
+        try:
+            for piece in generate():
+                pieces.append(piece)
+                yield piece
+        except GeneratorExit:
+            self.flights.einde(key, flight, fout=Afgebroken())
+            raise
+        except BaseException as e:
+            self.flights.einde(key, flight, fout=e)
+            raise
+        response = "".join(pieces)
+        self.flights.einde(key, flight, resultaat=response)
+        self.put(site, model, temperature, prompt, response)
+
+    def _stream_and_put(self, site, model, temperature, prompt, generate) -> Iterator[str]:
+        pieces = []
+        for piece in generate():
+            pieces.append(piece)
+            yield piece
+        self.put(site, model, temperature, prompt, "".join(pieces))
+
+    # ---------- Async ---------- #
+
+    async def aget_or_generate(
+        self,
+        site: str,
+        model: str,
+        temperature: Optional[float],
+        prompt: str,
+        generate: Callable[[], Awaitable[str]],
+    ) -> str:
+        """Als `get_or_generate`, met een coroutine; gelijktijdige identieke calls worden niet samengevoegd."""
+        cached = self.get(site, model, temperature, prompt)
+        if cached is not None:
+            return cached
+        response = await generate()
+        self.put(site, model, temperature, prompt, response)
+        return response
+
+    async def astream(
+        self,
+        site: str,
+        model: str,
+        temperature: Optional[float],
+        prompt: str,
+        generate: Callable[[], AsyncIterable[str]],
+    ) -> AsyncIterator[str]:
+        """Als `stream`: een cache-hit als één stuk, anders de stukjes, bewaard als de stream helemaal gelezen is."""
+        cached = self.get(site, model, temperature, prompt)
+        if cached is not None:
+            yield cached
+            return
+        pieces = []
+        async for piece in generate():
+            pieces.append(piece)
+            yield piece
+        self.put(site, model, temperature, prompt, "".join(pieces))
+
+    # ---------- Interne hulpfuncties ---------- #
+
+    def _remember(self, key: str, expires: float, response: str):
+        with self._lock:
+            self._entries[key] = (expires, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: str, now: float) -> Optional[str]:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT expires, response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] < now:
+                self._db.execute("DELETE FROM llm_cache WHERE expires < ?", (now,))
+                self._db.commit()
+                row = None
+        if row is None:
+            return None
+        self._remember(key, row[0], row[1])
+        return row[1]
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            per_site = {}
+            for site, counters in sorted(self._counters.items()):
+                hits = counters["hits"] + counters["disk_hits"]
+                lookups = hits + counters["misses"]
+                per_site[site] = {**counters, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+            disk_entries = 0
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            coalesced = sum(counters["coalesced"] for counters in self._counters.values())
+            return {
+                "entries": len(self._entries),
+                "disk_entries": disk_entries,
+                "coalesced": coalesced,
+                "in_flight": self.flights.bezig(),
+                "sites": per_site,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Eén cache voor het hele proces, ingesteld via de environment variabelen hierboven."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache.from_env()
+    return _cache
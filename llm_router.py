@@ -0,0 +1,488 @@
+# llm_router.py
+"""
+Verdeelt Ollama-calls over meerdere Ollama-servers (backends).
+
+- Least outstanding requests: een call gaat naar de gezonde backend met de minste lopende
+  calls (relatief aan zijn limiet); bij gelijke stand naar de minst gebruikte.
+- Per backend een maximum aantal gelijktijdige calls; zijn alle backends vol, dan wacht de
+  call tot er plek is (hooguit `wait_timeout` seconden).
+- Sticky sessies: calls met dezelfde `session_id` gaan naar dezelfde backend, zodat die
+  zijn KV-cache voor het gedeelde begin van de prompt kan hergebruiken. Is die backend vol,
+  dan wacht de call eerst `sticky_wacht` seconden op een plek daar; daarna (of meteen als
+  de backend ongezond is) verhuist de sessie.
+- Failover: bij een verbindingsfout, timeout, 429 of 5xx wordt de call op een andere
+  backend opnieuw geprobeerd (bij streaming alleen zolang er nog niets doorgegeven is).
+- Health checks: na `fail_threshold` fouten op rij is een backend ongezond; een
+  achtergrondthread vraagt elke `health_interval` seconden /api/tags op en zet hem terug.
+
+Heeft dezelfde methodes als OllamaClient; `get_client()` geeft de router terug zodra
+OLLAMA_BACKENDS gezet is, zodat de modules zelf niets hoeven te veranderen.
+
+Configuratie via environment variabelen:
+    OLLAMA_BACKENDS (bv. "http://gpu1:11434=4,http://gpu2:11434=2"; "=n" is de limiet)
+    OLLAMA_BACKEND_CONCURRENCY (standaardlimiet per backend, 4), OLLAMA_HEALTH_INTERVAL (10 s),
+    OLLAMA_FAIL_THRESHOLD (2), OLLAMA_STICKY_TTL (1800 s), OLLAMA_STICKY_WAIT (0.25 s)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import requests
+
+from ollama_client import OLLAMA_MODEL, RETRY_STATUS, OllamaClient
+
+try:
+    import httpx
+except ImportError:  # alleen nodig voor de async variant
+    httpx = None
+
+DEFAULT_CONCURRENCY = int(os.getenv("OLLAMA_BACKEND_CONCURRENCY", "4"))
+
+
+class GeenBackendBeschikbaar(RuntimeError):
+    pass
+
+
+def is_backend_fout(e: Exception) -> bool:
+    """Fouten die aan de backend liggen (en dus op een andere backend wel kunnen lukken)."""
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code in RETRY_STATUS or e.response.status_code >= 500
+    if httpx is not None:
+        if isinstance(e, httpx.TransportError):
+            return True
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code in RETRY_STATUS or e.response.status_code >= 500
+    return False
+
+
+def parse_backends(raw: str, default_concurrency: int = DEFAULT_CONCURRENCY) -> List[Tuple[str, int]]:
+    backends = []
+    for part in raw.split(","):
+        url, _, limiet = part.strip().rpartition("=")
+        if not limiet.isdigit():
+            url, limiet = part.strip(), ""
+        if url:
+            backends.append((url.rstrip("/"), int(limiet) if limiet else default_concurrency))
+    return backends
+
+
+class Backend:
+    def __init__(self, url: str, max_concurrency: int, client: OllamaClient):
+        self.url = url
+        self.max_concurrency = max(1, max_concurrency)
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        self.fouten_op_rij = 0
+        self.counters = {"requests": 0, "failures": 0}
+
+    @property
+    def load(self) -> float:
+        return self.outstanding / self.max_concurrency
+
+    def vrij(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        backends: List[Tuple[str, int]],
+        health_interval: float = 10.0,
+        fail_threshold: int = 2,
+        sticky_ttl: float = 1800.0,
+        sticky_wacht: float = 0.25,
+        max_sticky: int = 10_000,
+        wait_timeout: Optional[float] = None,
+        clients: Optional[Dict[str, OllamaClient]] = None,
+    ):
+        if not backends:
+            raise ValueError("LLMRouter heeft minstens één backend nodig")
+        clients = clients or {}
+        # Geen retries in de client zelf: bij een fout probeert de router meteen een andere backend
+        self.backends = [
+            Backend(url, limiet, clients.get(url) or OllamaClient(base_url=url, retries=0)) for url, limiet in backends
+        ]
+        self.base_url = "router:" + ",".join(b.url for b in self.backends)
+        self.fail_threshold = fail_threshold
+        self.sticky_ttl = sticky_ttl
+        self.sticky_wacht = sticky_wacht
+        self.max_sticky = max_sticky
+        self.wait_timeout = wait_timeout if wait_timeout is not None else self.backends[0].client.timeout
+        self.connect_timeout = self.backends[0].client.connect_timeout
+
+        self._cond = threading.Condition()
+        # Wachtende async calls: per event loop één Event, gezet (en vervangen) bij elke vrijgekomen plek
+        self._async_events: Dict[asyncio.AbstractEventLoop, asyncio.Event] = {}
+        # session_id -> (laatst gebruikt, backend); volgorde = LRU
+        self._sticky: "OrderedDict[str, Tuple[float, Backend]]" = OrderedDict()
+        self._counters = {"sticky_hits": 0, "sticky_verhuisd": 0, "failovers": 0, "gewacht": 0, "health_checks": 0}
+
+        self._stop = threading.Event()
+        self.health_interval = health_interval
+        if health_interval > 0:
+            threading.Thread(target=self._health_loop, name="llm-router-health", daemon=True).start()
+
+    @classmethod
+    def from_env(cls) -> "LLMRouter":
+        return cls(
+            parse_backends(os.getenv("OLLAMA_BACKENDS", "")),
+            health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+            fail_threshold=int(os.getenv("OLLAMA_FAIL_THRESHOLD", "2")),
+            sticky_ttl=float(os.getenv("OLLAMA_STICKY_TTL", "1800")),
+            sticky_wacht=float(os.getenv("OLLAMA_STICKY_WAIT", "0.25")),
+        )
+
+    # ---------- Backend kiezen ---------- #
+
+    def _kies(self, session_id: Optional[str], uitsluiten: Set[Backend], mag_verhuizen: bool = True):
+        """
+        Backend, "vol" als er (nog) geen plek is, of None als er niets meer te proberen valt.
+        Zonder `mag_verhuizen` wacht een sessie op zijn eigen (gezonde) backend. Onder self._cond.
+        """
+        over = [b for b in self.backends if b not in uitsluiten]
+        # Zijn alle overgebleven backends ongezond, dan toch proberen (beter dan meteen opgeven)
+        kandidaten = [b for b in over if b.healthy] or over
+        if not kandidaten:
+            return None
+
+        vorige = None
+        if session_id is not None:
+            entry = self._sticky.get(session_id)
+            if entry is not None and time.monotonic() - entry[0] <= self.sticky_ttl:
+                vorige = entry[1]
+                if vorige in kandidaten and vorige.vrij():
+                    self._counters["sticky_hits"] += 1
+                    self._onthoud(session_id, vorige)
+                    return vorige
+                if vorige in kandidaten and vorige.healthy and not mag_verhuizen:
+                    return "vol"
+
+        vrije = [b for b in kandidaten if b.vrij()]
+        if not vrije:
+            return "vol"
+        gekozen = min(vrije, key=lambda b: (b.load, b.counters["requests"]))
+        if session_id is not None:
+            if vorige is not None:
+                self._counters["sticky_verhuisd"] += 1
+            self._onthoud(session_id, gekozen)
+        return gekozen
+
+    def _onthoud(self, session_id: str, backend: Backend):
+        self._sticky[session_id] = (time.monotonic(), backend)
+        self._sticky.move_to_end(session_id)
+        while len(self._sticky) > self.max_sticky:
+            self._sticky.popitem(last=False)
+
+    def _acquire(self, session_id: Optional[str], uitsluiten: Set[Backend]) -> Optional[Backend]:
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        with self._cond:
+            gewacht = False
+            while True:
+                mag_verhuizen = time.monotonic() - start >= self.sticky_wacht
+                gekozen = self._kies(session_id, uitsluiten, mag_verhuizen)
+                if gekozen != "vol":
+                    break
+                resterend = deadline - time.monotonic()
+                if resterend <= 0:
+                    raise GeenBackendBeschikbaar(f"alle backends vol na {self.wait_timeout:.0f} s wachten")
+                if not gewacht:
+                    gewacht = True
+                    self._counters["gewacht"] += 1
+                if not mag_verhuizen:
+                    resterend = min(resterend, start + self.sticky_wacht - time.monotonic())
+                self._cond.wait(max(0.0, resterend))
+            if gekozen is not None:
+                gekozen.outstanding += 1
+            return gekozen
+
+    async def _aacquire(self, session_id: Optional[str], uitsluiten: Set[Backend]) -> Optional[Backend]:
+        # Zelfde keuze, maar wachten zonder de event loop te blokkeren; _notify maakt ons wakker
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        gewacht = False
+        while True:
+            with self._cond:
+                mag_verhuizen = time.monotonic() - start >= self.sticky_wacht
+                gekozen = self._kies(session_id, uitsluiten, mag_verhuizen)
+                if gekozen != "vol":
+                    if gekozen is not None:
+                        gekozen.outstanding += 1
+                    return gekozen
+                if not gewacht:
+                    gewacht = True
+                    self._counters["gewacht"] += 1
+                # Onder de lock aangemeld, dus een plek die nu vrijkomt wordt niet gemist
+                event = self._async_events.get(loop)
+                if event is None:
+                    event = self._async_events[loop] = asyncio.Event()
+            resterend = deadline - time.monotonic()
+            if resterend <= 0:
+                raise GeenBackendBeschikbaar(f"alle backends vol na {self.wait_timeout:.0f} s wachten")
+            if not mag_verhuizen:
+                resterend = min(resterend, start + self.sticky_wacht - time.monotonic())
+            try:
+                await asyncio.wait_for(event.wait(), max(0.0, resterend))
+            except asyncio.TimeoutError:
+                pass
+
+    def _notify(self):
+        """Wekt wachtende calls (threads en event loops). Onder self._cond."""
+        self._cond.notify_all()
+        events, self._async_events = self._async_events, {}
+        for loop, event in events.items():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop is al gesloten
+
+    def _release(self, backend: Backend, fout: bool = False):
+        with self._cond:
+            backend.outstanding -= 1
+            backend.counters["requests"] += 1
+            if fout:
+                backend.counters["failures"] += 1
+                backend.fouten_op_rij += 1
+                if backend.fouten_op_rij >= self.fail_threshold:
+                    backend.healthy = False
+            else:
+                backend.fouten_op_rij = 0
+            self._notify()
+
+    def _geen_backend(self, laatste: Optional[Exception]):
+        if laatste is not None:
+            raise laatste
+        raise GeenBackendBeschikbaar("geen backend beschikbaar")
+
+    def _met_failover(self, session_id: Optional[str], call: Callable[[OllamaClient], Any]) -> Any:
+        geprobeerd: Set[Backend] = set()
+        laatste: Optional[Exception] = None
+        while True:
+            backend = self._acquire(session_id, geprobeerd)
+            if backend is None:
+                self._geen_backend(laatste)
+            try:
+                resultaat = call(backend.client)
+            except Exception as e:
+                fout = is_backend_fout(e)
+                self._release(backend, fout)
+                if not fout:
+                    raise
+                laatste = e
+                geprobeerd.add(backend)
+                with self._cond:
+                    self._counters["failovers"] += 1
+                continue
+            self._release(backend)
+            return resultaat
+
+    # ---------- Synchroon (zelfde methodes als OllamaClient) ---------- #
+
+    def generate(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> str:
+        return self._met_failover(
+            session_id, lambda client: client.generate(prompt, model=model, endpoint=endpoint, options=options, **extra)
+        )
+
+    def generate_stream(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> Iterator[str]:
+        geprobeerd: Set[Backend] = set()
+        laatste: Optional[Exception] = None
+        while True:
+            backend = self._acquire(session_id, geprobeerd)
+            if backend is None:
+                self._geen_backend(laatste)
+            begonnen = klaar = fout = False
+            try:
+                for piece in backend.client.generate_stream(prompt, model=model, endpoint=endpoint, options=options, **extra):
+                    begonnen = True
+                    yield piece
+                klaar = True
+            except Exception as e:
+                fout = is_backend_fout(e)
+                if begonnen or not fout:
+                    raise
+                laatste = e
+            finally:
+                # Ook als de lezer halverwege stopt (bv. zodra de JSON compleet is)
+                self._release(backend, fout)
+            if klaar:
+                return
+            geprobeerd.add(backend)
+            with self._cond:
+                self._counters["failovers"] += 1
+
+    def models(self) -> List[str]:
+        """Modellen die op minstens één gezonde backend staan."""
+        namen: Set[str] = set()
+        for backend in self.backends:
+            if backend.healthy:
+                try:
+                    namen.update(backend.client.models())
+                except Exception:
+                    continue
+        return sorted(namen)
+
+    # ---------- Async ---------- #
+
+    async def agenerate(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> str:
+        geprobeerd: Set[Backend] = set()
+        laatste: Optional[Exception] = None
+        while True:
+            backend = await self._aacquire(session_id, geprobeerd)
+            if backend is None:
+                self._geen_backend(laatste)
+            try:
+                resultaat = await backend.client.agenerate(prompt, model=model, endpoint=endpoint, options=options, **extra)
+            except Exception as e:
+                fout = is_backend_fout(e)
+                self._release(backend, fout)
+                if not fout:
+                    raise
+                laatste = e
+                geprobeerd.add(backend)
+                with self._cond:
+                    self._counters["failovers"] += 1
+                continue
+            except BaseException:
+                # Geannuleerd (bv. de leerling is weg): plek vrijgeven, geen fout van de backend
+                self._release(backend)
+                raise
+            self._release(backend)
+            return resultaat
+
+    async def agenerate_stream(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> AsyncIterator[str]:
+        geprobeerd: Set[Backend] = set()
+        laatste: Optional[Exception] = None
+        while True:
+            backend = await self._aacquire(session_id, geprobeerd)
+            if backend is None:
+                self._geen_backend(laatste)
+            begonnen = klaar = fout = False
+            try:
+                async for piece in backend.client.agenerate_stream(
+                    prompt, model=model, endpoint=endpoint, options=options, **extra
+                ):
+                    begonnen = True
+                    yield piece
+                klaar = True
+            except Exception as e:
+                fout = is_backend_fout(e)
+                if begonnen or not fout:
+                    raise
+                laatste = e
+            finally:
+                self._release(backend, fout)
+            if klaar:
+                return
+            geprobeerd.add(backend)
+            with self._cond:
+                self._counters["failovers"] += 1
+
+    # ---------- Health checks ---------- #
+
+    def check_health(self):
+        """Vraagt bij elke backend /api/tags op; bereikbaar = gezond."""
+        for backend in self.backends:
+            try:
+                backend.client.models()
+                gezond = True
+            except Exception:
+                gezond = False
+            with self._cond:
+                self._counters["health_checks"] += 1
+                backend.healthy = gezond
+                if gezond:
+                    backend.fouten_op_rij = 0
+                self._notify()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._counters,
+                "sticky_sessies": len(self._sticky),
+                "backends": [
+                    {
+                        "url": b.url,
+                        "healthy": b.healthy,
+                        "outstanding": b.outstanding,
+                        "max_concurrency": b.max_concurrency,
+                        **b.counters,
+                    }
+                    for b in self.backends
+                ],
+            }
+
+    # ---------- Opruimen ---------- #
+
+    def close(self):
+        self._stop.set()
+        for backend in self.backends:
+            backend.client.close()
+
+    async def aclose(self):
+        self._stop.set()
+        for backend in self.backends:
+            await backend.client.aclose()
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_router: Optional[LLMRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Eén router voor het hele proces, met de backends uit OLLAMA_BACKENDS."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter.from_env()
+    return _router
@@ -0,0 +1,373 @@
+# llm_scheduler.py
+"""
+Centrale planner voor LLM-werk: wie mag als volgende naar het model.
+
+Chat-antwoorden, nakijken (bv. check_writing) en werk op de achtergrond (oefeningen
+voor de voorraad, extra feedbackformuleringen) delen hetzelfde model. Zonder planning kan
+een zware beoordeling iemands chatantwoord van één regel laten wachten. Daarom:
+
+- Prioriteitsklassen: interactief > nakijken > prefetch. Een vrije plek gaat altijd naar
+  de hoogste klasse met wachtend werk; prefetch mag bovendien nooit alle plekken bezetten.
+- Eerlijk per leerling: binnen een klasse om de beurt per leerling (round-robin), dus één
+  leerling met tien verzoeken laat de anderen niet achteraan sluiten.
+- Toelating: per klasse een maximale wachtrij (en per leerling een maximum). Is die vol,
+  dan volgt direct `Bezet` (in main.py een 429 met Retry-After) in plaats van eindeloos wachten.
+- Deadlines: werk dat te lang gewacht heeft wordt niet meer gestart maar laten vallen
+  (`Verlopen`); het antwoord zou toch te laat komen.
+
+Alleen echte calls naar het model nemen een plek in: cache-hits en gedeelde aanroepen
+(zie llm_cache.py) gaan er buiten om. Welke klasse een call krijgt volgt uit de `site`
+(zie `klasse_voor`) of uit een omliggend `als(...)`-blok:
+
+    with get_scheduler().slot(klasse_voor(site), leerling=sessie_id):
+        tekst = client.generate(prompt, model=model)
+
+    with als(PREFETCH):        # bv. in een achtergrondthread
+        feedback = llm.genereer_response(...)
+
+Configuratie via environment variabelen:
+    LLM_MAX_CONCURRENCY (gelijktijdige calls naar het model, standaard 4 = OLLAMA_NUM_PARALLEL)
+    LLM_MAX_CONCURRENCY_CHAT (idem voor de gehoste chat-backend in main.py, eigen planner, standaard 64)
+    LLM_PREFETCH_MAX_ACTIVE (plekken voor prefetch, standaard de helft)
+    LLM_QUEUE_INTERACTIVE, LLM_QUEUE_GRADING, LLM_QUEUE_PREFETCH (max. wachtrij per klasse, standaard 64/32/16)
+    LLM_QUEUE_PER_STUDENT (max. wachtend werk per leerling per klasse, standaard 4)
+    LLM_DEADLINE_INTERACTIVE, LLM_DEADLINE_GRADING, LLM_DEADLINE_PREFETCH (max. wachttijd in seconden, standaard 30/120/60, 0 = geen)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+INTERACTIEF = "interactief"
+NAKIJKEN = "nakijken"
+PREFETCH = "prefetch"
+KLASSEN = (INTERACTIEF, NAKIJKEN, PREFETCH)  # op volgorde van prioriteit
+
+# Sites (zie llm_cache.py) die niet interactief zijn; al het andere is een leerling die wacht
+SITE_KLASSEN = {
+    "nakijken": NAKIJKEN,
+    "schrijfbeoordeling": NAKIJKEN,
+    "exercise_batch": PREFETCH,
+}
+
+ANONIEM = "anoniem"
+
+_klasse: ContextVar[Optional[str]] = ContextVar("llm_klasse", default=None)
+_leerling: ContextVar[Optional[str]] = ContextVar("llm_leerling", default=None)
+
+
+class Bezet(Exception):
+    """De wachtrij voor deze klasse (of leerling) is vol; probeer het over `retry_after` seconden opnieuw."""
+
+    def __init__(self, bericht: str, klasse: str, retry_after: int = 1):
+        super().__init__(bericht)
+        self.klasse = klasse
+        self.retry_after = retry_after
+
+
+class Verlopen(Bezet):
+    """Het werk wachtte langer dan de deadline en is niet meer gestart."""
+
+
+def klasse_voor(site: str) -> str:
+    """De klasse voor een call: die van een omliggend `als`-blok, anders volgens de site."""
+    return _klasse.get() or SITE_KLASSEN.get(site, INTERACTIEF)
+
+
+def huidige_leerling(leerling: Optional[str] = None) -> Optional[str]:
+    return leerling or _leerling.get()
+
+
+@contextmanager
+def als(klasse: Optional[str] = None, leerling: Optional[str] = None):
+    """LLM-calls in dit blok (deze thread of asyncio-taak) vallen onder `klasse` en/of `leerling`."""
+    tokens = []
+    if klasse is not None:
+        tokens.append((_klasse, _klasse.set(klasse)))
+    if leerling is not None:
+        tokens.append((_leerling, _leerling.set(leerling)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class Job:
+    __slots__ = ("klasse", "leerling", "deadline", "status", "wek", "aangemeld", "gestart")
+
+    def __init__(self, klasse: str, leerling: str, deadline: Optional[float], wek: Callable[[], None]):
+        self.klasse = klasse
+        self.leerling = leerling
+        self.deadline = deadline
+        self.status = "wacht"  # wacht -> gestart -> klaar, of wacht -> verlopen | ingetrokken
+        self.wek = wek
+        self.aangemeld = time.monotonic()
+        self.gestart: Optional[float] = None
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_gelijktijdig: int = 4,
+        max_wachtrij: Optional[Dict[str, int]] = None,
+        max_per_leerling: int = 4,
+        deadlines: Optional[Dict[str, Optional[float]]] = None,
+        prefetch_max_actief: Optional[int] = None,
+    ):
+        self.max_gelijktijdig = max(1, max_gelijktijdig)
+        self.max_wachtrij = {INTERACTIEF: 64, NAKIJKEN: 32, PREFETCH: 16, **(max_wachtrij or {})}
+        self.max_per_leerling = max(1, max_per_leerling)
+        self.deadlines = {INTERACTIEF: 30.0, NAKIJKEN: 120.0, PREFETCH: 60.0, **(deadlines or {})}
+        # Prefetch houdt altijd plek over, zodat een chatvraag nooit achter achtergrondwerk wacht
+        if prefetch_max_actief is None:
+            prefetch_max_actief = max(1, self.max_gelijktijdig // 2)
+        self.max_actief = {INTERACTIEF: self.max_gelijktijdig, NAKIJKEN: self.max_gelijktijdig,
+                           PREFETCH: max(1, min(prefetch_max_actief, self.max_gelijktijdig))}
+
+        self._lock = threading.Lock()
+        # klasse -> leerling -> wachtende jobs; de volgorde van leerlingen is de round-robin
+        self._wachtrijen: Dict[str, "OrderedDict[str, Deque[Job]]"] = {k: OrderedDict() for k in KLASSEN}
+        self._wachtend = {k: 0 for k in KLASSEN}
+        self._actief = {k: 0 for k in KLASSEN}
+        self._gem_duur = 2.0  # voortschrijdend gemiddelde van een call, voor Retry-After
+        self._counters = {k: {"gestart": 0, "direct": 0, "geweigerd": 0, "verlopen": 0, "ingetrokken": 0}
+                          for k in KLASSEN}
+        self._wachttijd = {k: 0.0 for k in KLASSEN}
+
+    @classmethod
+    def from_env(cls, max_gelijktijdig: Optional[int] = None) -> "LLMScheduler":
+        """Instellingen uit de environment; `max_gelijktijdig` voor een andere backend dan Ollama."""
+        prefetch = os.getenv("LLM_PREFETCH_MAX_ACTIVE")
+        if max_gelijktijdig is None:
+            max_gelijktijdig = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        return cls(
+            max_gelijktijdig=max_gelijktijdig,
+            max_wachtrij={
+                INTERACTIEF: int(os.getenv("LLM_QUEUE_INTERACTIVE", "64")),
+                NAKIJKEN: int(os.getenv("LLM_QUEUE_GRADING", "32")),
+                PREFETCH: int(os.getenv("LLM_QUEUE_PREFETCH", "16")),
+            },
+            max_per_leerling=int(os.getenv("LLM_QUEUE_PER_STUDENT", "4")),
+            deadlines={
+                INTERACTIEF: float(os.getenv("LLM_DEADLINE_INTERACTIVE", "30")),
+                NAKIJKEN: float(os.getenv("LLM_DEADLINE_GRADING", "120")),
+                PREFETCH: float(os.getenv("LLM_DEADLINE_PREFETCH", "60")),
+            },
+            prefetch_max_actief=int(prefetch) if prefetch else None,
+        )
+
+    # ---------- Intern ---------- #
+
+    def _retry_after(self, klasse: str) -> int:
+        voor = sum(self._wachtend[k] for k in KLASSEN[:KLASSEN.index(klasse) + 1])
+        return max(1, round(self._gem_duur * (voor + 1) / self.max_gelijktijdig))
+
+    def _volgende(self) -> Optional[Job]:
+        for klasse in KLASSEN:
+            rij = self._wachtrijen[klasse]
+            if not rij or self._actief[klasse] >= self.max_actief[klasse]:
+                continue
+            leerling, jobs = next(iter(rij.items()))
+            job = jobs.popleft()
+            if jobs:
+                rij.move_to_end(leerling)  # deze leerling sluit weer achteraan
+            else:
+                del rij[leerling]
+            self._wachtend[klasse] -= 1
+            return job
+        return None
+
+    def _start_wachtenden(self):
+        nu = time.monotonic()
+        while sum(self._actief.values()) < self.max_gelijktijdig:
+            job = self._volgende()
+            if job is None:
+                return
+            if job.deadline is not None and job.deadline <= nu:
+                # Te lang gewacht: niet meer starten, het antwoord komt toch te laat
+                job.status = "verlopen"
+                self._counters[job.klasse]["verlopen"] += 1
+                job.wek()
+                continue
+            self._start(job, nu)
+            job.wek()
+
+    def _start(self, job: Job, nu: float):
+        job.status = "gestart"
+        job.gestart = nu
+        self._actief[job.klasse] += 1
+        self._counters[job.klasse]["gestart"] += 1
+        self._wachttijd[job.klasse] += nu - job.aangemeld
+
+    def _meld_aan(self, klasse: str, leerling: Optional[str], deadline: Optional[float],
+                  wek: Callable[[], None]) -> Job:
+        if klasse not in KLASSEN:
+            raise ValueError(f"onbekende klasse {klasse!r} (verwacht een van {', '.join(KLASSEN)})")
+        leerling = huidige_leerling(leerling) or ANONIEM
+        if deadline is None:
+            deadline = self.deadlines.get(klasse)
+        job = Job(klasse, leerling, time.monotonic() + deadline if deadline else None, wek)
+        with self._lock:
+            # Direct starten kan alleen als er plek is en niemand met voorrang wacht
+            voorrang = any(self._wachtend[k] for k in KLASSEN[:KLASSEN.index(klasse) + 1])
+            if (not voorrang and sum(self._actief.values()) < self.max_gelijktijdig
+                    and self._actief[klasse] < self.max_actief[klasse]):
+                self._start(job, job.aangemeld)
+                self._counters[klasse]["direct"] += 1
+                return job
+            self._controleer(klasse, leerling)
+            self._wachtrijen[klasse].setdefault(leerling, deque()).append(job)
+            self._wachtend[klasse] += 1
+        return job
+
+    def _controleer(self, klasse: str, leerling: str):
+        if self._wachtend[klasse] >= self.max_wachtrij[klasse]:
+            self._counters[klasse]["geweigerd"] += 1
+            raise Bezet(f"te druk: wachtrij {klasse} is vol", klasse, self._retry_after(klasse))
+        # Werk zonder leerling (bv. de voorraad) valt alleen onder de limiet per klasse
+        if leerling != ANONIEM and len(self._wachtrijen[klasse].get(leerling, ())) >= self.max_per_leerling:
+            self._counters[klasse]["geweigerd"] += 1
+            raise Bezet(f"te druk: al {self.max_per_leerling} verzoeken in de wachtrij", klasse,
+                        self._retry_after(klasse))
+
+    def _trek_in(self, job: Job, reden: str) -> bool:
+        """De wachter geeft op (deadline of annulering). True als de job intussen al gestart was."""
+        with self._lock:
+            if job.status == "gestart":
+                return True
+            if job.status == "wacht":
+                jobs = self._wachtrijen[job.klasse].get(job.leerling)
+                if jobs is not None and job in jobs:
+                    jobs.remove(job)
+                    if not jobs:
+                        del self._wachtrijen[job.klasse][job.leerling]
+                    self._wachtend[job.klasse] -= 1
+                job.status = reden
+                self._counters[job.klasse][reden] += 1
+            return False
+
+    @staticmethod
+    def _verlopen(job: Job) -> Verlopen:
+        return Verlopen(f"{job.klasse}-werk wachtte te lang en is niet gestart", job.klasse)
+
+    # ---------- Publiek ---------- #
+
+    def toelaten(self, klasse: str, leerling: Optional[str] = None):
+        """Snelle controle zonder te reserveren: `Bezet` als nieuw werk nu geweigerd zou worden."""
+        leerling = huidige_leerling(leerling) or ANONIEM
+        with self._lock:
+            if sum(self._actief.values()) < self.max_gelijktijdig:
+                return
+            self._controleer(klasse, leerling)
+
+    def verkrijg(self, klasse: str, leerling: Optional[str] = None, deadline: Optional[float] = None) -> Job:
+        """Wacht (blokkerend) op een plek. `Bezet` bij een volle wachtrij, `Verlopen` na de deadline."""
+        klaar = threading.Event()
+        job = self._meld_aan(klasse, leerling, deadline, klaar.set)
+        if job.status == "gestart":
+            return job
+        timeout = None if job.deadline is None else max(0.0, job.deadline - time.monotonic())
+        klaar.wait(timeout)
+        if job.status == "gestart" or self._trek_in(job, "verlopen"):
+            return job
+        raise self._verlopen(job)
+
+    async def averkrijg(self, klasse: str, leerling: Optional[str] = None, deadline: Optional[float] = None) -> Job:
+        """Als `verkrijg`, maar wacht zonder de event loop te blokkeren; annuleren trekt de job in."""
+        loop = asyncio.get_running_loop()
+        klaar = loop.create_future()
+
+        def wek():
+            loop.call_soon_threadsafe(lambda: klaar.done() or klaar.set_result(None))
+
+        job = self._meld_aan(klasse, leerling, deadline, wek)
+        if job.status == "gestart":
+            return job
+        timeout = None if job.deadline is None else max(0.0, job.deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(klaar, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._trek_in(job, "ingetrokken"):
+                self.vrijgeven(job)
+            raise
+        if job.status == "gestart" or self._trek_in(job, "verlopen"):
+            return job
+        raise self._verlopen(job)
+
+    def vrijgeven(self, job: Job):
+        with self._lock:
+            if job.status != "gestart":
+                return
+            job.status = "klaar"
+            self._actief[job.klasse] -= 1
+            self._gem_duur = 0.9 * self._gem_duur + 0.1 * (time.monotonic() - job.gestart)
+            self._start_wachtenden()
+
+    @contextmanager
+    def slot(self, klasse: str = INTERACTIEF, leerling: Optional[str] = None, deadline: Optional[float] = None):
+        job = self.verkrijg(klasse, leerling, deadline)
+        try:
+            yield job
+        finally:
+            self.vrijgeven(job)
+
+    @asynccontextmanager
+    async def aslot(self, klasse: str = INTERACTIEF, leerling: Optional[str] = None, deadline: Optional[float] = None):
+        job = await self.averkrijg(klasse, leerling, deadline)
+        try:
+            yield job
+        finally:
+            self.vrijgeven(job)
+
+    def stream(self, maak_stream: Callable[[], Iterator[str]], klasse: str = INTERACTIEF,
+               leerling: Optional[str] = None) -> Iterator[str]:
+        """Een stream die pas bij het eerste stuk een plek neemt en die vasthoudt tot hij op (of gesloten) is."""
+        with self.slot(klasse, leerling):
+            yield from maak_stream()
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            per_klasse = {}
+            for klasse in KLASSEN:
+                tellers = self._counters[klasse]
+                per_klasse[klasse] = {
+                    **tellers,
+                    "actief": self._actief[klasse],
+                    "wachtend": self._wachtend[klasse],
+                    "gem_wachttijd_ms": round(1000 * self._wachttijd[klasse] / tellers["gestart"], 1)
+                    if tellers["gestart"] else 0.0,
+                }
+            return {
+                "max_gelijktijdig": self.max_gelijktijdig,
+                "actief": sum(self._actief.values()),
+                "wachtend": sum(self._wachtend.values()),
+                "gem_duur_s": round(self._gem_duur, 3),
+                "klassen": per_klasse,
+            }
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler.from_env()
+    return _scheduler
@@ -1,8 +1,8 @@
 import os
+import asyncio
 import uvicorn
 import json
 import uuid
-import re 
 import random # <--- NIEUW: Nodig voor de 50/50 kans
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
@@ -13,6 +13,20 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from elevenlabs.client import ElevenLabs 
+from session_store import SessionStore
+from context_window import ContextBuilder
+from exercise_pool import ExercisePool
+from json_schemas import (
+    CHAT_EXERCISE_SCHEMA,
+    STRUCTURED_OUTPUT,
+    openai_response_format,
+    parse_stats,
+    parse_status,
+    parse_structured,
+    validate,
+)
+from json_stream import StreamingJSONParser
+from llm_scheduler import INTERACTIEF, PREFETCH, Bezet, LLMScheduler
 
 # 1. Setup
 env_path = Path(__file__).parent / ".env"
@@ -46,9 +60,32 @@ llm = ChatOpenAI(
     default_headers=headers
 )
 
+# Oefeningen via structured output: het model kan alleen JSON volgens CHAT_EXERCISE_SCHEMA teruggeven
+exercise_llm = llm.bind(response_format=openai_response_format("exercise", CHAT_EXERCISE_SCHEMA)) if STRUCTURED_OUTPUT else llm
+
 eleven_client = ElevenLabs(api_key=eleven_key)
 
-sessions = {}
+# Begrensd en met eviction, zodat het geheugen niet blijft groeien op een lang draaiende server
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "1000")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", str(4 * 3600))),
+    max_history_bytes=int(os.getenv("SESSION_MAX_HISTORY_BYTES", "256000")),
+    spill_path=os.getenv("SESSION_SPILL_PATH") or None,
+)
+
+# Systeemprompt + doorlopende samenvatting + zoveel recente beurten als in het tokenbudget passen
+context_builder = ContextBuilder(
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "3000")),
+    summary_max_tokens=int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400")),
+)
+# Een oefening heeft alleen de laatste beurten nodig; een klein budget houdt de prefill kort
+EXERCISE_CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_EXERCISE_MAX_TOKENS", "1200"))
+
+EXERCISE_MARKER = "[GENERATE_EXERCISE]"
+
+# Chat gaat voor oefeningen op de achtergrond; bij een volle wachtrij direct een 429 (zie llm_scheduler.py).
+# Eigen planner: de gehoste gateway kan veel meer tegelijk dan een lokale Ollama (LLM_MAX_CONCURRENCY).
+scheduler = LLMScheduler.from_env(max_gelijktijdig=int(os.getenv("LLM_MAX_CONCURRENCY_CHAT", "64")))
 
 # --- TYPES ---
 class SessionConfig(BaseModel):
@@ -72,14 +109,40 @@ class SpeakRequest(BaseModel):
     tutor_id: str
 
 # --- HULPFUNCTIES ---
-def extract_and_parse_json(text):
-    try: return json.loads(text)
-    except: pass
+def append_turns(session, *turns):
+    """Voegt beurten toe aan het frontend-log met een oplopend volgnummer en geeft alleen de nieuwe terug."""
+    delta = []
+    for turn in turns:
+        session["seq"] += 1
+        entry = {"seq": session["seq"], **turn}
+        session["turns"].append(entry)
+        delta.append(entry)
+    return delta
+
+def too_busy(e):
+    return HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def stream_to_queue(job, messages, chunks):
+    """
+    Leest de model-stream in een eigen taak en geeft de plek in de planner vrij zodra het model
+    klaar is, ook als de client de SSE-stream nog (langzaam) leest. Eindigt altijd met None.
+    """
     try:
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match: return json.loads(match.group(0))
-    except: pass
-    return None
+        async for chunk in llm.astream(messages):
+            chunks.put_nowait(chunk.content or "")
+    finally:
+        scheduler.vrijgeven(job)
+        chunks.put_nowait(None)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def split_marker_tail(text):
+    """Splitst tekst in (veilig te versturen, achter te houden) als de tekst eindigt op een begin van de marker."""
+    for size in range(min(len(text), len(EXERCISE_MARKER) - 1), 0, -1):
+        if EXERCISE_MARKER.startswith(text[-size:]):
+            return text[:-size], text[-size:]
+    return text, ""
 
 def normalize_exercise_data(data, skill_type):
     if not data: return None
@@ -105,7 +168,12 @@ def normalize_exercise_data(data, skill_type):
         "explanation": normalized.get("explanation", "")
     }
 
-def create_exercise_json(history, topic, specific_topic, skill):
+async def create_exercise_json(session, topic, specific_topic, skill, on_field=None, klasse=INTERACTIEF, leerling=None):
+    """
+    Genereert één oefening als dict. Met `on_field(veld, waarde)` wordt de output gestreamd
+    en komt elk bovenste veld (bv. de vraag) binnen zodra het compleet is.
+    De LLM-call wacht op een plek in de planner onder `klasse` (voorraad = PREFETCH).
+    """
     prompt_instruction = ""
     
     if skill == "writing":
@@ -149,12 +217,43 @@ def create_exercise_json(history, topic, specific_topic, skill):
     BELANGRIJK: Geef ALLEEN de ruwe JSON code terug.
     """
     
-    messages = history[-5:] + [HumanMessage(content=prompt)]
+    messages = context_builder.build(
+        session, extra=[HumanMessage(content=prompt)], max_tokens=EXERCISE_CONTEXT_MAX_TOKENS
+    )
     try:
-        response = llm.invoke(messages)
-        data = extract_and_parse_json(response.content)
+        if on_field is None:
+            async with scheduler.aslot(klasse, leerling):
+                response = await exercise_llm.ainvoke(messages)
+            data, _ = parse_structured(response.content, CHAT_EXERCISE_SCHEMA, "chat_exercise")
+        else:
+            parser = StreamingJSONParser(start_chars="{")
+            async with scheduler.aslot(klasse, leerling):
+                async for chunk in exercise_llm.astream(messages):
+                    for path, value in parser.feed(chunk.content or ""):
+                        if len(path) == 1:
+                            on_field(str(path[0]).lower(), value)
+                    if parser.done: break
+            data = parser.close()
+            status = parse_status(parser.repairs > 0, validate(data, CHAT_EXERCISE_SCHEMA)) if data is not None else "mislukt"
+            parse_stats.record("chat_exercise", status)
         return normalize_exercise_data(data, skill)
-    except: return None
+    except Bezet: raise  # geen plek bij het model: de aanroeper geeft een 429
+    except Exception: return None  # annuleren (CancelledError) gaat er gewoon doorheen
+
+async def generate_pool_exercise(topic, specific_topic, skill):
+    # Oefeningen voor de voorraad hangen niet af van een specifiek gesprek
+    session = {"history": [SystemMessage(content="Je bent een tutor die korte oefeningen maakt.")]}
+    return await create_exercise_json(session, topic, specific_topic, skill, klasse=PREFETCH)
+
+exercise_pool = ExercisePool(
+    generate_pool_exercise,
+    depth=int(os.getenv("EXERCISE_POOL_DEPTH", "3")),
+    refill_concurrency=int(os.getenv("EXERCISE_POOL_CONCURRENCY", "2")),
+    max_age_seconds=float(os.getenv("EXERCISE_POOL_MAX_AGE_SECONDS", str(30 * 60))),
+    max_keys=int(os.getenv("EXERCISE_POOL_MAX_KEYS", "200")),
+    idle_seconds=float(os.getenv("EXERCISE_POOL_IDLE_SECONDS", str(30 * 60))),
+    allow_themes=os.getenv("EXERCISE_POOL_THEMES", "Algemeen").split(","),
+)
 
 # --- ENDPOINTS ---
 @app.post("/start_session")
@@ -175,37 +274,147 @@ async def start_session(config: SessionConfig):
     """
     
     session_id = str(uuid.uuid4())
-    sessions[session_id] = { "history": [SystemMessage(content=system_prompt)], "tutor": tutor, "config": config, "active_theme": "Algemeen" }
+    sessions[session_id] = { "history": [SystemMessage(content=system_prompt)], "turns": [], "seq": 0, "tutor": tutor, "config": config, "active_theme": "Algemeen" }
     
-    return { "session_id": session_id, "state": { "tutor": tutor, "chat_history": [], "theme": "Algemeen" } }
+    return { "session_id": session_id, "state": { "tutor": tutor, "chat_history": [], "seq": 0, "theme": "Algemeen" } }
 
 @app.post("/chat/{session_id}")
 async def chat(session_id: str, message: UserMessage):
     if session_id not in sessions: raise HTTPException(404, "Sessie niet gevonden")
     session = sessions[session_id]
-    session["history"].append(HumanMessage(content=message.text))
+    # Volle wachtrij: weigeren voordat het bericht in de geschiedenis staat
+    try: scheduler.toelaten(INTERACTIEF, session_id)
+    except Bezet as e: raise too_busy(e)
     
     try:
-        response = llm.invoke(session["history"])
+        # ainvoke: een trage completion blokkeert de event loop (en dus andere leerlingen) niet
+        async with scheduler.aslot(INTERACTIEF, session_id):
+            # Pas met een plek: een geweigerd bericht (Bezet/Verlopen) blijft buiten de geschiedenis
+            session["history"].append(HumanMessage(content=message.text))
+            response = await llm.ainvoke(context_builder.build(session))
         ai_text = response.content
         exercise_data = None
         
-        if "[GENERATE_EXERCISE]" in ai_text:
-            ai_text = ai_text.replace("[GENERATE_EXERCISE]", "").strip() or "Hier is een oefening!"
-            exercise_data = create_exercise_json(session["history"], session["config"].topic, session["active_theme"], "general")
+        if EXERCISE_MARKER in ai_text:
+            ai_text = ai_text.replace(EXERCISE_MARKER, "").strip() or "Hier is een oefening!"
+            # Het antwoord is er al; bij een volle planner zonder oefening terug i.p.v. een 429
+            try: exercise_data = await create_exercise_json(session, session["config"].topic, session["active_theme"], "general", leerling=session_id)
+            except Bezet: exercise_data = None
         
         session["history"].append(AIMessage(content=ai_text))
         
-        frontend_history = []
-        for msg in session["history"]:
-            if isinstance(msg, HumanMessage): frontend_history.append({"role": "user", "text": msg.content})
-            elif isinstance(msg, AIMessage): frontend_history.append({"role": "tutor", "text": msg.content})
-
-        if exercise_data: frontend_history.append({"role": "exercise", "exercise": exercise_data})
+        # Alleen de nieuwe beurten terugsturen; de volledige geschiedenis is op te vragen via /history
+        new_turns = [{"role": "user", "text": message.text}, {"role": "tutor", "text": ai_text}]
+        if exercise_data: new_turns.append({"role": "exercise", "exercise": exercise_data})
+        delta = append_turns(session, *new_turns)
+        sessions[session_id] = session  # terugschrijven: byte-cap, en niet kwijt als hij tussendoor is weggeschreven
         
-        return { "state": { "tutor": session["tutor"], "chat_history": frontend_history, "theme": session["active_theme"] } }
+        return { "state": { "tutor": session["tutor"], "delta": delta, "seq": session["seq"], "theme": session["active_theme"] } }
+    except Bezet as e: raise too_busy(e)
     except Exception as e: raise HTTPException(500, str(e))
 
+@app.post("/chat_stream/{session_id}")
+async def chat_stream(session_id: str, message: UserMessage):
+    """
+    Streaming variant van /chat (Server-Sent Events).
+    Events: 'token' (stukje tekst), 'exercise_field' (een veld van de oefening dat al compleet is),
+    'exercise' (oefening), 'done' (volledig antwoord) of 'error'.
+    Zodra de marker binnenkomt start de oefening-generatie al, terwijl de rest van het antwoord nog streamt.
+    """
+    if session_id not in sessions: raise HTTPException(404, "Sessie niet gevonden")
+    session = sessions[session_id]
+    # De 429 moet vóór de stream start; een plek wordt pas in de stream zelf genomen
+    try: scheduler.toelaten(INTERACTIEF, session_id)
+    except Bezet as e: raise too_busy(e)
+
+    async def event_stream():
+        parts = []
+        pending = ""
+        exercise_task = None
+        # Velden van de oefening die al compleet zijn (bv. de vraag), nog niet verstuurd
+        fields = asyncio.Queue()
+        on_field = lambda name, value: fields.put_nowait({"field": name, "value": value})
+        try:
+            job = await scheduler.averkrijg(INTERACTIEF, session_id)
+        except Bezet as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        # Pas met een plek: een geweigerd bericht blijft buiten de geschiedenis
+        session["history"].append(HumanMessage(content=message.text))
+        chunks = asyncio.Queue()
+        model_task = asyncio.create_task(stream_to_queue(job, context_builder.build(session), chunks))
+        try:
+            while (text := await chunks.get()) is not None:
+                pending += text
+                if EXERCISE_MARKER in pending:
+                    pending = pending.replace(EXERCISE_MARKER, "")
+                    if exercise_task is None:
+                        exercise_task = asyncio.create_task(create_exercise_json(
+                            session, session["config"].topic, session["active_theme"], "general",
+                            on_field=on_field, leerling=session_id,
+                        ))
+                # Een half binnengekomen marker houden we vast tot de volgende chunk
+                safe, pending = split_marker_tail(pending)
+                if safe:
+                    parts.append(safe)
+                    yield sse_event("token", {"text": safe})
+                while not fields.empty():
+                    yield sse_event("exercise_field", fields.get_nowait())
+            await model_task  # geeft een fout uit de model-stream door
+            if pending:
+                parts.append(pending)
+                yield sse_event("token", {"text": pending})
+        except Exception as e:
+            if exercise_task: exercise_task.cancel()
+            yield sse_event("error", {"detail": str(e)})
+            return
+        finally:
+            # Client weg: niet verder genereren (vrijgeven is idempotent, ook als de taak nooit startte)
+            model_task.cancel()
+            scheduler.vrijgeven(job)
+
+        ai_text = "".join(parts).strip()
+        if exercise_task and not ai_text: ai_text = "Hier is een oefening!"
+        session["history"].append(AIMessage(content=ai_text))
+        new_turns = [{"role": "user", "text": message.text}, {"role": "tutor", "text": ai_text}]
+
+        if exercise_task:
+            # Velden doorsturen zodra ze binnenkomen, tot de oefening compleet is
+            while not exercise_task.done() or not fields.empty():
+                getter = asyncio.ensure_future(fields.get())
+                await asyncio.wait({getter, exercise_task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield sse_event("exercise_field", getter.result())
+                else:
+                    getter.cancel()
+            try: exercise_data = exercise_task.result()
+            except Bezet: exercise_data = None  # zoals /chat: het antwoord gaat door zonder oefening
+            if exercise_data:
+                new_turns.append({"role": "exercise", "exercise": exercise_data})
+                yield sse_event("exercise", {"exercise": exercise_data})
+
+        delta = append_turns(session, *new_turns)
+        sessions[session_id] = session
+        yield sse_event("done", {"text": ai_text, "delta": delta, "seq": session["seq"], "theme": session["active_theme"]})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/history/{session_id}")
+async def get_history(session_id: str, after: int = 0, limit: int = 100):
+    """Cursor-gebaseerd ophalen van de chatgeschiedenis: beurten met seq > after, maximaal `limit`."""
+    if session_id not in sessions: raise HTTPException(404, "Sessie niet gevonden")
+    session = sessions[session_id]
+    turns = session["turns"]
+    limit = max(1, min(limit, 500))
+
+    # seq loopt op zonder gaten, dus de positie in de lijst is direct te berekenen
+    # (ook als de oudste beurten door de sessie-opslag zijn ingekort)
+    first_seq = turns[0]["seq"] if turns else session["seq"] + 1
+    start = max(0, after + 1 - first_seq)
+    page = turns[start:start + limit]
+    next_cursor = page[-1]["seq"] if page else after
+    return { "turns": page, "next_cursor": next_cursor, "has_more": next_cursor < session["seq"], "seq": session["seq"] }
+
 @app.post("/generate_exercise/{session_id}")
 async def generate_exercise_endpoint(session_id: str, req: ExerciseRequest):
     if session_id not in sessions: raise HTTPException(404)
@@ -214,16 +423,40 @@ async def generate_exercise_endpoint(session_id: str, req: ExerciseRequest):
     topic_to_use = req.theme if req.theme else session["active_theme"]
     skill_to_use = req.skill if req.skill else "general"
     
-    data = create_exercise_json(session["history"], session["config"].topic, topic_to_use, skill_to_use)
+    # Eerst uit de voorraad (milliseconden), alleen bij een lege voorraad live genereren
+    data = await exercise_pool.get(session["config"].topic, topic_to_use, skill_to_use)
+    if not data:
+        try: scheduler.toelaten(INTERACTIEF, session_id)
+        except Bezet as e: raise too_busy(e)
+        try: data = await create_exercise_json(session, session["config"].topic, topic_to_use, skill_to_use, leerling=session_id)
+        except Bezet as e: raise too_busy(e)
     if not data: raise HTTPException(500, "Mislukt")
     return data
 
 @app.post("/set_theme/{session_id}")
 async def set_theme(session_id: str, update: ThemeUpdate):
     if session_id not in sessions: raise HTTPException(404)
-    sessions[session_id]["active_theme"] = update.theme
+    session = sessions[session_id]
+    session["active_theme"] = update.theme
+    sessions[session_id] = session
     return {"status": "ok"}
 
+@app.get("/metrics/sessions")
+async def session_metrics():
+    return sessions.metrics()
+
+@app.get("/metrics/exercise_pool")
+async def exercise_pool_metrics():
+    return exercise_pool.metrics()
+
+@app.get("/metrics/json_parsing")
+async def json_parsing_metrics():
+    return parse_stats.metrics()
+
+@app.get("/metrics/llm_scheduler")
+async def llm_scheduler_metrics():
+    return scheduler.metrics()
+
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     try:
@@ -0,0 +1,296 @@
+# ollama_client.py
+"""
+Gedeelde HTTP-client voor Ollama.
+
+Alle modules (tutor_personalities, exercise_generator, feedback_generator, ai_tutor_main)
+gebruiken deze client in plaats van een losse `requests.post` per call:
+- één `requests.Session` met connection pool en keep-alive (geen TCP-setup per call),
+- een `httpx.AsyncClient` voor async code,
+- instelbare poolgrootte, timeouts en retries met exponentiële backoff,
+- `keep_alive` bij elke call: het model blijft geladen, en daarmee Ollama's KV-cache van de
+  vorige prompt. Een prompt die met hetzelfde stuk begint (de persona, zie ai_tutor_main.py)
+  hoeft dat stuk dan niet opnieuw te verwerken; de eerste token komt even snel, hoe lang de
+  vaste prefix ook is.
+
+Met meerdere Ollama-servers (OLLAMA_BACKENDS) geeft `get_client()` een LLMRouter terug met
+dezelfde methodes, zie llm_router.py.
+
+Configuratie via environment variabelen:
+    OLLAMA_BASE_URL (standaard http://localhost:11434)
+    OLLAMA_POOL_SIZE, OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT, OLLAMA_RETRIES, OLLAMA_BACKOFF
+    OLLAMA_KEEP_ALIVE (hoe lang het model geladen blijft, standaard 30m; leeg = Ollama's standaard)
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # alleen nodig voor de async variant
+    httpx = None
+
+# ================================================================
+#  Configuratie
+# ================================================================
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_URL = f"{OLLAMA_BASE_URL}/api/generate"
+OLLAMA_MODEL = "mistral:7b"
+
+RETRY_STATUS = (429, 502, 503, 504)
+
+# Referenties naar lopende opruimtaken (anders kan de GC ze halverwege weggooien)
+_opruimtaken: set = set()
+
+
+# ================================================================
+#  Client
+# ================================================================
+
+class OllamaClient:
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        pool_size: int = int(os.getenv("OLLAMA_POOL_SIZE", "10")),
+        connect_timeout: float = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+        timeout: float = float(os.getenv("OLLAMA_TIMEOUT", "120")),
+        retries: int = int(os.getenv("OLLAMA_RETRIES", "2")),
+        backoff: float = float(os.getenv("OLLAMA_BACKOFF", "0.5")),
+        keep_alive: Optional[str] = os.getenv("OLLAMA_KEEP_ALIVE", "30m") or None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_alive = keep_alive
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # een halve generatie niet opnieuw versturen
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=None,  # ook POST mag opnieuw bij connect-fouten / 5xx
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._async_client = None
+        self._async_loop = None
+
+    # ---------- Hulpfuncties ---------- #
+
+    def _url(self, endpoint: str) -> str:
+        return f"{self.base_url}{endpoint}"
+
+    def _payload(self, prompt: str, model: str, stream: bool, options: Optional[Dict[str, Any]], extra: Dict[str, Any]):
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    # ---------- Synchroon ---------- #
+
+    def generate(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> str:
+        """
+        Eén complete response (stream=False). Extra velden (bv. format, system) gaan mee in de payload.
+        `session_id` wordt hier genegeerd; de LLMRouter gebruikt hem voor sticky routing.
+        """
+        resp = self.session.post(
+            self._url(endpoint),
+            json=self._payload(prompt, model, False, options, extra),
+            timeout=(self.connect_timeout, self.timeout),
+        )
+        resp.raise_for_status()
+        return resp.json().get("response", "")
+
+    def generate_stream(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> Iterator[str]:
+        """Geeft de 'response'-stukjes terug zodra Ollama ze stuurt."""
+        with self.session.post(
+            self._url(endpoint),
+            json=self._payload(prompt, model, True, options, extra),
+            stream=True,
+            timeout=(self.connect_timeout, self.timeout),
+        ) as resp:
+            if resp.status_code >= 400:
+                resp.content  # body lezen, zodat de verbinding terug kan naar de pool
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line.decode("utf-8"))
+                except json.JSONDecodeError:
+                    continue
+                piece = data.get("response", "")
+                if piece:
+                    yield piece
+                if data.get("done"):
+                    break
+
+    def models(self) -> List[str]:
+        """Namen van de geïnstalleerde modellen (/api/tags); ook gebruikt als health check."""
+        resp = self.session.get(self._url("/api/tags"), timeout=self.connect_timeout)
+        resp.raise_for_status()
+        return [m.get("name") for m in resp.json().get("models", [])]
+
+    # ---------- Async ---------- #
+
+    def _get_async_client(self):
+        if httpx is None:
+            raise RuntimeError("httpx is niet geïnstalleerd; nodig voor async Ollama-calls (pip install httpx).")
+        # Een AsyncClient hoort bij één event loop (bv. na een nieuwe asyncio.run)
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                self._sluit_oude_client(self._async_client, self._async_loop)
+            self._async_loop = loop
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+        return self._async_client
+
+    @staticmethod
+    def _sluit_oude_client(client, loop):
+        """Sluit de AsyncClient van een vorige event loop, op die loop als hij nog draait."""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+
+        async def sluit():
+            # Verbindingen van een gesloten loop kunnen niet netjes dicht; de sockets gaan wel weg
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+        _opruimtaken.add(taak := asyncio.ensure_future(sluit()))
+        taak.add_done_callback(_opruimtaken.discard)
+
+    async def _apost(self, endpoint: str, payload: Dict[str, Any]):
+        client = self._get_async_client()
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await client.post(self._url(endpoint), json=payload)
+                if resp.status_code not in RETRY_STATUS or attempt == self.retries:
+                    resp.raise_for_status()
+                    return resp
+                await resp.aclose()
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def agenerate(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> str:
+        resp = await self._apost(endpoint, self._payload(prompt, model, False, options, extra))
+        return resp.json().get("response", "")
+
+    async def agenerate_stream(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        endpoint: str = "/api/generate",
+        options: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        **extra: Any,
+    ) -> AsyncIterator[str]:
+        client = self._get_async_client()
+        payload = self._payload(prompt, model, True, options, extra)
+        async with client.stream("POST", self._url(endpoint), json=payload) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                piece = data.get("response", "")
+                if piece:
+                    yield piece
+                if data.get("done"):
+                    break
+
+    # ---------- Opruimen ---------- #
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: Optional[str] = None) -> OllamaClient:
+    """
+    Eén client (en dus één connection pool) per base_url, gedeeld door het hele proces.
+    Zonder base_url: de LLMRouter als OLLAMA_BACKENDS gezet is (zie llm_router.py), anders
+    de client voor OLLAMA_BASE_URL.
+    """
+    if base_url is None:
+        if os.getenv("OLLAMA_BACKENDS"):
+            from llm_router import get_router  # llm_router importeert deze module zelf ook
+            return get_router()
+        base_url = OLLAMA_BASE_URL
+    base_url = base_url.rstrip("/")
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                client = OllamaClient(base_url=base_url)
+                _clients[base_url] = client
+    return client
@@ -0,0 +1,236 @@
+# progress_store.py
+"""
+Voortgang van leerlingen in SQLite: een append-only log van pogingen plus tellers.
+
+- `pogingen`: elke beantwoorde oefening één rij (wordt nooit aangepast of verwijderd).
+- `leerlingen` en `tellers` (per leerling per onderwerp) worden in dezelfde transactie
+  bijgewerkt, dus statistieken en zwakke punten zijn één opzoeking in plaats van een
+  scan over de hele geschiedenis.
+- Met PROGRESS_DB_PATH staat alles in een bestand en overleeft het een herstart;
+  zonder staat de database in het geheugen (oude gedrag).
+- Export voor docenten-dashboards: overzicht per leerling (`exporteer`, `schrijf_csv`),
+  de ruwe pogingen per cursor (`pogingen`), en als pyarrow geïnstalleerd is ook Parquet.
+
+Configuratie via environment variabelen:
+    PROGRESS_DB_PATH (SQLite-bestand, standaard geen = alleen in het geheugen)
+"""
+
+import csv
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # alleen nodig voor schrijf_parquet
+    pyarrow = None
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS pogingen ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " leerling TEXT NOT NULL,"
+    " tijd REAL NOT NULL,"
+    " type TEXT NOT NULL,"
+    " onderwerp TEXT NOT NULL,"
+    " bron_id TEXT,"
+    " correct INTEGER NOT NULL,"
+    " antwoord TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pogingen_leerling ON pogingen (leerling, id)",
+    "CREATE TABLE IF NOT EXISTS leerlingen ("
+    " leerling TEXT PRIMARY KEY,"
+    " totaal INTEGER NOT NULL,"
+    " correct INTEGER NOT NULL,"
+    " eerste REAL NOT NULL,"
+    " laatste REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tellers ("
+    " leerling TEXT NOT NULL,"
+    " onderwerp TEXT NOT NULL,"
+    " totaal INTEGER NOT NULL,"
+    " correct INTEGER NOT NULL,"
+    " fouten INTEGER NOT NULL,"
+    " PRIMARY KEY (leerling, onderwerp))",
+    "CREATE INDEX IF NOT EXISTS tellers_fouten ON tellers (leerling, fouten DESC)",
+]
+
+EXPORT_VELDEN = ["leerling", "totaal", "correct", "percentage", "eerste", "laatste", "zwakke_punten"]
+
+
+def percentage(correct: int, totaal: int) -> float:
+    return round((correct / totaal) * 100, 1) if totaal else 0.0
+
+
+class ProgressStore:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ":memory:"
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if self.path != ":memory:":
+                # WAL: schrijven blokkeert het lezen (bv. een export) niet, en geen fsync per poging
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "ProgressStore":
+        return cls(os.getenv("PROGRESS_DB_PATH") or None)
+
+    # ---------- Schrijven ---------- #
+
+    def registreer(
+        self,
+        leerling: str,
+        type: str,
+        onderwerp: str,
+        correct: bool,
+        antwoord: str,
+        bron_id: Optional[str] = None,
+        tijd: Optional[float] = None,
+    ):
+        """Voegt een poging toe aan het log en werkt de tellers bij (één transactie)."""
+        tijd = time.time() if tijd is None else tijd
+        goed = int(bool(correct))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO pogingen (leerling, tijd, type, onderwerp, bron_id, correct, antwoord)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (leerling, tijd, type, onderwerp, bron_id, goed, antwoord),
+            )
+            self._db.execute(
+                "INSERT INTO leerlingen (leerling, totaal, correct, eerste, laatste) VALUES (?, 1, ?, ?, ?)"
+                " ON CONFLICT (leerling) DO UPDATE SET"
+                " totaal = totaal + 1, correct = correct + excluded.correct, laatste = excluded.laatste",
+                (leerling, goed, tijd, tijd),
+            )
+            self._db.execute(
+                "INSERT INTO tellers (leerling, onderwerp, totaal, correct, fouten) VALUES (?, ?, 1, ?, ?)"
+                " ON CONFLICT (leerling, onderwerp) DO UPDATE SET"
+                " totaal = totaal + 1, correct = correct + excluded.correct, fouten = fouten + excluded.fouten",
+                (leerling, onderwerp, goed, 1 - goed),
+            )
+
+    # ---------- Lezen ---------- #
+
+    def statistieken(self, leerling: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT totaal, correct FROM leerlingen WHERE leerling = ?", (leerling,)
+            ).fetchone()
+        totaal, correct = row or (0, 0)
+        return {"totaal": totaal, "correct": correct, "percentage": percentage(correct, totaal)}
+
+    def zwakke_punten(self, leerling: str, k: int = 3) -> List[str]:
+        """De `k` onderwerpen met de meeste fouten (bij gelijke stand het eerst geoefende)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT onderwerp FROM tellers WHERE leerling = ? AND fouten > 0"
+                " ORDER BY fouten DESC, rowid LIMIT ?",
+                (leerling, k),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def fouten_per_onderwerp(self, leerling: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT onderwerp, fouten FROM tellers WHERE leerling = ? AND fouten > 0 ORDER BY rowid",
+                (leerling,),
+            ).fetchall()
+        return dict(rows)
+
+    def pogingen(self, leerling: Optional[str] = None, na_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Ruwe pogingen met id > `na_id` (cursor), optioneel van één leerling, maximaal `limit`."""
+        query = "SELECT id, leerling, tijd, type, onderwerp, bron_id, correct, antwoord FROM pogingen WHERE id > ?"
+        params: List[Any] = [na_id]
+        if leerling is not None:
+            query += " AND leerling = ?"
+            params.append(leerling)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        velden = ("id", "leerling", "tijd", "type", "onderwerp", "bron_id", "correct", "antwoord")
+        return [{**dict(zip(velden, row)), "correct": bool(row[6])} for row in rows]
+
+    # ---------- Export ---------- #
+
+    def exporteer(self, leerlingen: Optional[Iterable[str]] = None, k: int = 3) -> Iterator[Dict[str, Any]]:
+        """
+        Overzicht per leerling (alle, of alleen `leerlingen`), uit de tellers en dus zonder
+        de pogingen te lezen. Zwakke punten als lijst, zoals in `zwakke_punten`.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT leerling, totaal, correct, eerste, laatste FROM leerlingen ORDER BY leerling"
+            ).fetchall()
+            fouten = self._db.execute(
+                "SELECT leerling, onderwerp FROM tellers WHERE fouten > 0 ORDER BY leerling, fouten DESC, rowid"
+            ).fetchall()
+        zwak: Dict[str, List[str]] = {}
+        for leerling, onderwerp in fouten:
+            lijst = zwak.setdefault(leerling, [])
+            if len(lijst) < k:
+                lijst.append(onderwerp)
+
+        gekozen = set(leerlingen) if leerlingen is not None else None
+        for leerling, totaal, correct, eerste, laatste in rows:
+            if gekozen is not None and leerling not in gekozen:
+                continue
+            yield {
+                "leerling": leerling,
+                "totaal": totaal,
+                "correct": correct,
+                "percentage": percentage(correct, totaal),
+                "eerste": eerste,
+                "laatste": laatste,
+                "zwakke_punten": zwak.get(leerling, []),
+            }
+
+    def schrijf_csv(self, pad: str, leerlingen: Optional[Iterable[str]] = None) -> int:
+        """Schrijft het overzicht per leerling naar een CSV-bestand; geeft het aantal leerlingen."""
+        aantal = 0
+        with open(pad, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_VELDEN)
+            writer.writeheader()
+            for rij in self.exporteer(leerlingen):
+                writer.writerow({**rij, "zwakke_punten": "; ".join(rij["zwakke_punten"])})
+                aantal += 1
+        return aantal
+
+    def schrijf_parquet(self, pad: str, leerlingen: Optional[Iterable[str]] = None) -> int:
+        """Zelfde overzicht als Parquet-bestand (kolommen), voor dashboards; vereist pyarrow."""
+        if pyarrow is None:
+            raise ImportError("Voor Parquet-export is pyarrow nodig (pip install pyarrow)")
+        rijen = list(self.exporteer(leerlingen))
+        tabel = pyarrow.table({veld: [rij[veld] for rij in rijen] for veld in EXPORT_VELDEN})
+        pyarrow.parquet.write_table(tabel, pad)
+        return len(rijen)
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            pogingen = self._db.execute("SELECT COUNT(*) FROM pogingen").fetchone()[0]
+            leerlingen = self._db.execute("SELECT COUNT(*) FROM leerlingen").fetchone()[0]
+        return {"pad": self.path, "pogingen": pogingen, "leerlingen": leerlingen}
+
+
+# ================================================================
+#  Gedeelde instantie
+# ================================================================
+
+_store: Optional[ProgressStore] = None
+_store_lock = threading.Lock()
+
+
+def get_progress_store() -> ProgressStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ProgressStore.from_env()
+    return _store
@@ -0,0 +1,181 @@
+# rule_grader.py
+"""
+Lokale nakijker voor gesloten vragen (invuloefening, meerkeuze, lezen).
+
+Duidelijke gevallen worden hier in microseconden beslist:
+- exacte match na normalisatie (hoofdletters, witruimte, leestekens, afkortingen als don't),
+- meerkeuze: de tekst van een optie, anders letter (a-d) of nummer (1-n); een los woord dat
+  op geen enkele optie lijkt is INCORRECT,
+- invuloefening: één tikfout in één lang woord is BIJNA, een antwoord dat nergens op lijkt
+  is INCORRECT. Een verschil in een hulpwerkwoord (has/had) of een uitgang (build/built,
+  studies/studied) is juist de grammatica die getoetst wordt; dat beslist de LLM.
+
+Twijfelgevallen geven None terug; die gaan daarna alsnog naar de LLM.
+"""
+
+import re
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+CORRECT = "CORRECT"
+BIJNA = "BIJNA"
+INCORRECT = "INCORRECT"
+
+_CONTRACTIES = [
+    (r"\bwon't\b", "will not"),
+    (r"\bcan't\b", "can not"),
+    (r"\bcannot\b", "can not"),
+    (r"\bshan't\b", "shall not"),
+    (r"n't\b", " not"),
+    (r"'re\b", " are"),
+    (r"'ve\b", " have"),
+    (r"'ll\b", " will"),
+    (r"'m\b", " am"),
+]
+_CONTRACTIES = [(re.compile(p), v) for p, v in _CONTRACTIES]
+_SCHEIDING = re.compile(r"[/,;:…]|\.{2,}|\s-\s")
+_LEESTEKENS = re.compile(r"[.!?\"()\[\]]")
+
+_HULPWERKWOORDEN = frozenset(
+    "am is are was were be been being have has had do does did will would shall should "
+    "can could may might must not".split()
+)
+_UITGANGEN = frozenset(("", "s", "es", "d", "ed", "t", "n", "en", "ing"))
+
+
+def normaliseer(tekst: str) -> str:
+    """Kleine letters, rechte apostrofs, afkortingen uitgeschreven, scheidingstekens als spatie."""
+    tekst = (tekst or "").lower().replace("’", "'").replace("‘", "'")
+    for patroon, vervanging in _CONTRACTIES:
+        tekst = patroon.sub(vervanging, tekst)
+    tekst = _SCHEIDING.sub(" ", tekst)
+    tekst = _LEESTEKENS.sub("", tekst)
+    return " ".join(tekst.split())
+
+
+def edit_afstand(a: str, b: str, maximum: int) -> int:
+    """Levenshtein-afstand; stopt zodra de afstand groter is dan `maximum`."""
+    if abs(len(a) - len(b)) > maximum:
+        return maximum + 1
+    vorige = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        huidige = [i]
+        for j, cb in enumerate(b, 1):
+            huidige.append(min(vorige[j] + 1, huidige[j - 1] + 1, vorige[j - 1] + (ca != cb)))
+        if min(huidige) > maximum:
+            return maximum + 1
+        vorige = huidige
+    return vorige[-1]
+
+
+class RuleGrader:
+    def __init__(self, typo_min_lengte: int = 6, optie_drempel: float = 0.85, optie_marge: float = 0.15):
+        # Eén tikfout telt pas als BIJNA vanaf deze lengte; bij korte woorden is één letter
+        # vaak precies de grammaticale fout (work/works) en beslist de LLM.
+        self.typo_min_lengte = typo_min_lengte
+        self.optie_drempel = optie_drempel
+        self.optie_marge = optie_marge
+
+        self._lock = threading.Lock()
+        self._counters = {"lokaal": 0, "llm": 0, CORRECT: 0, BIJNA: 0, INCORRECT: 0}
+
+    # ---------- Meerkeuze ---------- #
+
+    def kies_optie(self, antwoord: str, opties: List[str]) -> Optional[int]:
+        """Index van de bedoelde optie, of None als dat niet eenduidig is."""
+        norm = normaliseer(antwoord)
+        genormaliseerd = [normaliseer(o) for o in opties]
+        if norm in genormaliseerd:
+            return genormaliseerd.index(norm)  # de tekst van een optie gaat voor (a/an/the, 1/2/3)
+
+        ruw = antwoord.strip().lower().rstrip(".)")
+        positie = None
+        if len(ruw) == 1 and ruw in "abcdefgh"[:len(opties)]:
+            positie, zelfde_soort = "abcdefgh".index(ruw), [o for o in genormaliseerd if len(o) == 1 and o.isalpha()]
+        elif ruw.isdigit() and 1 <= int(ruw) <= len(opties):
+            positie, zelfde_soort = int(ruw) - 1, [o for o in genormaliseerd if o.isdigit()]  # vanaf 1 genummerd
+        if positie is not None:
+            # Zijn de opties zelf letters of cijfers, dan kan "b" ook een (verkeerd gespelde) optie zijn
+            return None if zelfde_soort else positie
+
+        # Bijna-letterlijk overgetypt: alleen als één optie duidelijk het beste past
+        scores = sorted(
+            ((SequenceMatcher(None, norm, o).ratio(), i) for i, o in enumerate(genormaliseerd)),
+            reverse=True,
+        )
+        beste, tweede = scores[0], scores[1] if len(scores) > 1 else (0.0, -1)
+        if beste[0] >= self.optie_drempel and beste[0] - tweede[0] >= self.optie_marge:
+            return beste[1]
+        return None
+
+    @staticmethod
+    def _onbekend_woord(antwoord: str, opties: List[str]) -> Optional[str]:
+        """Eén los woord dat op geen enkele (eenwoords-)optie lijkt is gewoon fout."""
+        genormaliseerd = [normaliseer(o) for o in opties]
+        if " " in antwoord or any(" " in o for o in genormaliseerd):
+            return None  # zinnen (bv. bij lezen) laten we aan de LLM
+        if all(edit_afstand(antwoord, o, maximum=2) > 2 for o in genormaliseerd):
+            return INCORRECT
+        return None
+
+    # ---------- Open invulvraag ---------- #
+
+    def _beoordeel_invul(self, antwoord: str, juist: str) -> Optional[str]:
+        if antwoord == juist:
+            return CORRECT
+        if not antwoord:
+            return INCORRECT
+
+        woorden, juiste_woorden = antwoord.split(), juist.split()
+        if len(woorden) == len(juiste_woorden):
+            verschil = [(a, j) for a, j in zip(woorden, juiste_woorden) if a != j]
+            if len(verschil) == 1 and edit_afstand(*verschil[0], maximum=1) == 1:
+                return self._tikfout(*verschil[0])
+
+        # Geen enkel woord gemeen en ook qua letters ver weg: duidelijk fout
+        if not set(antwoord.split()) & set(juist.split()) and SequenceMatcher(None, antwoord, juist).ratio() < 0.4:
+            return INCORRECT
+        return None
+
+    def _tikfout(self, woord: str, juist: str) -> Optional[str]:
+        """Eén letter verschil in één woord: BIJNA bij een tikfout, None als het grammatica kan zijn."""
+        if woord in _HULPWERKWOORDEN or juist in _HULPWERKWOORDEN or len(juist) < self.typo_min_lengte:
+            return None
+        gemeen = 0
+        while gemeen < min(len(woord), len(juist)) and woord[gemeen] == juist[gemeen]:
+            gemeen += 1
+        if woord[gemeen:] in _UITGANGEN and juist[gemeen:] in _UITGANGEN:
+            return None  # alleen de uitgang verschilt (built/build, studied/studies)
+        return BIJNA
+
+    # ---------- Publiek ---------- #
+
+    def beoordeel(self, antwoord: str, juist_antwoord: str, opties: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Geeft CORRECT / BIJNA / INCORRECT als de regels het zeker weten, anders None (→ LLM).
+        """
+        if opties:
+            index = self.kies_optie(antwoord, opties)
+            if index is None:
+                oordeel = self._onbekend_woord(normaliseer(antwoord), opties)
+            else:
+                oordeel = CORRECT if normaliseer(opties[index]) == normaliseer(juist_antwoord) else INCORRECT
+        else:
+            oordeel = self._beoordeel_invul(normaliseer(antwoord), normaliseer(juist_antwoord))
+
+        with self._lock:
+            if oordeel is None:
+                self._counters["llm"] += 1
+            else:
+                self._counters["lokaal"] += 1
+                self._counters[oordeel] += 1
+        return oordeel
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            totaal = self._counters["lokaal"] + self._counters["llm"]
+            return {
+                **self._counters,
+                "lokaal_aandeel": round(self._counters["lokaal"] / totaal, 3) if totaal else 0.0,
+            }
@@ -0,0 +1,225 @@
+# session_store.py
+"""
+Begrensde sessie-opslag voor de FastAPI server (main.py).
+
+- LRU: bij meer dan `max_sessions` live sessies wordt de minst recent gebruikte verwijderd.
+- TTL: sessies die langer dan `ttl_seconds` niet gebruikt zijn verlopen.
+- Byte-cap: de chatgeschiedenis per sessie wordt ingekort tot `max_history_bytes`
+  (het systeembericht op positie 0 blijft altijd staan). Het frontend-log (`turns`)
+  krijgt dezelfde limiet.
+- Optioneel: bij LRU-eviction wordt de sessie naar een lokale SQLite-database geschreven
+  en bij het volgende gebruik weer ingeladen.
+
+Gedraagt zich als een dict (`in`, `[]`, `[]=`), zodat de endpoints niet hoeven te veranderen.
+Een handler die een sessie wijzigt (bv. `history` aanvult) schrijft hem daarna terug met
+`sessions[session_id] = session`: de sessie kan tussendoor naar SQLite zijn geschreven (dan
+zou de wijziging verloren gaan) en pas bij het terugschrijven wordt de byte-cap weer toegepast.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def message_bytes(msg: Any) -> int:
+    # LangChain-berichten hebben .content; frontend-beurten zijn dicts
+    content = getattr(msg, "content", msg)
+    if not isinstance(content, str):
+        content = str(content)
+    return len(content.encode("utf-8"))
+
+
+def history_bytes(history) -> int:
+    return sum(message_bytes(m) for m in history)
+
+
+class SessionStore:
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl_seconds: float = 4 * 3600,
+        max_history_bytes: int = 256_000,
+        spill_path: Optional[str] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history_bytes = max_history_bytes
+
+        # session_id -> (laatst gebruikt, sessie-dict); volgorde = LRU (oudste eerst)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Sessies met een rij in SQLite; die rij is verouderd zodra de sessie teruggeschreven wordt
+        self._spilled_ids: set = set()
+
+        self._counters = {
+            "evictions_lru": 0,
+            "evictions_ttl": 0,
+            "history_trims": 0,
+            "spilled": 0,
+            "restored": 0,
+            "written_back": 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " last_used REAL NOT NULL,"
+                " data BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    # ---------- dict-API ---------- #
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]):
+        with self._lock:
+            if session_id in self._spilled_ids:
+                # Tussendoor weggeschreven terwijl de handler hem nog wijzigde: deze versie is nieuwer
+                self._spilled_ids.discard(session_id)
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+                self._counters["written_back"] += 1
+            self._trim_history(session)
+            self._sessions[session_id] = (time.monotonic(), session)
+            self._sessions.move_to_end(session_id)
+            self._expire()
+            while len(self._sessions) > self.max_sessions:
+                old_id, (_, old_session) = self._sessions.popitem(last=False)
+                self._counters["evictions_lru"] += 1
+                self._spill(old_id, old_session)
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            self._spilled_ids.discard(session_id)
+            if self._db is not None:
+                cur = self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+                found = found or cur.rowcount > 0
+            if not found:
+                raise KeyError(session_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire()
+            return len(self._sessions)
+
+    def get(self, session_id: str, default=None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                session = self._restore(session_id)
+                if session is None:
+                    return default
+                self[session_id] = session
+            else:
+                session = entry[1]
+                self._sessions[session_id] = (time.monotonic(), session)
+                self._sessions.move_to_end(session_id)
+            self._trim_history(session)
+            return session
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._spilled_ids.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions")
+                self._db.commit()
+
+    # ---------- Interne hulpfuncties ---------- #
+
+    def _expire(self):
+        """Verwijdert verlopen sessies; de oudste staan vooraan, dus we stoppen bij de eerste verse."""
+        if not self.ttl_seconds:
+            return
+        grens = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            old_id, (last_used, _) = next(iter(self._sessions.items()))
+            if last_used >= grens:
+                break
+            del self._sessions[old_id]
+            self._counters["evictions_ttl"] += 1
+
+    def _trim_history(self, session: Dict[str, Any]):
+        # In "history" is positie 0 het systeembericht; in "turns" mag alles weg behalve de laatste beurt
+        for key, keep_first in (("history", 1), ("turns", 0)):
+            items = session.get(key)
+            if not items or not self.max_history_bytes:
+                continue
+            totaal = history_bytes(items)
+            if totaal <= self.max_history_bytes:
+                continue
+            drop = 0
+            while totaal > self.max_history_bytes and keep_first + drop < len(items) - 1:
+                totaal -= message_bytes(items[keep_first + drop])
+                drop += 1
+            if drop:
+                del items[keep_first:keep_first + drop]
+                self._counters["history_trims"] += 1
+                if key == "history":
+                    session["history_dropped"] = session.get("history_dropped", 0) + drop
+
+    def _spill(self, session_id: str, session: Dict[str, Any]):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, last_used, data) VALUES (?, ?, ?)",
+            (session_id, time.time(), pickle.dumps(session)),
+        )
+        self._db.commit()
+        self._spilled_ids.add(session_id)
+        self._counters["spilled"] += 1
+
+    def _restore(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT last_used, data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._spilled_ids.discard(session_id)
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        if self.ttl_seconds and time.time() - row[0] > self.ttl_seconds:
+            self._db.execute("DELETE FROM sessions WHERE last_used < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
+            self._counters["evictions_ttl"] += 1
+            return None
+        self._db.commit()
+        self._counters["restored"] += 1
+        return pickle.loads(row[1])
+
+    # ---------- Metrics ---------- #
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            spilled_now = 0
+            if self._db is not None:
+                spilled_now = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {
+                "live_sessions": len(self._sessions),
+                "spilled_sessions": spilled_now,
+                "resident_bytes": sum(
+                    history_bytes(session.get("history", [])) + history_bytes(session.get("turns", []))
+                    for _, session in self._sessions.values()
+                ),
+                **self._counters,
+                "evictions": self._counters["evictions_lru"] + self._counters["evictions_ttl"],
+            }
@@ -0,0 +1,76 @@
+# single_flight.py
+"""
+Single-flight: gelijktijdige identieke aanroepen delen één uitvoering.
+
+De eerste aanroep voor een sleutel (de leider) doet het echte werk; aanroepen die binnenkomen
+terwijl die nog bezig is (volgers) wachten op hetzelfde resultaat, of krijgen dezelfde fout.
+Na afloop is de sleutel weer vrij: een latere aanroep start een nieuwe uitvoering
+(bewaren is de taak van de cache, niet van deze module).
+
+    flights = SingleFlight()
+    resultaat, gedeeld = flights.do(sleutel, lambda: llm_call(prompt))
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class Afgebroken(Exception):
+    """De leider stopte zonder resultaat (bv. een stream die niet uitgelezen werd)."""
+
+
+class Flight:
+    def __init__(self):
+        self._klaar = threading.Event()
+        self._resultaat: Any = None
+        self._fout: Optional[BaseException] = None
+        self.volgers = 0
+
+    def wacht(self, timeout: Optional[float] = None) -> Any:
+        if not self._klaar.wait(timeout):
+            raise TimeoutError("wachten op gedeelde aanroep duurde te lang")
+        if self._fout is not None:
+            raise self._fout
+        return self._resultaat
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+
+    def begin(self, sleutel: str) -> Tuple[Flight, bool]:
+        """(flight, is_leider). Een leider moet altijd `einde` aanroepen, ook bij een fout."""
+        with self._lock:
+            flight = self._flights.get(sleutel)
+            if flight is not None:
+                flight.volgers += 1
+                return flight, False
+            flight = Flight()
+            self._flights[sleutel] = flight
+            return flight, True
+
+    def einde(self, sleutel: str, flight: Flight, resultaat: Any = None, fout: Optional[BaseException] = None):
+        with self._lock:
+            if self._flights.get(sleutel) is flight:
+                del self._flights[sleutel]
+        flight._resultaat = resultaat
+        flight._fout = fout
+        flight._klaar.set()
+
+    def do(self, sleutel: str, functie: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Voert `functie` uit of wacht op de lopende uitvoering; geeft (resultaat, gedeeld)."""
+        flight, leider = self.begin(sleutel)
+        if not leider:
+            return flight.wacht(), True
+        try:
+            resultaat = functie()
+        except BaseException as e:
+            self.einde(sleutel, flight, fout=e)
+            raise
+        self.einde(sleutel, flight, resultaat=resultaat)
+        return resultaat, False
+
+    def bezig(self) -> int:
+        with self._lock:
+            return len(self._flights)
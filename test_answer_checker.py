@@ -0,0 +1,133 @@
+# test_answer_checker.py
+"""
+Fuzz-tests voor de schrijfbeoordeling (pytest, of gewoon `python test_answer_checker.py`).
+
+Afgekapte, verminkte en opgeblazen LLM-output mag nooit een exceptie geven, moet altijd
+een geldig resultaat met scores tussen 0 en 1 opleveren en blijft binnen een tijdsbudget,
+ook rond en ver boven MAX_MANUAL_CHARS. De LLM-call wordt vervangen; er is geen Ollama nodig.
+"""
+
+import contextlib
+import io
+import json
+import random
+import time
+
+import answer_checker
+from answer_checker import (
+    MAX_MANUAL_CHARS,
+    WRITING_CRITERIA,
+    WRITING_EXERCISES,
+    WRITING_RESULTS,
+    check_writing,
+    extract_fields_manually,
+    extract_json_from_llm_response,
+)
+
+# Ruim: op een trage CI-machine nog steeds een factor 10 onder wat kwadratisch gedrag zou kosten
+TIJDSBUDGET = 0.25
+
+BASIS = json.dumps({
+    "overall_score": 0.72, "result": "almost",
+    "criteria": {"structure": 0.8, "content": 0.7, "language": 0.65},
+    "error_types": ["grammar", "spelling"], "comments": "Let op de tijden.",
+}, indent=2)
+
+
+def verminkingen(rng: random.Random, tekst: str, aantal: int):
+    """Afgekapte, verminkte, willekeurige en opgeblazen varianten van een LLM-antwoord."""
+    for _ in range(aantal):
+        soort = rng.randrange(5)
+        if soort == 0:
+            yield tekst[:rng.randrange(len(tekst))]
+        elif soort == 1:
+            tekens = list(tekst)
+            for _ in range(rng.randint(1, 8)):
+                tekens[rng.randrange(len(tekens))] = rng.choice("{}[]\"',:\\ x9.\n")
+            yield "".join(tekens)
+        elif soort == 2:
+            tekens = list(tekst)
+            for _ in range(rng.randint(1, 8)):
+                del tekens[rng.randrange(len(tekens))]
+            yield "".join(tekens)
+        elif soort == 3:
+            yield "".join(rng.choice("{}[]\"':=, abc0.5-\n\\") for _ in range(rng.randint(0, 400)))
+        else:
+            yield rng.choice(["-1e999", "overall_score: 250", "result: maybe", "NaN", "", " "])
+
+
+def grote_invoer():
+    """Pathologische invoer net onder, op en ver boven MAX_MANUAL_CHARS."""
+    for lengte in (MAX_MANUAL_CHARS - 1, MAX_MANUAL_CHARS, MAX_MANUAL_CHARS + 1, 10 * MAX_MANUAL_CHARS):
+        for blok in ('"overall_score": "', "overall_score: ", "structure=", "\\'", '"', "[", "{", "x"):
+            yield (blok * (lengte // len(blok) + 1))[:lengte]
+
+
+def assert_geldig(resultaat: dict):
+    assert resultaat["result"] in WRITING_RESULTS
+    assert 0.0 <= resultaat["overall_score"] <= 1.0
+    assert set(resultaat["criteria"]) == set(WRITING_CRITERIA)
+    assert all(0.0 <= v <= 1.0 for v in resultaat["criteria"].values())
+    assert isinstance(resultaat["error_types"], list)
+
+
+def test_extract_fields_manually_fuzz():
+    rng = random.Random(15)
+    for tekst in verminkingen(rng, BASIS, 2000):
+        assert_geldig(extract_fields_manually(tekst))
+
+
+def test_extract_json_fuzz():
+    rng = random.Random(16)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tekst in verminkingen(rng, BASIS, 2000):
+            assert_geldig(extract_json_from_llm_response(tekst))
+
+
+def test_grote_invoer_binnen_tijdsbudget():
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tekst in grote_invoer():
+            for functie in (extract_fields_manually, extract_json_from_llm_response):
+                start = time.perf_counter()
+                assert_geldig(functie(tekst))
+                duur = time.perf_counter() - start
+                assert duur < TIJDSBUDGET, f"{functie.__name__}: {duur:.3f} s voor {tekst[:20]!r} x {len(tekst)}"
+
+
+def test_check_writing_fuzz():
+    rng = random.Random(17)
+    exercise = WRITING_EXERCISES[0]
+    antwoord = "Dear Sir, I could not come to school yesterday. " * 3
+    origineel = answer_checker.call_ollama
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tekst in [*verminkingen(rng, BASIS, 300), *grote_invoer()]:
+                answer_checker.call_ollama = lambda *args, _tekst=tekst, **kwargs: _tekst
+                resultaat = check_writing(exercise, antwoord)
+                assert resultaat["result"] in WRITING_RESULTS
+                assert 0.0 <= resultaat["score"] <= 1.0
+    finally:
+        answer_checker.call_ollama = origineel
+
+
+def test_check_writing_zonder_llm():
+    """Een mislukte LLM-call geeft de fallback-score, geen exceptie."""
+    def kapot(*args, **kwargs):
+        raise ConnectionError("Ollama draait niet")
+
+    origineel = answer_checker.call_ollama
+    answer_checker.call_ollama = kapot
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultaat = check_writing(WRITING_EXERCISES[0], "Too short.")
+    finally:
+        answer_checker.call_ollama = origineel
+    assert resultaat["result"] in WRITING_RESULTS
+    assert "too_short" in resultaat["details"]["error_types"]
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
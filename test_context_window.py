@@ -0,0 +1,95 @@
+# test_context_window.py
+"""
+ContextBuilder (pytest, of gewoon `python test_context_window.py`): het venster blijft binnen
+het budget, oudere beurten komen in de samenvatting, en geen beurt gaat zowel samengevat als
+letterlijk mee, ook niet als chat (standaardbudget) en oefeningen (kleiner budget) elkaar afwisselen.
+"""
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from context_window import ContextBuilder, message_tokens
+
+SAMENVATTING = "Samenvatting van het eerdere gesprek:"
+
+
+def nieuwe_sessie():
+    return {"history": [SystemMessage(content="Je bent Meester Jan.")]}
+
+
+def beurt(session, i):
+    # Elke beurt begint met een unieke eerste zin, zodat hij in de samenvatting herkenbaar is
+    session["history"].append(HumanMessage(content=f"Vraag nummer {i}. " + "Hoe werkt de present perfect? " * 6))
+    session["history"].append(AIMessage(content=f"Antwoord nummer {i}. " + "Je gebruikt have plus voltooid deelwoord. " * 6))
+
+
+def controleer(messages, session):
+    samenvatting = [m for m in messages if str(m.content).startswith(SAMENVATTING)]
+    letterlijk = [m for m in messages[1:] if m not in samenvatting and m in session["history"]]
+    assert letterlijk, "minstens één recente beurt gaat letterlijk mee"
+    assert letterlijk == session["history"][-len(letterlijk):], "de letterlijke beurten zijn de meest recente"
+    if samenvatting:
+        tekst = str(samenvatting[0].content)
+        for m in letterlijk:
+            eerste_zin = str(m.content).split(". ")[0]
+            assert eerste_zin + "." not in tekst, f"{eerste_zin!r} staat zowel in de samenvatting als letterlijk"
+    return letterlijk
+
+
+def test_venster_binnen_budget_en_samenvatting():
+    builder = ContextBuilder(max_tokens=600, summary_max_tokens=150)
+    session = nieuwe_sessie()
+    for i in range(30):
+        beurt(session, i)
+        messages = builder.build(session)
+        controleer(messages, session)
+        assert sum(message_tokens(m) for m in messages) <= 600
+    assert "Vraag nummer 0" not in session["summary"]  # oudste regels vallen uit de samenvatting
+    assert "nummer 20" in session["summary"]
+
+
+def test_afwisselend_chat_en_oefening():
+    builder = ContextBuilder(max_tokens=1500, summary_max_tokens=200)
+    session = nieuwe_sessie()
+    extra = [HumanMessage(content="Maak een oefening.")]
+    for i in range(40):
+        beurt(session, i)
+        voor = (session.get("summary"), session.get("summary_upto"))
+        controleer(builder.build(session, extra=extra, max_tokens=500), session)
+        # Een oefening met een eigen budget laat de samenvattings-state van de sessie ongemoeid
+        assert (session.get("summary"), session.get("summary_upto")) == voor
+        chat = controleer(builder.build(session), session)
+        if i > 10:
+            assert len(chat) > len(controleer(builder.build(session, extra=extra, max_tokens=500), session))
+
+
+def test_bewaarde_samenvatting_niet_dubbel():
+    """Ook als een bewaard venster kleiner was dan het huidige, geen beurt dubbel meesturen."""
+    builder = ContextBuilder(max_tokens=1500, summary_max_tokens=200)
+    session = nieuwe_sessie()
+    for i in range(30):
+        beurt(session, i)
+        builder.build(session, max_tokens=500, persist=True)
+    upto = session["summary_upto"]
+    letterlijk = controleer(builder.build(session), session)
+    assert len(letterlijk) == len(session["history"]) - 1 - upto
+
+
+def test_history_dropped():
+    """Beurten die de SessionStore vooraan wegknipt verschuiven de index van de samenvatting niet."""
+    builder = ContextBuilder(max_tokens=600, summary_max_tokens=150)
+    session = nieuwe_sessie()
+    for i in range(20):
+        beurt(session, i)
+        builder.build(session)
+    del session["history"][1:11]
+    session["history_dropped"] = 10
+    for i in range(20, 25):
+        beurt(session, i)
+        controleer(builder.build(session), session)
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
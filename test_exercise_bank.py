@@ -0,0 +1,106 @@
+# test_exercise_bank.py
+"""
+ExerciseBank (pytest, of gewoon `python test_exercise_bank.py`): inlezen en foutmeldingen
+voor bankbestanden van scholen, ontdubbelen op content-id en de index per
+(soort, onderwerp, moeilijkheid).
+"""
+
+import json
+import os
+import random
+import tempfile
+
+from exercise_bank import ExerciseBank, inhoud_id, maak_item
+
+
+def gapfill(vraag="She ___ (work) here.", onderwerp="present_simple", moeilijkheid=1, **extra):
+    return {"soort": "gapfill", "onderwerp": onderwerp, "moeilijkheid": moeilijkheid,
+            "vraag": vraag, "antwoord": "works", **extra}
+
+
+def fout(data) -> str:
+    try:
+        maak_item(data)
+    except ValueError as e:
+        return str(e)
+    raise AssertionError("ValueError verwacht")
+
+
+def test_moeilijkheid():
+    assert maak_item(gapfill(moeilijkheid="Medium")).moeilijkheid == 2
+    assert maak_item(gapfill(moeilijkheid="3")).moeilijkheid == 3
+    assert maak_item(gapfill(moeilijkheid=None)).moeilijkheid == 2
+    melding = fout(gapfill(moeilijkheid="expert"))
+    assert "'expert'" in melding and "makkelijk" in melding and "ontbreekt" not in melding
+    assert "1, 2 of 3" in fout(gapfill(moeilijkheid=5))
+
+
+def test_foutmeldingen():
+    data = gapfill()
+    del data["antwoord"]
+    assert fout(data) == "veld 'antwoord' ontbreekt"
+    assert "onbekende soort" in fout({**gapfill(), "soort": "luisteren"})
+    assert "niet tussen de opties" in fout(
+        {"soort": "meerkeuze", "onderwerp": "modals", "vraag": "?", "opties": ["must", "can"], "antwoord": "may"}
+    )
+
+
+def test_bestand_van_school_met_padnaam_in_fout():
+    fd, pad = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"items": [gapfill(moeilijkheid="expert")]}, f)
+    try:
+        ExerciseBank.laad([pad])
+    except ValueError as e:
+        assert str(e).startswith(pad) and "'expert'" in str(e)
+    else:
+        raise AssertionError("ValueError verwacht")
+    finally:
+        os.remove(pad)
+
+
+def test_ontdubbelen_op_inhoud():
+    # Zelfde inhoud met een andere moeilijkheid is hetzelfde item
+    assert inhoud_id(gapfill(moeilijkheid=1)) == inhoud_id(gapfill(moeilijkheid=3))
+    bank = ExerciseBank()
+    assert bank.voeg_toe([maak_item(gapfill()), maak_item(gapfill(moeilijkheid=2))]) == 1
+    assert bank.voeg_toe([maak_item(gapfill(vraag="He ___ (work) there."))]) == 1
+    assert bank.metrics()["items"] == 2
+    item = bank.items("gapfill")[0]
+    assert bank.get(item.id) is item
+
+
+def test_index_en_kies():
+    bank = ExerciseBank(maak_item(d) for d in (
+        gapfill("A ___.", "present_simple", 1),
+        gapfill("B ___.", "present_simple", 3),
+        gapfill("C ___.", "past_simple", 1),
+    ))
+    assert [i.content for i in bank.items("gapfill", "present_simple", 3)] == ["B ___."]
+    assert {i.content for i in bank.items("gapfill", None, 1)} == {"A ___.", "C ___."}
+    assert bank.onderwerpen("gapfill") == ["present_simple", "past_simple"]
+
+    rng = random.Random(1)
+    assert bank.kies("gapfill", "past_simple", rng=rng).content == "C ___."
+    # Geen item met deze moeilijkheid: een ander item van hetzelfde onderwerp
+    assert bank.kies("gapfill", "past_simple", 3, rng=rng).content == "C ___."
+    # Onbekend onderwerp: een willekeurig onderwerp van deze soort
+    assert bank.kies("gapfill", "future", rng=rng).soort == "gapfill"
+    try:
+        bank.kies("lezen")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("KeyError verwacht")
+
+
+def test_standaardbank_laadt():
+    bank = ExerciseBank.laad()
+    assert all(bank.items(soort) for soort in ("gapfill", "meerkeuze", "lezen", "schrijven"))
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,132 @@
+# test_exercise_pool.py
+"""
+ExercisePool (pytest, of gewoon `python test_exercise_pool.py`): aanvullen tot `depth`,
+alleen voor herhaalde of toegestane combinaties, hooguit één aanvultaak per combinatie,
+verouderde oefeningen weg, en LRU/idle-eviction die ook de aanvultaak stopt.
+"""
+
+import asyncio
+
+from exercise_pool import ExercisePool
+
+
+class NepGenerator:
+    def __init__(self, delay: float = 0.0, mislukt: bool = False):
+        self.delay = delay
+        self.mislukt = mislukt
+        self.calls = []
+        self.tegelijk = self.max_tegelijk = 0
+
+    async def __call__(self, topic, theme, skill):
+        self.calls.append((topic, theme, skill))
+        self.tegelijk += 1
+        self.max_tegelijk = max(self.max_tegelijk, self.tegelijk)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.tegelijk -= 1
+        return None if self.mislukt else {"question": f"{theme} {len(self.calls)}"}
+
+
+async def stil(pool: ExercisePool):
+    """Wacht tot alle aanvultaken klaar zijn."""
+    while pool.metrics()["refilling"]:
+        await asyncio.sleep(0.001)
+
+
+def test_eenmalig_thema_kost_geen_aanvulling():
+    async def run():
+        gen = NepGenerator()
+        pool = ExercisePool(gen, depth=3)
+        assert await pool.get("Engels", "Draken", "grammar") is None
+        await stil(pool)
+        assert gen.calls == [] and pool.metrics()["misses"] == 1
+
+        # Tweede keer gevraagd: nu wel aanvullen tot depth, daarna een treffer
+        assert await pool.get("Engels", "draken ", "Grammar") is None  # zelfde sleutel na normalisatie
+        await stil(pool)
+        assert len(gen.calls) == 3 and pool.metrics()["pooled"] == 3
+        assert await pool.get("Engels", "Draken", "grammar") is not None
+        await stil(pool)
+        m = pool.metrics()
+        assert m["hits"] == 1 and m["pooled"] == 3 and len(gen.calls) == 4
+
+    asyncio.run(run())
+
+
+def test_toegestaan_thema_direct_aanvullen():
+    async def run():
+        gen = NepGenerator()
+        pool = ExercisePool(gen, depth=2, allow_themes=["Algemeen"])
+        await pool.get("Engels", "algemeen", "grammar")
+        await stil(pool)
+        assert len(gen.calls) == 2
+
+    asyncio.run(run())
+
+
+def test_een_aanvultaak_en_concurrency():
+    async def run():
+        gen = NepGenerator(delay=0.02)
+        pool = ExercisePool(gen, depth=4, refill_concurrency=2, min_requests=1)
+        await asyncio.gather(*(pool.get("Engels", "a", "grammar") for _ in range(5)))
+        await asyncio.gather(*(pool.get("Engels", t, "grammar") for t in "bcd"))
+        assert pool.metrics()["refilling"] == 4  # één taak per combinatie
+        await stil(pool)
+        assert len(gen.calls) == 16 and gen.max_tegelijk <= 2
+
+    asyncio.run(run())
+
+
+def test_mislukte_generatie_stopt():
+    async def run():
+        gen = NepGenerator(mislukt=True)
+        pool = ExercisePool(gen, depth=5, min_requests=1)
+        await pool.get("Engels", "a", "grammar")
+        await stil(pool)
+        assert len(gen.calls) == 3 and pool.metrics()["failed"] == 3
+
+    asyncio.run(run())
+
+
+def test_verouderde_oefeningen_weg():
+    async def run():
+        gen = NepGenerator()
+        pool = ExercisePool(gen, depth=2, min_requests=1, max_age_seconds=0.05)
+        await pool.get("Engels", "a", "grammar")
+        await stil(pool)
+        await asyncio.sleep(0.08)
+        assert await pool.get("Engels", "a", "grammar") is None
+        assert pool.metrics()["stale_discarded"] == 2
+
+    asyncio.run(run())
+
+
+def test_lru_en_idle_eviction():
+    async def run():
+        gen = NepGenerator(delay=10)
+        pool = ExercisePool(gen, depth=2, min_requests=1, max_keys=3, idle_seconds=0.05)
+        taken = {}
+        for thema in "abcde":
+            await pool.get("Engels", thema, "grammar")
+            taken[thema] = pool._entries[pool.key("Engels", thema, "grammar")].refill
+        await asyncio.sleep(0)
+        m = pool.metrics()
+        assert m["keys"] == 3 and m["evicted"] == 2 and m["refilling"] == 3
+        # De aanvultaken van de verdreven combinaties zijn gestopt
+        assert [t for t, taak in taken.items() if taak.cancelled()] == ["a", "b"]
+
+        await asyncio.sleep(0.08)
+        await pool.get("Engels", "f", "grammar")
+        assert pool.metrics()["keys"] == 1  # de rest stond te lang stil
+        for entry in list(pool._entries.values()):
+            entry.refill.cancel()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,84 @@
+# test_feedback_generator.py
+"""
+Feedback-templates voor de vaste oefeningen (pytest, of gewoon `python test_feedback_generator.py`):
+een tweede leerling met hetzelfde oordeel krijgt de bewaarde feedback zonder LLM-call.
+De LLM-call wordt vervangen; er is geen Ollama nodig.
+"""
+
+import asyncio
+import contextlib
+import io
+
+import feedback_generator
+from answer_checker import GAPFILL_EXERCISES, MCQ_EXERCISES, check_answer
+from feedback_generator import FEEDBACK_TEMPERATURE, agenerate_feedback, feedback_template_key, generate_feedback
+from feedback_templates import get_feedback_templates
+from tutor_personalities import TutorPersonaliteiten
+
+PERSONA = TutorPersonaliteiten.meester_jan()
+
+
+class NepLLM:
+    """Telt de calls per temperatuur; de aanvulcalls van de templates gebruiken een hogere."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompt, model=None, stream=False, temperature=None, site="feedback"):
+        self.calls.append(temperature)
+        return f"Feedback {len(self.calls)}"
+
+    async def acall(self, prompt, model=None, temperature=None, site="feedback"):
+        return self(prompt, model=model, temperature=temperature)
+
+    def hoofdcalls(self):
+        return self.calls.count(FEEDBACK_TEMPERATURE)
+
+
+@contextlib.contextmanager
+def nep_llm():
+    nep = NepLLM()
+    origineel = feedback_generator.call_ollama, feedback_generator.acall_ollama
+    feedback_generator.call_ollama, feedback_generator.acall_ollama = nep, nep.acall
+    get_feedback_templates().clear()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield nep
+    finally:
+        feedback_generator.call_ollama, feedback_generator.acall_ollama = origineel
+        get_feedback_templates().clear()
+
+
+def test_tweede_gelijk_oordeel_uit_de_cache():
+    oefening = GAPFILL_EXERCISES[0]
+    with nep_llm() as nep:
+        eerste = generate_feedback(oefening, "goes", check_answer(oefening, "goes"), PERSONA)
+        # Andere schrijfwijze, zelfde oordeel: andere prompt, maar dezelfde template-sleutel
+        tweede = generate_feedback(oefening, " Goes ", check_answer(oefening, " Goes "), PERSONA)
+        assert nep.hoofdcalls() == 1
+        assert tweede["feedback_text"] == eerste["feedback_text"]
+        assert get_feedback_templates().metrics()["hits"] == 1
+
+
+def test_async_tweede_gelijk_oordeel_uit_de_cache():
+    oefening = MCQ_EXERCISES[0]
+    with nep_llm() as nep:
+        for antwoord in ("a", "A"):
+            asyncio.run(agenerate_feedback(oefening, antwoord, check_answer(oefening, antwoord), PERSONA))
+        assert nep.hoofdcalls() == 1
+
+
+def test_gegenereerde_oefening_niet_uit_de_cache():
+    oefening = {**GAPFILL_EXERCISES[0], "exercise_id": "ex_1234abcd"}
+    assert feedback_template_key(oefening, "goes", check_answer(oefening, "goes"), PERSONA) is None
+    with nep_llm() as nep:
+        for antwoord in ("goes", " Goes "):
+            generate_feedback(oefening, antwoord, check_answer(oefening, antwoord), PERSONA)
+        assert nep.hoofdcalls() == 2
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,136 @@
+# test_json_stream.py
+"""
+Incrementele JSON-parser (pytest, of gewoon `python test_json_stream.py`): geldige JSON geeft
+hetzelfde als json.loads, ongeacht hoe de stream in stukken binnenkomt; velden komen vrij zodra
+ze compleet zijn; de bekende LLM-fouten worden hersteld en afgekapte output wordt gesloten.
+"""
+
+import json
+import random
+
+from json_stream import (
+    MAX_DEPTH,
+    StreamingJSONParser,
+    iter_array_items,
+    iter_json_events,
+    parse_json,
+    read_until_complete,
+)
+
+
+def in_stukken(rng: random.Random, tekst: str):
+    i = 0
+    while i < len(tekst):
+        n = rng.randint(1, 8)
+        yield tekst[i:i + n]
+        i += n
+
+
+def willekeurige_waarde(rng: random.Random, diepte: int = 0):
+    soort = rng.randrange(7 if diepte < 4 else 5)
+    if soort == 0:
+        return rng.choice([True, False, None])
+    if soort == 1:
+        return rng.randint(-1000, 1000)
+    if soort == 2:
+        return round(rng.uniform(-10, 10), 3)
+    if soort in (3, 4):
+        return "".join(rng.choice('ab "\\/\n\té€😀{}[],:') for _ in range(rng.randint(0, 12)))
+    if soort == 5:
+        return [willekeurige_waarde(rng, diepte + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{i}": willekeurige_waarde(rng, diepte + 1) for i in range(rng.randint(0, 4))}
+
+
+def test_geldige_json_in_willekeurige_stukken():
+    rng = random.Random(14)
+    for _ in range(300):
+        waarde = {"data": willekeurige_waarde(rng)}
+        for tekst in (json.dumps(waarde), json.dumps(waarde, indent=2, ensure_ascii=False)):
+            parser = StreamingJSONParser()
+            for stuk in in_stukken(rng, tekst):
+                parser.feed(stuk)
+            assert parser.done and parser.repairs == 0
+            assert parser.close() == waarde
+
+
+def test_velden_komen_vrij_zodra_ze_compleet_zijn():
+    parser = StreamingJSONParser()
+    assert parser.feed('Hier is de oefening: ```json\n{"question": "Which') == []
+    assert parser.feed(' tense?", "opt') == [(("question",), "Which tense?")]
+    events = parser.feed('ions": ["a", "b"], "answer": "a"} en nog wat tekst')
+    assert events == [
+        (("options", 0), "a"), (("options", 1), "b"), (("options",), ["a", "b"]),
+        (("answer",), "a"), ((), {"question": "Which tense?", "options": ["a", "b"], "answer": "a"}),
+    ]
+    assert parser.done and parser.feed("{}") == []
+
+
+def test_herstel_van_llm_fouten():
+    gevallen = {
+        "{'a': 'b', c: True, d: None,}": {"a": "b", "c": True, "d": None},
+        '{"a": 1 "b": 2}': {"a": 1, "b": 2},
+        '{"zin": "He said "hi" to me", "x": 1}': {"zin": 'He said "hi" to me', "x": 1},
+        '{\\"a\\": \\"b\\"}': {"a": "b"},
+        '{"a": 1, // commentaar\n "b": [1, 2,]}': {"a": 1, "b": [1, 2]},
+        '{"a": [1, 2}': {"a": [1, 2]},
+    }
+    for tekst, verwacht in gevallen.items():
+        assert parse_json(tekst) == verwacht, tekst
+    # Herstelde quotes en sluittekens tellen mee in `repairs` (status "hersteld" in parse_stats)
+    for tekst in list(gevallen)[2:4] + ['{"a": [1, 2}']:
+        parser = StreamingJSONParser()
+        parser.feed(tekst)
+        parser.close()
+        assert parser.repairs > 0, tekst
+
+
+def test_afgekapte_output_wordt_gesloten():
+    assert parse_json('{"question": "Which tense') == {"question": "Which tense"}
+    assert parse_json('{"a": [1, {"b": "c') == {"a": [1, {"b": "c"}]}
+    try:
+        parse_json("geen json hier")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError verwacht")
+
+
+def test_te_diep_genest():
+    parser = StreamingJSONParser()
+    parser.feed("[" * (MAX_DEPTH * 10))
+    assert parser.done
+    diepte, waarde = 0, parser.close()
+    while isinstance(waarde, list) and waarde:
+        diepte, waarde = diepte + 1, waarde[0]
+    assert diepte < MAX_DEPTH
+
+
+def test_array_items_en_stoppen():
+    gelezen = []
+
+    def stream():
+        tekst = '{"exercises": [{"id": 1}, {"id": 2}, {"id": 3}]} daarna nog veel meer tokens'
+        for stuk in in_stukken(random.Random(1), tekst):
+            gelezen.append(stuk)
+            yield stuk
+
+    assert list(iter_array_items(stream())) == [{"id": 1}, {"id": 2}, {"id": 3}]
+    assert "veel" not in "".join(gelezen)  # stopt met lezen zodra de array dicht is
+
+    # Afgekapt midden in het derde item: de eerste twee wel, het halve item niet
+    assert list(iter_array_items(['{"exercises": [{"id": 1}, {"id": 2}, {"id"'])) == [{"id": 1}, {"id": 2}]
+
+
+def test_events_en_read_until_complete():
+    events = list(iter_json_events(['{"a": 1, "b": [tr', "ue"]))
+    assert events[-1] == ((), {"a": 1, "b": [True]})  # afgekapt: hersteld geheel als laatste event
+
+    stukken = ['tekst {"a"', ': 1}', " rest", " nog meer"]
+    assert read_until_complete(iter(stukken)) == 'tekst {"a": 1}'
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
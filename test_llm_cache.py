@@ -0,0 +1,136 @@
+# test_llm_cache.py
+"""
+LLMCache (pytest, of gewoon `python test_llm_cache.py`): treffers per plek, de temperatuurgrens,
+TTL per plek, LRU, het SQLite-bestand dat een herstart overleeft, en streams die pas bewaard
+worden als ze helemaal gelezen zijn.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from llm_cache import LLMCache
+
+
+class Teller:
+    def __init__(self, antwoord: str = "antwoord"):
+        self.antwoord = antwoord
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        return self.antwoord
+
+    def stukken(self):
+        self.calls += 1
+        yield from ("ant", "woord")
+
+
+def test_treffer_na_genormaliseerde_prompt():
+    cache = LLMCache(coalesce=False)
+    gen = Teller()
+    assert cache.get_or_generate("uitleg", "m", 0.2, "Leg  de\npresent perfect uit", gen) == "antwoord"
+    assert cache.get_or_generate("uitleg", "m", 0.2, "Leg de present perfect uit ", gen) == "antwoord"
+    assert gen.calls == 1
+    # Ander model of andere temperatuur: een andere sleutel
+    cache.get_or_generate("uitleg", "ander", 0.2, "Leg de present perfect uit", gen)
+    cache.get_or_generate("uitleg", "m", 0.3, "Leg de present perfect uit", gen)
+    assert gen.calls == 3
+    site = cache.metrics()["sites"]["uitleg"]
+    assert site["hits"] == 1 and site["misses"] == 3 and site["stores"] == 3 and site["hit_rate"] == 0.25
+
+
+def test_hoge_temperatuur_en_fouten_niet_bewaard():
+    cache = LLMCache(max_temperature=0.7, coalesce=False)
+    gen = Teller()
+    for temperatuur in (0.9, None):  # None = Ollama-standaard 0.8
+        cache.get_or_generate("intro", "m", temperatuur, "p", gen)
+        cache.get_or_generate("intro", "m", temperatuur, "p", gen)
+    assert gen.calls == 4 and cache.metrics()["sites"]["intro"]["bypass"] == 4
+
+    def kapot():
+        raise RuntimeError("Ollama weg")
+
+    try:
+        cache.get_or_generate("intro", "m", 0.2, "p", kapot)
+    except RuntimeError:
+        pass
+    cache.get_or_generate("intro", "m", 0.2, "p", Teller(""))  # lege tekst: niet bewaren
+    assert cache.metrics()["entries"] == 0
+
+
+def test_ttl_per_plek_en_lru():
+    cache = LLMCache(max_entries=2, default_ttl=3600, ttls={"feedback": 0.05}, coalesce=False)
+    cache.put("feedback", "m", 0.2, "a", "A")
+    cache.put("uitleg", "m", 0.2, "b", "B")
+    time.sleep(0.08)
+    assert cache.get("feedback", "m", 0.2, "a") is None  # verlopen
+    assert cache.get("uitleg", "m", 0.2, "b") == "B"
+
+    cache.put("uitleg", "m", 0.2, "c", "C")
+    cache.get("uitleg", "m", 0.2, "b")  # b is nu het meest recent gebruikt
+    cache.put("uitleg", "m", 0.2, "d", "D")
+    assert cache.get("uitleg", "m", 0.2, "c") is None
+    assert cache.get("uitleg", "m", 0.2, "b") == "B" and cache.metrics()["entries"] == 2
+
+
+def test_sqlite_overleeft_herstart():
+    fd, pad = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        LLMCache(sqlite_path=pad).put("nakijken", "m", 0.0, "vraag", "goed")
+        cache = LLMCache(sqlite_path=pad)
+        assert cache.metrics()["disk_entries"] == 1
+        assert cache.get("nakijken", "m", 0.0, "vraag") == "goed"
+        assert cache.get("nakijken", "m", 0.0, "vraag") == "goed"
+        site = cache.metrics()["sites"]["nakijken"]
+        assert site["disk_hits"] == 1 and site["hits"] == 1
+        cache._db.close()
+    finally:
+        os.remove(pad)
+
+
+def test_stream_pas_bewaard_als_helemaal_gelezen():
+    cache = LLMCache(coalesce=False)
+    gen = Teller()
+    stream = cache.stream("feedback", "m", 0.2, "p", gen.stukken)
+    assert next(stream) == "ant"
+    stream.close()  # client haakt af
+    assert cache.get("feedback", "m", 0.2, "p") is None
+
+    assert list(cache.stream("feedback", "m", 0.2, "p", gen.stukken)) == ["ant", "woord"]
+    assert list(cache.stream("feedback", "m", 0.2, "p", gen.stukken)) == ["antwoord"]  # treffer in één stuk
+    assert gen.calls == 2
+
+
+def test_async_dezelfde_cache():
+    async def run():
+        cache = LLMCache()
+        calls = []
+
+        async def genereer():
+            calls.append(1)
+            return "async"
+
+        async def stukken():
+            calls.append(1)
+            for stuk in ("a", "sync"):
+                yield stuk
+
+        assert await cache.aget_or_generate("uitleg", "m", 0.2, "p", genereer) == "async"
+        assert await cache.aget_or_generate("uitleg", "m", 0.2, "p", genereer) == "async"
+        assert [s async for s in cache.astream("feedback", "m", 0.2, "q", stukken)] == ["a", "sync"]
+        assert [s async for s in cache.astream("feedback", "m", 0.2, "q", stukken)] == ["async"]
+        # Sync en async delen de opslag
+        assert cache.get_or_generate("uitleg", "m", 0.2, "p", Teller()) == "async"
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
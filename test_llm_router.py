@@ -0,0 +1,171 @@
+# test_llm_router.py
+"""
+LLMRouter tegen lokale stub-Ollama's (pytest, of gewoon `python test_llm_router.py`):
+failover zonder mislukte calls, sticky sessies, de limiet per backend en `outstanding`
+terug op 0 na afgebroken of mislukte (stream-)calls.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import start_stub_ollama
+from llm_router import LLMRouter
+
+
+def start_servers(aantal: int, **kwargs):
+    servers = []
+    for i in range(aantal):
+        server, url = start_stub_ollama(antwoord=f"backend {i}", **kwargs)
+        servers.append((server, url))
+    return [s for s, _ in servers], [u for _, u in servers]
+
+
+def outstanding(router: LLMRouter):
+    return [b["outstanding"] for b in router.metrics()["backends"]]
+
+
+def test_failover_zonder_fouten():
+    servers, urls = start_servers(3, delay=0.01)
+    router = LLMRouter([(url, 2) for url in urls], health_interval=0)
+    try:
+        servers[1].uitgevallen = True
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            antwoorden = list(pool.map(lambda i: router.generate(f"vraag {i}", session_id=f"s{i % 6}"), range(60)))
+        assert all(a.strip() in ("backend 0", "backend 2") for a in antwoorden)
+
+        async def async_calls():
+            return await asyncio.gather(*(router.agenerate(f"vraag {i}", session_id=f"a{i}") for i in range(20)))
+
+        assert all(a.strip() != "backend 1" for a in asyncio.run(async_calls()))
+        m = router.metrics()
+        assert m["failovers"] >= 1
+        assert not m["backends"][1]["healthy"]
+        assert outstanding(router) == [0, 0, 0]
+    finally:
+        router.close()
+        for server in servers:
+            server.shutdown()
+
+
+def test_sticky_sessies_blijven_op_hun_backend():
+    servers, urls = start_servers(3)
+    router = LLMRouter([(url, 4) for url in urls], health_interval=0)
+    try:
+        eerste = {f"s{i}": router.generate("hallo", session_id=f"s{i}").strip() for i in range(9)}
+        assert len(set(eerste.values())) == 3  # verdeeld over alle backends
+        for _ in range(3):
+            for sessie, backend in eerste.items():
+                assert router.generate("verder", session_id=sessie).strip() == backend
+                assert "".join(router.generate_stream("stream", session_id=sessie)).strip() == backend
+        assert router.metrics()["sticky_verhuisd"] == 0
+    finally:
+        router.close()
+        for server in servers:
+            server.shutdown()
+
+
+def test_limiet_per_backend():
+    servers, urls = start_servers(2, delay=0.1)
+    router = LLMRouter([(url, 1) for url in urls], health_interval=0)
+    try:
+        hoogste = [0, 0]
+
+        async def meet():
+            while True:
+                hoogste[:] = [max(h, o) for h, o in zip(hoogste, outstanding(router))]
+                await asyncio.sleep(0.005)
+
+        async def run():
+            meter = asyncio.ensure_future(meet())
+            start = time.perf_counter()
+            await asyncio.gather(*(router.agenerate(f"vraag {i}") for i in range(6)))
+            duur = time.perf_counter() - start
+            meter.cancel()
+            return duur
+
+        duur = asyncio.run(run())
+        assert hoogste == [1, 1]
+        # 6 calls over 2 plekken van 100 ms: 3 rondes; wachtenden worden direct gewekt (geen polling)
+        assert 0.3 <= duur < 0.6
+        assert outstanding(router) == [0, 0]
+    finally:
+        router.close()
+        for server in servers:
+            server.shutdown()
+
+
+def test_outstanding_na_afbreken():
+    servers, urls = start_servers(2, token_delay=0.02)
+    router = LLMRouter([(url, 1) for url in urls], health_interval=0, wait_timeout=5)
+    try:
+        async def run():
+            # Lezer stopt na het eerste stuk
+            stream = router.agenerate_stream("lang antwoord")
+            await stream.__anext__()
+            await stream.aclose()
+            assert outstanding(router) == [0, 0]
+
+            # Taak geannuleerd midden in de stream
+            async def lees():
+                async for _ in router.agenerate_stream("lang antwoord"):
+                    pass
+
+            taken = [asyncio.ensure_future(lees()) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            assert sorted(outstanding(router)) == [1, 1]
+            # Derde call wacht op een plek en wordt geannuleerd tijdens het wachten
+            wachter = asyncio.ensure_future(router.agenerate("wacht"))
+            await asyncio.sleep(0.05)
+            for taak in [*taken, wachter]:
+                taak.cancel()
+            await asyncio.gather(*taken, wachter, return_exceptions=True)
+            assert outstanding(router) == [0, 0]
+
+            # Sync stream die niet uitgelezen wordt
+            stream = router.generate_stream("lang antwoord")
+            next(stream)
+            stream.close()
+            assert outstanding(router) == [0, 0]
+
+        asyncio.run(run())
+    finally:
+        router.close()
+        for server in servers:
+            server.shutdown()
+
+
+def test_outstanding_na_mislukte_calls():
+    servers, urls = start_servers(2)
+    router = LLMRouter([(url, 2) for url in urls], health_interval=0)
+    try:
+        for server in servers:
+            server.uitgevallen = True
+        for call in (
+            lambda: router.generate("vraag"),
+            lambda: "".join(router.generate_stream("vraag")),
+            lambda: asyncio.run(router.agenerate("vraag")),
+            lambda: asyncio.run(_lees_async(router)),
+        ):
+            try:
+                call()
+            except Exception:
+                pass
+            else:
+                raise AssertionError("call had moeten mislukken")
+            assert outstanding(router) == [0, 0]
+    finally:
+        router.close()
+        for server in servers:
+            server.shutdown()
+
+
+async def _lees_async(router: LLMRouter) -> str:
+    return "".join([piece async for piece in router.agenerate_stream("vraag")])
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
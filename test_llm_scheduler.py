@@ -0,0 +1,172 @@
+# test_llm_scheduler.py
+"""
+LLMScheduler (pytest, of gewoon `python test_llm_scheduler.py`): volgorde op prioriteit en per
+leerling om de beurt, prefetch houdt plek over, `Bezet` bij een volle wachtrij, `Verlopen` na de
+deadline, intrekken bij annuleren, en een stream die pas bij het eerste stuk een plek neemt.
+"""
+
+import asyncio
+import time
+
+from llm_scheduler import (
+    INTERACTIEF,
+    NAKIJKEN,
+    PREFETCH,
+    Bezet,
+    LLMScheduler,
+    Verlopen,
+    als,
+    huidige_leerling,
+    klasse_voor,
+)
+
+
+async def tot_wachtend(scheduler: LLMScheduler, n: int):
+    while scheduler.metrics()["wachtend"] < n:
+        await asyncio.sleep(0)
+
+
+def test_prioriteit_en_om_de_beurt():
+    async def run():
+        scheduler = LLMScheduler(max_gelijktijdig=1)
+        bezet = scheduler.verkrijg(INTERACTIEF)
+        volgorde = []
+
+        async def werk(naam, klasse, leerling):
+            job = await scheduler.averkrijg(klasse, leerling)
+            volgorde.append(naam)
+            await asyncio.sleep(0)
+            scheduler.vrijgeven(job)
+
+        taken = []
+        for naam, klasse, leerling in (("p1", PREFETCH, None), ("n1", NAKIJKEN, "anna"),
+                                       ("a1", INTERACTIEF, "anna"), ("a2", INTERACTIEF, "anna"),
+                                       ("b1", INTERACTIEF, "bram")):
+            taken.append(asyncio.create_task(werk(naam, klasse, leerling)))
+            await tot_wachtend(scheduler, len(taken))
+        scheduler.vrijgeven(bezet)
+        await asyncio.gather(*taken)
+        assert volgorde == ["a1", "b1", "a2", "n1", "p1"]
+        m = scheduler.metrics()
+        assert m["actief"] == 0 and m["klassen"][INTERACTIEF]["gestart"] == 4
+
+    asyncio.run(run())
+
+
+def test_prefetch_houdt_plek_over():
+    scheduler = LLMScheduler(max_gelijktijdig=2)
+    p1 = scheduler.verkrijg(PREFETCH)
+    try:
+        scheduler.verkrijg(PREFETCH, deadline=0.02)
+    except Verlopen:
+        pass
+    else:
+        raise AssertionError("tweede prefetch hoort te wachten")
+    with scheduler.slot(INTERACTIEF) as job:  # de chat krijgt direct de vrije plek
+        assert job.status == "gestart" and scheduler.metrics()["actief"] == 2
+    scheduler.vrijgeven(p1)
+
+
+def verwacht_bezet(scheduler: LLMScheduler, leerling, reden: str):
+    try:
+        scheduler.toelaten(INTERACTIEF, leerling)
+    except Bezet as e:
+        assert reden in str(e) and e.klasse == INTERACTIEF and e.retry_after >= 1
+        assert not isinstance(e, Verlopen)
+    else:
+        raise AssertionError("Bezet verwacht")
+
+
+def test_bezet_bij_volle_wachtrij():
+    async def run():
+        scheduler = LLMScheduler(max_gelijktijdig=1, max_wachtrij={INTERACTIEF: 2}, max_per_leerling=1)
+        bezet = scheduler.verkrijg(INTERACTIEF)
+        anna = asyncio.create_task(scheduler.averkrijg(INTERACTIEF, "anna"))
+        await tot_wachtend(scheduler, 1)
+        verwacht_bezet(scheduler, "anna", "verzoeken")
+        try:
+            await scheduler.averkrijg(INTERACTIEF, "anna")
+        except Bezet:
+            pass
+        else:
+            raise AssertionError("Bezet verwacht")
+
+        # Werk zonder leerling valt alleen onder de limiet per klasse
+        scheduler.toelaten(INTERACTIEF)
+        anoniem = asyncio.create_task(scheduler.averkrijg(INTERACTIEF))
+        await tot_wachtend(scheduler, 2)
+        verwacht_bezet(scheduler, "cem", "wachtrij")
+
+        assert scheduler.metrics()["klassen"][INTERACTIEF]["geweigerd"] == 3
+        scheduler.vrijgeven(bezet)
+        scheduler.vrijgeven(await anna)
+        scheduler.vrijgeven(await anoniem)
+        assert scheduler.metrics()["actief"] == 0
+
+    asyncio.run(run())
+
+
+def test_verlopen_na_deadline():
+    scheduler = LLMScheduler(max_gelijktijdig=1)
+    bezet = scheduler.verkrijg(NAKIJKEN)
+    start = time.monotonic()
+    try:
+        scheduler.verkrijg(INTERACTIEF, "anna", deadline=0.05)
+    except Bezet as e:  # Verlopen is een Bezet, dus main.py geeft er ook een 429 voor
+        assert isinstance(e, Verlopen) and e.klasse == INTERACTIEF
+    else:
+        raise AssertionError("Verlopen verwacht")
+    assert time.monotonic() - start >= 0.05
+    scheduler.vrijgeven(bezet)
+    m = scheduler.metrics()
+    assert m["wachtend"] == 0 and m["actief"] == 0
+    assert m["klassen"][INTERACTIEF]["verlopen"] == 1 and m["klassen"][INTERACTIEF]["gestart"] == 0
+
+
+def test_annuleren_en_vrijgeven():
+    async def run():
+        scheduler = LLMScheduler(max_gelijktijdig=1)
+        async with scheduler.aslot(INTERACTIEF, "anna") as job:
+            wachter = asyncio.create_task(scheduler.averkrijg(INTERACTIEF, "bram"))
+            await tot_wachtend(scheduler, 1)
+            wachter.cancel()
+            try:
+                await wachter
+            except asyncio.CancelledError:
+                pass
+            assert scheduler.metrics()["wachtend"] == 0
+        scheduler.vrijgeven(job)  # nogmaals vrijgeven doet niets
+        m = scheduler.metrics()
+        assert m["actief"] == 0 and m["klassen"][INTERACTIEF]["ingetrokken"] == 1
+
+    asyncio.run(run())
+
+
+def test_stream_neemt_plek_bij_eerste_stuk():
+    scheduler = LLMScheduler(max_gelijktijdig=1)
+    stream = scheduler.stream(lambda: iter(["a", "b"]))
+    assert scheduler.metrics()["actief"] == 0
+    assert next(stream) == "a" and scheduler.metrics()["actief"] == 1
+    stream.close()  # client haakt af
+    assert scheduler.metrics()["actief"] == 0
+
+
+def test_klasse_voor_en_als():
+    assert klasse_voor("nakijken") == NAKIJKEN and klasse_voor("uitleg") == INTERACTIEF
+    with als(PREFETCH, leerling="anna"):
+        assert klasse_voor("uitleg") == PREFETCH and huidige_leerling() == "anna"
+        assert huidige_leerling("bram") == "bram"
+    assert klasse_voor("uitleg") == INTERACTIEF and huidige_leerling() is None
+    try:
+        LLMScheduler().verkrijg("snel")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError verwacht")
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
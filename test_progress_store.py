@@ -0,0 +1,128 @@
+# test_progress_store.py
+"""
+ProgressStore (pytest, of gewoon `python test_progress_store.py`): de tellers kloppen met het
+log van pogingen, zwakke punten, de cursor over de ruwe pogingen, een bestand dat een herstart
+overleeft, en de export per leerling (CSV en, als pyarrow er is, Parquet).
+"""
+
+import csv
+import os
+import random
+import tempfile
+from collections import Counter
+
+from progress_store import ProgressStore, pyarrow
+
+ONDERWERPEN = ["present_simple", "past_simple", "modals", "articles"]
+
+
+def vul(store: ProgressStore, n: int = 300, seed: int = 20):
+    rng = random.Random(seed)
+    for i in range(n):
+        store.registreer(
+            rng.choice(["anna", "bram", "cem"]), "gapfill", rng.choice(ONDERWERPEN),
+            rng.random() < 0.6, f"antwoord {i}", bron_id=f"ex{i}", tijd=1000.0 + i,
+        )
+
+
+def tijdelijk(suffix: str) -> str:
+    fd, pad = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return pad
+
+
+def test_tellers_kloppen_met_het_log():
+    store = ProgressStore()
+    vul(store)
+    pogingen = store.pogingen(limit=10_000)
+    assert len(pogingen) == 300 and store.metrics()["leerlingen"] == 3
+    for leerling in ("anna", "bram", "cem"):
+        eigen = [p for p in pogingen if p["leerling"] == leerling]
+        correct = sum(p["correct"] for p in eigen)
+        stats = store.statistieken(leerling)
+        assert stats["totaal"] == len(eigen) and stats["correct"] == correct
+        assert stats["percentage"] == round(correct / len(eigen) * 100, 1)
+        fouten = Counter(p["onderwerp"] for p in eigen if not p["correct"])
+        assert store.fouten_per_onderwerp(leerling) == dict(fouten)
+    assert store.statistieken("onbekend") == {"totaal": 0, "correct": 0, "percentage": 0.0}
+
+
+def test_zwakke_punten():
+    store = ProgressStore()
+    for onderwerp, fouten in (("articles", 1), ("modals", 3), ("past_simple", 1), ("present_simple", 0)):
+        for _ in range(fouten):
+            store.registreer("anna", "gapfill", onderwerp, False, "x")
+        store.registreer("anna", "gapfill", onderwerp, True, "y")
+    # Meeste fouten eerst, bij gelijke stand het eerst geoefende; goed beantwoord telt niet
+    assert store.zwakke_punten("anna") == ["modals", "articles", "past_simple"]
+    assert store.zwakke_punten("anna", k=1) == ["modals"]
+
+
+def test_cursor_over_pogingen():
+    store = ProgressStore()
+    vul(store)
+    gezien, cursor = [], 0
+    while True:
+        blok = store.pogingen("bram", na_id=cursor, limit=7)
+        if not blok:
+            break
+        gezien += blok
+        cursor = blok[-1]["id"]
+    assert [p["id"] for p in gezien] == [p["id"] for p in store.pogingen(limit=10_000) if p["leerling"] == "bram"]
+    assert gezien[0]["bron_id"] and isinstance(gezien[0]["correct"], bool)
+
+
+def test_bestand_overleeft_herstart():
+    pad = tijdelijk(".db")
+    try:
+        vul(ProgressStore(pad), n=50)
+        store = ProgressStore(pad)
+        assert store.metrics()["pogingen"] == 50
+        store.registreer("anna", "mcq", "modals", True, "can")
+        assert store.pogingen(na_id=50)[0]["antwoord"] == "can"
+    finally:
+        for extra in ("", "-wal", "-shm"):
+            if os.path.exists(pad + extra):
+                os.remove(pad + extra)
+
+
+def test_export_csv_en_parquet():
+    store = ProgressStore()
+    vul(store)
+    rijen = list(store.exporteer())
+    assert [r["leerling"] for r in rijen] == ["anna", "bram", "cem"]
+    for rij in rijen:
+        assert rij["zwakke_punten"] == store.zwakke_punten(rij["leerling"])
+        assert rij["eerste"] <= rij["laatste"]
+    assert [r["leerling"] for r in store.exporteer(["cem"])] == ["cem"]
+
+    pad = tijdelijk(".csv")
+    try:
+        assert store.schrijf_csv(pad) == 3
+        with open(pad, newline="", encoding="utf-8") as f:
+            gelezen = list(csv.DictReader(f))
+        assert gelezen[0]["leerling"] == "anna" and int(gelezen[0]["totaal"]) == rijen[0]["totaal"]
+        assert gelezen[0]["zwakke_punten"] == "; ".join(rijen[0]["zwakke_punten"])
+    finally:
+        os.remove(pad)
+
+    if pyarrow is None:
+        try:
+            store.schrijf_parquet("niet.parquet")
+        except ImportError:
+            return
+        raise AssertionError("ImportError verwacht zonder pyarrow")
+    pad = tijdelijk(".parquet")
+    try:
+        assert store.schrijf_parquet(pad) == 3
+        tabel = pyarrow.parquet.read_table(pad)
+        assert tabel.column("leerling").to_pylist() == ["anna", "bram", "cem"]
+    finally:
+        os.remove(pad)
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,57 @@
+# test_rule_grader.py
+"""Regressietests voor de lokale nakijker (pytest, of gewoon `python test_rule_grader.py`)."""
+
+from rule_grader import BIJNA, CORRECT, INCORRECT, RuleGrader
+
+
+def test_optie_die_zelf_een_letter_is():
+    grader = RuleGrader()
+    assert grader.beoordeel("a", "a", ["an", "a", "the"]) == CORRECT
+    assert grader.beoordeel("an", "a", ["an", "a", "the"]) == INCORRECT
+
+
+def test_optie_die_zelf_een_cijfer_is():
+    grader = RuleGrader()
+    assert grader.beoordeel("1", "1", ["3", "1", "2"]) == CORRECT
+    assert grader.beoordeel("3", "1", ["3", "1", "2"]) == INCORRECT
+
+
+def test_letter_of_nummer_als_positie():
+    grader = RuleGrader()
+    assert grader.beoordeel("b", "went", ["go", "went", "gone"]) == CORRECT
+    assert grader.beoordeel("3)", "went", ["go", "went", "gone"]) == INCORRECT
+
+
+def test_dubbelzinnige_positie_gaat_naar_llm():
+    grader = RuleGrader()
+    # "c" is geen optie, maar de opties zijn zelf letters: positie 3 of een tikfout?
+    assert grader.kies_optie("c", ["a", "an", "the"]) is None
+    assert grader.kies_optie("4", ["1", "2", "3", "5"]) is None
+
+
+
+def test_grammaticale_fout_gaat_naar_llm():
+    grader = RuleGrader()
+    # Eén letter verschil, maar precies de tijd of het deelwoord dat getoetst wordt
+    assert grader.beoordeel("had studied", "has studied") is None
+    assert grader.beoordeel("will be build", "will be built") is None
+    assert grader.beoordeel("She studied", "She studies") is None
+    assert grader.beoordeel("they were taken", "they were taken") == CORRECT
+    assert grader.beoordeel("is written", "was written") is None
+    assert grader.beoordeel("has forgotten", "has forgotte") is None
+
+
+def test_tikfout_in_lang_woord_is_bijna():
+    grader = RuleGrader()
+    assert grader.beoordeel("I have receved", "I have received") == BIJNA
+    assert grader.beoordeel("beautifull", "beautiful") == BIJNA
+    assert grader.beoordeel("goes", "go") is None  # kort woord: kan grammatica zijn
+    # Twee woorden met een tikfout is geen "één tikfout" meer
+    assert grader.beoordeel("receved beautifull", "received beautiful") is None
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,107 @@
+# test_session_store.py
+"""
+SessionStore (pytest, of gewoon `python test_session_store.py`): LRU- en TTL-eviction,
+de byte-cap op de geschiedenis, wegschrijven naar SQLite en terugladen, en een sessie
+die gewijzigd wordt terwijl hij is weggeschreven.
+"""
+
+import os
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from session_store import SessionStore
+
+
+def sessie(*berichten):
+    return {
+        "history": [SystemMessage(content="systeem"), *(HumanMessage(content=b) for b in berichten)],
+        "turns": [],
+        "seq": 0,
+    }
+
+
+def teksten(session):
+    return [m.content for m in session["history"][1:]]
+
+
+def tijdelijke_db():
+    fd, pad = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    return pad
+
+
+def test_lru_zonder_spill():
+    store = SessionStore(max_sessions=2, ttl_seconds=0)
+    store["a"], store["b"] = sessie("a"), sessie("b")
+    assert "a" in store  # a is nu het meest recent gebruikt
+    store["c"] = sessie("c")
+    assert "b" not in store and "a" in store and "c" in store
+    assert store.metrics()["evictions_lru"] == 1
+
+
+def test_ttl():
+    store = SessionStore(ttl_seconds=0.05)
+    store["a"] = sessie("a")
+    time.sleep(0.08)
+    assert store.get("a") is None
+    assert store.metrics()["evictions_ttl"] == 1
+
+
+def test_byte_cap_houdt_systeembericht():
+    store = SessionStore(max_history_bytes=100)
+    store["a"] = sessie(*(f"bericht {i} " + "x" * 20 for i in range(10)))
+    session = store["a"]
+    assert session["history"][0].content == "systeem"
+    assert sum(len(t) for t in teksten(session)) <= 100
+    assert teksten(session)[-1].startswith("bericht 9")
+    assert session["history_dropped"] == 10 - len(teksten(session))
+
+
+def test_spill_en_terugladen():
+    pad = tijdelijke_db()
+    try:
+        store = SessionStore(max_sessions=1, ttl_seconds=0, spill_path=pad)
+        store["a"] = sessie("hallo")
+        store["b"] = sessie("b")  # a gaat naar SQLite
+        m = store.metrics()
+        assert m["live_sessions"] == 1 and m["spilled_sessions"] == 1
+        assert teksten(store["a"]) == ["hallo"]
+        assert store.metrics()["restored"] == 1
+    finally:
+        os.remove(pad)
+
+
+def test_wijziging_tijdens_spill_blijft_bewaard():
+    pad = tijdelijke_db()
+    try:
+        store = SessionStore(max_sessions=1, ttl_seconds=0, max_history_bytes=60, spill_path=pad)
+        store["a"] = sessie("eerste")
+        session = store["a"]  # een handler houdt de sessie vast ...
+        store["b"] = sessie("b")  # ... terwijl een andere sessie hem naar SQLite duwt
+        assert store.metrics()["spilled_sessions"] == 1
+
+        # De handler wijzigt de (nu weggeschreven) sessie en schrijft hem terug
+        for i in range(5):
+            session["history"].append(HumanMessage(content=f"nieuw {i} " + "y" * 10))
+        store["a"] = session
+
+        m = store.metrics()
+        assert m["written_back"] == 1 and m["spilled_sessions"] == 1  # alleen b staat nu op schijf
+        terug = store["a"]
+        assert teksten(terug)[-1].startswith("nieuw 4")
+        assert sum(len(t) for t in teksten(terug)) <= 60  # byte-cap ook bij het terugschrijven
+
+        # Nogmaals eruit en terug: de teruggeschreven versie, niet de oude rij
+        store["b"] = store["b"]
+        assert teksten(store["a"])[-1].startswith("nieuw 4")
+    finally:
+        os.remove(pad)
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
@@ -0,0 +1,114 @@
+# test_single_flight.py
+"""
+Single-flight (pytest, of gewoon `python test_single_flight.py`): gelijktijdige identieke calls
+delen één uitvoering en dezelfde fout, de sleutel is daarna weer vrij, en LLMCache voegt
+identieke prompts samen, ook bij streams en als de cache zelf uit staat.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_cache import LLMCache
+from single_flight import SingleFlight
+
+
+class TraagLLM:
+    def __init__(self, delay: float = 0.1, fout: bool = False):
+        self.delay = delay
+        self.fout = fout
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> str:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fout:
+            raise RuntimeError("Ollama weg")
+        return "gedeeld"
+
+    def stukken(self):
+        with self._lock:
+            self.calls += 1
+        for stuk in ("ge", "deeld"):
+            time.sleep(self.delay / 2)
+            yield stuk
+
+
+def tegelijk(n, functie):
+    def veilig():
+        try:
+            return functie()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return [f.result() for f in [pool.submit(veilig) for _ in range(n)]]
+
+
+def test_een_uitvoering_voor_gelijktijdige_calls():
+    flights = SingleFlight()
+    llm = TraagLLM()
+    resultaten = tegelijk(8, lambda: flights.do("k", llm))
+    assert llm.calls == 1
+    assert all(r[0] == "gedeeld" for r in resultaten)
+    assert sum(r[1] for r in resultaten) == 7  # alleen de leider deelde niet
+    assert flights.bezig() == 0
+
+    flights.do("k", llm)  # daarna weer vrij: een nieuwe uitvoering
+    assert llm.calls == 2
+
+
+def test_fout_wordt_gedeeld():
+    flights = SingleFlight()
+    llm = TraagLLM(fout=True)
+    resultaten = tegelijk(5, lambda: flights.do("k", llm))
+    assert llm.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in resultaten)
+    assert flights.bezig() == 0
+
+
+def test_cache_voegt_identieke_prompts_samen():
+    for max_entries in (1000, 0):  # ook met de cache uit
+        cache = LLMCache(max_entries=max_entries)
+        llm = TraagLLM()
+        resultaten = tegelijk(6, lambda: cache.get_or_generate("nakijken", "m", 0.0, "vraag", llm))
+        assert resultaten == ["gedeeld"] * 6 and llm.calls == 1
+        assert cache.metrics()["coalesced"] == 5 and cache.metrics()["in_flight"] == 0
+
+    # Boven de temperatuurgrens of met coalescing uit: geen samenvoegen
+    for cache, temperatuur in ((LLMCache(), 0.9), (LLMCache(coalesce=False), 0.0)):
+        llm = TraagLLM(delay=0.05)
+        tegelijk(3, lambda: cache.get_or_generate("intro", "m", temperatuur, "p", llm))
+        assert llm.calls == 3
+
+
+def test_stream_volgers_krijgen_de_hele_tekst():
+    cache = LLMCache(max_entries=0)
+    llm = TraagLLM()
+    resultaten = tegelijk(4, lambda: list(cache.stream("feedback", "m", 0.2, "p", llm.stukken)))
+    assert llm.calls == 1
+    assert sorted(resultaten) == [["ge", "deeld"]] + [["gedeeld"]] * 3
+
+
+def test_afgebroken_leider_volger_genereert_zelf():
+    cache = LLMCache(max_entries=0)
+    llm = TraagLLM()
+    leider = cache.stream("feedback", "m", 0.2, "p", llm.stukken)
+    assert next(leider) == "ge"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        volger = pool.submit(lambda: list(cache.stream("feedback", "m", 0.2, "p", llm.stukken)))
+        while not any(f.volgers for f in cache.flights._flights.values()):
+            time.sleep(0.001)  # wacht tot de volger op de leider wacht
+        leider.close()  # de client van de leider haakt af
+        assert volger.result() == ["ge", "deeld"]
+    assert llm.calls == 2 and cache.metrics()["coalesced"] == 0
+
+
+if __name__ == "__main__":
+    for naam, test in list(globals().items()):
+        if naam.startswith("test_"):
+            test()
+            print(f"ok  {naam}")
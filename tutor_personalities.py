@@ -1,13 +1,16 @@
 # tutor_personalities.py
 
-import requests
 from dataclasses import dataclass
+from typing import Optional
+
+from llm_cache import get_cache
+from llm_scheduler import get_scheduler, klasse_voor
+from ollama_client import OLLAMA_URL, get_client
 
 # ================================================================
 #  Configuratie
 # ================================================================
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "mistral:7b"
 
 # ================================================================
@@ -124,29 +127,55 @@ class TutorPersonaliteiten:
 
 
 # ================================================================
-#  LLM Interface (Requests ipv Subprocess)
+#  LLM Interface (gedeelde Ollama-client ipv Subprocess)
 # ================================================================
 
-def call_ollama(prompt: str, model: str = OLLAMA_MODEL) -> str:
+FALLBACK_ANTWOORD = "Sorry, ik kon even geen verbinding maken met mijn taalmodel. Controleer of Ollama draait."
+
+
+def _generate(prompt: str, model: str, options, site: str, session_id: Optional[str]) -> str:
+    # Een plek bij het model via de planner: chat van deze leerling gaat voor nakijken en prefetch
+    with get_scheduler().slot(klasse_voor(site), leerling=session_id):
+        return get_client().generate(prompt, model=model, options=options, session_id=session_id)
+
+
+def call_ollama(prompt: str, model: str = OLLAMA_MODEL, temperature: Optional[float] = None, site: str = "chat",
+                session_id: Optional[str] = None) -> str:
     """
-    HTTP-call naar Ollama.
+    HTTP-call naar Ollama via de gedeelde client (connection pool + keep-alive).
     Dit vervangt de subprocess-methode voor betere stabiliteit in de server.
+    Zonder temperatuur geldt Ollama's standaard en slaat de LLM-cache de call over.
+    Met `session_id` gaan alle calls van een gesprek naar dezelfde Ollama-server (zie llm_router.py).
     """
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-    }
+    options = {"temperature": temperature} if temperature is not None else None
     try:
-        # Timeout iets hoger zetten voor trage modellen
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("response", "")
+        return get_cache().get_or_generate(
+            site, model, temperature, prompt,
+            lambda: _generate(prompt, model, options, site, session_id),
+        )
     except Exception as e:
         print(f"❌ Fout bij Ollama call: {e}")
         # Return een veilige fallback string zodat de server niet crasht
-        return "Sorry, ik kon even geen verbinding maken met mijn taalmodel. Controleer of Ollama draait."
+        return FALLBACK_ANTWOORD
+
+
+async def acall_ollama(prompt: str, model: str = OLLAMA_MODEL, temperature: Optional[float] = None, site: str = "chat",
+                       session_id: Optional[str] = None) -> str:
+    """
+    Async variant van call_ollama (zelfde cache, planner en sticky routing).
+    Annuleren breekt de generatie af: de verbinding met Ollama gaat dicht.
+    """
+    options = {"temperature": temperature} if temperature is not None else None
+
+    async def generate() -> str:
+        async with get_scheduler().aslot(klasse_voor(site), leerling=session_id):
+            return await get_client().agenerate(prompt, model=model, options=options, session_id=session_id)
+
+    try:
+        return await get_cache().aget_or_generate(site, model, temperature, prompt, generate)
+    except Exception as e:
+        print(f"❌ Fout bij Ollama call: {e}")
+        return FALLBACK_ANTWOORD
 
 
 # ================================================================